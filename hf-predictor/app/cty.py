@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# app/cty.py
+"""
+Prefijos desde cty.dat (AD1C, country-files.com).
+
+Sustituye a wpxloc2geo.pl → callsign_prefixes.json conservando lo que el
+JSON perdía: indicativos exactos (=CALL), zonas CQ/ITU, continente y entidad
+DXCC, con las excepciones por alias ((cq) [itu] <lat/lon> {cont}).
+
+  cty.dat  →  prefixes.npz   (arrays NumPy, sin pickle; carga en milisegundos)
+
+PrefixSource elige la fuente: cty.dat (recompilando el artefacto si cty.dat
+es más nuevo), el artefacto ya compilado o, si no hay ninguno, el JSON de
+siempre. Vigila los ficheros y sustituye el índice en caliente (o bajo
+demanda con POST /admin/prefixes/reload): la API no se reinicia y conserva
+sus caches.
+
+Compilación offline:
+    python cty.py cty.dat /data/prefixes.npz
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from prefix_index import PrefixIndex
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_VERSION = "cty-v1"
+CONTINENTS = ("AF", "AN", "AS", "EU", "NA", "OC", "SA")
+
+_ALIAS_RE = re.compile(r"^(=?)([^(\[<{~]+)(.*)$")
+_CQ_RE = re.compile(r"\((\d+)\)")
+_ITU_RE = re.compile(r"\[(\d+)\]")
+_LATLON_RE = re.compile(r"<([-+\d.]+)/([-+\d.]+)>")
+_CONT_RE = re.compile(r"\{(\w+)\}")
+
+# ------------------ cty.dat ------------------
+
+
+def parse_cty(text: str):
+    """
+    cty.dat → (prefijos, exactos), ambos {clave: (lat, lon, cq, itu, continente, entidad)}.
+    Longitud en grados Este (cty.dat la da positiva hacia el Oeste).
+    """
+    prefixes, exact = {}, {}
+    for record in text.split(";"):
+        if not record.strip():
+            continue
+        fields = [f.strip() for f in record.split(":", 8)]
+        if len(fields) < 9:
+            raise ValueError(f"bad cty.dat record: {record.strip()[:60]!r}")
+        name, cq, itu, cont, lat, lon, _tz, _primary, aliases = fields
+        base = (float(lat), -float(lon), int(cq), int(itu), cont.upper(), name)
+
+        for alias in aliases.split(","):
+            m = _ALIAS_RE.match(alias.strip())
+            if not m:
+                continue
+            is_exact, key, extra = m.group(1), m.group(2).strip().upper(), m.group(3)
+            lat, lon, cq, itu, cont, _ = base
+            if extra:
+                if (o := _CQ_RE.search(extra)):
+                    cq = int(o.group(1))
+                if (o := _ITU_RE.search(extra)):
+                    itu = int(o.group(1))
+                if (o := _LATLON_RE.search(extra)):
+                    lat, lon = float(o.group(1)), -float(o.group(2))
+                if (o := _CONT_RE.search(extra)):
+                    cont = o.group(1).upper()
+            # Ante duplicados gana la primera aparición (como el índice)
+            (exact if is_exact else prefixes).setdefault(key, (lat, lon, cq, itu, cont, name))
+    return prefixes, exact
+
+
+# ------------------ Artefacto compilado ------------------
+
+def save_artifact(path: str, prefixes: dict, exact: dict, source: str = ""):
+    """Escribe el .npz de forma atómica (tmp + rename)."""
+    keys = list(prefixes) + list(exact)
+    entries = list(prefixes.values()) + list(exact.values())
+    entities = sorted({e[5] for e in entries})
+    ent_idx = {name: i for i, name in enumerate(entities)}
+    cont_idx = {c: i for i, c in enumerate(CONTINENTS)}
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            version=np.array(ARTIFACT_VERSION),
+            source=np.array(source),
+            built_utc=np.array(datetime.utcnow().isoformat()),
+            keys=np.array(keys, dtype=str),
+            exact=np.array([False] * len(prefixes) + [True] * len(exact), dtype=bool),
+            lat=np.array([e[0] for e in entries], dtype=np.float64),
+            lon=np.array([e[1] for e in entries], dtype=np.float64),
+            cq=np.array([e[2] for e in entries], dtype=np.uint8),
+            itu=np.array([e[3] for e in entries], dtype=np.uint8),
+            cont=np.array([cont_idx[e[4]] for e in entries], dtype=np.uint8),
+            entity=np.array([ent_idx[e[5]] for e in entries], dtype=np.uint16),
+            entities=np.array(entities, dtype=str),
+        )
+    os.replace(tmp, path)
+
+
+def load_artifact(path: str):
+    """.npz → (prefijos, exactos) con el mismo formato que parse_cty."""
+    with np.load(path, allow_pickle=False) as z:
+        if str(z["version"]) != ARTIFACT_VERSION:
+            raise ValueError(f"{path}: artifact {z['version']} != {ARTIFACT_VERSION}")
+        entities = z["entities"].tolist()
+        rows = zip(z["lat"].tolist(), z["lon"].tolist(), z["cq"].tolist(), z["itu"].tolist(),
+                   [CONTINENTS[c] for c in z["cont"].tolist()], [entities[i] for i in z["entity"].tolist()])
+        keys, is_exact = z["keys"].tolist(), z["exact"].tolist()
+    prefixes, exact = {}, {}
+    for key, ex, entry in zip(keys, is_exact, rows):
+        (exact if ex else prefixes)[key] = entry
+    return prefixes, exact
+
+
+def read_cty(cty_path: str):
+    with open(cty_path, "r", encoding="latin-1") as f:
+        prefixes, exact = parse_cty(f.read())
+    if not prefixes:
+        raise ValueError(f"{cty_path}: no prefixes")
+    return prefixes, exact
+
+
+def compile_cty(cty_path: str, artifact_path: str):
+    """Parsea cty.dat y publica el artefacto. Devuelve (prefijos, exactos)."""
+    prefixes, exact = read_cty(cty_path)
+    save_artifact(artifact_path, prefixes, exact, source=os.path.basename(cty_path))
+    return prefixes, exact
+
+
+# ------------------ Fuente del índice con recarga en caliente ------------------
+
+def _mtime(path: str):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+class PrefixSource:
+    def __init__(self, cfg: dict):
+        here = os.path.dirname(os.path.abspath(__file__))
+        self.cty_file = cfg.get("cty_file", "/data/cty.dat")
+        self.artifact = cfg.get("artifact", "/data/prefixes.npz")
+        self.json_file = os.getenv("PREFIXES_FILE") or os.path.join(
+            here, cfg.get("json_file", "callsign_prefixes.json"))
+        self.check_interval_s = float(cfg.get("check_interval_s", 60))
+        self._reload_lock = threading.Lock()
+        self.load_ms = None
+        self.loaded_utc = None
+        self.errors = 0
+
+        prefixes, exact, source = self._load()
+        self._fingerprint = self._files()
+        self.index = PrefixIndex(prefixes, front_cache_size=int(cfg.get("front_cache_size", 4096)),
+                                 exact=exact, source=source)
+
+    def _files(self):
+        return _mtime(self.cty_file), _mtime(self.artifact), _mtime(self.json_file)
+
+    def _load_cty(self):
+        cty_mtime, art_mtime = _mtime(self.cty_file), _mtime(self.artifact)
+        if art_mtime is not None and (cty_mtime is None or art_mtime >= cty_mtime):
+            try:
+                return (*load_artifact(self.artifact), self.artifact)
+            except Exception:
+                self.errors += 1
+                logger.exception("prefixes: error loading %s", self.artifact)
+        if cty_mtime is None:
+            return None
+        try:
+            prefixes, exact = read_cty(self.cty_file)
+        except Exception:
+            self.errors += 1
+            logger.exception("prefixes: error parsing %s", self.cty_file)
+            return None
+        try:
+            save_artifact(self.artifact, prefixes, exact, source=os.path.basename(self.cty_file))
+            logger.info("prefixes: compiled %s → %s", self.cty_file, self.artifact)
+        except Exception as e:
+            # Sin artefacto se sigue con lo parseado; el próximo arranque volverá a parsear
+            self.errors += 1
+            logger.warning(f"⚠️ prefixes: cannot write {self.artifact}: {e}")
+        return prefixes, exact, self.cty_file
+
+    def _load(self):
+        """(prefijos, exactos, fuente): cty.dat/artefacto y, si no hay, el JSON."""
+        t0 = time.perf_counter()
+        loaded = self._load_cty()
+        if loaded is None:
+            try:
+                with open(self.json_file, "r") as f:
+                    loaded = (json.load(f), {}, self.json_file)
+            except Exception:
+                self.errors += 1
+                logger.exception("Error decoding JSON prefixes")
+                loaded = ({}, {}, "")
+        self.load_ms = round((time.perf_counter() - t0) * 1000.0, 1)
+        self.loaded_utc = datetime.utcnow().isoformat()
+        logger.info("Loaded %d prefixes, %d exact calls from %s (%.1f ms)",
+                    len(loaded[0]), len(loaded[1]), loaded[2] or "-", self.load_ms)
+        return loaded
+
+    def reload(self, force: bool = False) -> dict:
+        """Sustituye el índice si los ficheros han cambiado (o siempre con force)."""
+        with self._reload_lock:
+            if force or self._files() != self._fingerprint:
+                prefixes, exact, source = self._load()
+                # El artefacto puede haberse regenerado: la huella se toma después
+                self._fingerprint = self._files()
+                if prefixes:
+                    self.index.replace(prefixes, exact, source)
+                else:
+                    logger.warning("⚠️ prefixes: reload without data, keeping %s", self.index.source)
+        return self.stats()
+
+    def start(self):
+        """Hilo que recarga los prefijos al cambiar cty.dat, el artefacto o el JSON."""
+        if self.check_interval_s <= 0:
+            return
+        threading.Thread(target=self.run_forever, name="prefix-reloader", daemon=True).start()
+        logger.info("🧵 Hilo de recarga de prefijos arrancado.")
+
+    def run_forever(self):
+        while True:
+            time.sleep(self.check_interval_s)
+            try:
+                self.reload()
+            except Exception:
+                self.errors += 1
+                logger.exception("prefixes: reload failed")
+
+    def stats(self) -> dict:
+        return {**self.index.stats(), "load_ms": self.load_ms, "loaded_utc": self.loaded_utc,
+                "errors": self.errors}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit(f"uso: {sys.argv[0]} cty.dat prefixes.npz")
+    p, e = compile_cty(sys.argv[1], sys.argv[2])
+    print(f"{len(p)} prefijos, {len(e)} indicativos exactos → {sys.argv[2]}")
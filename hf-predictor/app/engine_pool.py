@@ -0,0 +1,314 @@
+# app/engine_pool.py
+"""
+Pool acotado para ejecuciones de ITURHFProp.
+
+- N workers (por defecto nº de CPUs) → nunca más procesos ITURHFProp
+  simultáneos que núcleos. El límite lo aplica EngineSlots en cada
+  lanzamiento del binario y es común a los hilos del pool, a la compuerta
+  async (que lanza SP y LP en paralelo) y a cualquier otro llamante.
+- Cola acotada: si está llena, submit() falla al instante (PoolFull) para que
+  la API responda 503 + Retry-After en lugar de esperar.
+- Deadline por trabajo: si un trabajo llega a un worker con menos de
+  min_budget_s hasta su deadline se descarta sin calcular (no le daría
+  tiempo; DXSpider ya habrá abandonado). Durante el trabajo el deadline sigue
+  disponible (remaining_s) y el motor lo usa como timeout de ITURHFProp.
+- Prioridad: la cola es de prioridad (menor primero, FIFO a igualdad); el
+  precalentamiento de cache usa PRIORITY_LOW para no adelantar a peticiones.
+"""
+import asyncio
+import collections
+import contextlib
+import contextvars
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class PoolFull(Exception):
+    """La cola del pool está llena (admisión rechazada)."""
+
+
+class DeadlineExceeded(Exception):
+    """El trabajo no puede completarse antes de su deadline."""
+
+
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = 10
+
+# Deadline (time.monotonic) del trabajo en curso; lo fija el worker o la compuerta
+_job_deadline = contextvars.ContextVar("engine_job_deadline", default=None)
+
+
+def remaining_s():
+    """Segundos hasta el deadline del trabajo en curso (None si no tiene)."""
+    deadline = _job_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def _run_job(deadline, fn, args, kwargs):
+    _job_deadline.set(deadline)
+    return fn(*args, **kwargs)
+
+
+class EngineSlots:
+    """
+    Límite de procesos ITURHFProp simultáneos, compartido entre hilos y
+    event loop: cada ejecución del binario ocupa un hueco mientras dura. Los
+    que esperan se atienden en orden de llegada, sean hilos o corrutinas.
+    """
+
+    def __init__(self, size: int):
+        self.size = int(size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._waiters = collections.deque()   # threading.Event | (loop, asyncio.Future)
+        self.waits = 0
+
+    def _take_or_wait(self, waiter):
+        """Toma un hueco (True) o deja waiter en la cola (False). Con self._lock."""
+        if self._in_use < self.size and not self._waiters:
+            self._in_use += 1
+            return True
+        self._waiters.append(waiter)
+        self.waits += 1
+        return False
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._in_use -= 1
+                return
+            # El hueco pasa directamente al primero en espera (_in_use no cambia)
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, fut = waiter
+            loop.call_soon_threadsafe(self._wake, fut)
+
+    def _wake(self, fut):
+        if fut.cancelled():
+            self.release()   # la corrutina abandonó: el hueco pasa al siguiente
+        else:
+            fut.set_result(None)
+
+    @contextlib.contextmanager
+    def slot(self):
+        event = threading.Event()
+        with self._lock:
+            took = self._take_or_wait(event)
+        if not took:
+            event.wait()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextlib.asynccontextmanager
+    async def slot_async(self):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        waiter = (loop, fut)
+        with self._lock:
+            took = self._take_or_wait(waiter)
+        if not took:
+            try:
+                await fut
+            except asyncio.CancelledError:
+                with self._lock:
+                    queued = waiter in self._waiters
+                    if queued:
+                        self._waiters.remove(waiter)
+                # Ya se nos había cedido el hueco (y _wake no lo devolverá): se libera aquí
+                if not queued and fut.done() and not fut.cancelled():
+                    self.release()
+                raise
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "waiting": len(self._waiters),
+                "waits": self.waits,
+            }
+
+
+class EnginePool:
+    def __init__(self, workers: int = None, queue_size: int = None, min_budget_s: float = 0.0):
+        self.workers = int(workers or os.cpu_count() or 1)
+        self.queue_size = int(queue_size or self.workers * 4)
+        self.min_budget_s = float(min_budget_s)
+        self._queue = queue.PriorityQueue(maxsize=self.queue_size)
+        self._seq = itertools.count()
+        self._running = 0
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.failed = 0
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"engine-{i}", daemon=True).start()
+        logger.info("🧵 Engine pool: %d workers, cola %d", self.workers, self.queue_size)
+
+    def _worker(self):
+        while True:
+            _, _, (ctx, fn, args, kwargs, deadline, fut) = self._queue.get()
+            try:
+                if deadline is not None and deadline - time.monotonic() < self.min_budget_s:
+                    with self._lock:
+                        self.expired += 1
+                    fut.set_exception(DeadlineExceeded("dropped: not enough time left when dequeued"))
+                    continue
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                with self._lock:
+                    self._running += 1
+                try:
+                    fut.set_result(ctx.run(_run_job, deadline, fn, args, kwargs))
+                    with self._lock:
+                        self.completed += 1
+                except BaseException as e:
+                    with self._lock:
+                        self.failed += 1
+                    fut.set_exception(e)
+                finally:
+                    with self._lock:
+                        self._running -= 1
+            finally:
+                self._queue.task_done()
+
+    def submit(self, fn, *args, deadline: float = None, priority: int = PRIORITY_NORMAL, **kwargs) -> Future:
+        """
+        Encola fn(*args, **kwargs). deadline en time.monotonic().
+        Lanza PoolFull si la cola está llena.
+        """
+        fut = Future()
+        try:
+            # Contexto del llamante (p. ej. volcados de depuración por petición)
+            job = (contextvars.copy_context(), fn, args, kwargs, deadline, fut)
+            self._queue.put_nowait((priority, next(self._seq), job))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise PoolFull(f"engine queue full ({self.queue_size})")
+        return fut
+
+    def run(self, fn, *args, deadline: float = None, priority: int = PRIORITY_NORMAL, **kwargs):
+        """
+        submit() y espera el resultado hasta el deadline. Si vence, lanza
+        DeadlineExceeded; un trabajo aún en cola se descartará y uno en marcha
+        acaba como mucho en ese mismo deadline (timeout de ITURHFProp).
+        """
+        fut = self.submit(fn, *args, deadline=deadline, priority=priority, **kwargs)
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeout:
+            raise DeadlineExceeded("deadline passed while computing")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "queued": self._queue.qsize(),
+                "running": self._running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "expired": self.expired,
+                "failed": self.failed,
+            }
+
+
+class AsyncEngineGate:
+    """
+    Equivalente asíncrono del pool para el camino async (sin hilos): como mucho
+    `workers` trabajos a la vez y `queue_size` en espera; mismo contrato de
+    PoolFull / DeadlineExceeded. Los procesos que lance cada trabajo cuentan
+    en los mismos EngineSlots que el pool. La corrutina ya lanzada sigue aunque
+    el llamante abandone, hasta el deadline del trabajo (y puede rellenar la cache).
+    """
+
+    def __init__(self, workers: int = None, queue_size: int = None, min_budget_s: float = 0.0):
+        self.workers = int(workers or os.cpu_count() or 1)
+        self.queue_size = int(queue_size or self.workers * 4)
+        self.min_budget_s = float(min_budget_s)
+        self._sem = asyncio.Semaphore(self.workers)
+        self._waiting = 0
+        self._running = 0
+        self._tasks = set()
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.failed = 0
+
+    async def _guarded(self, coro_fn, args, kwargs, deadline):
+        async with self._sem:
+            self._waiting -= 1
+            if deadline is not None and deadline - time.monotonic() < self.min_budget_s:
+                self.expired += 1
+                raise DeadlineExceeded("dropped: not enough time left when dequeued")
+            # Contexto propio de la tarea: visible solo para este trabajo
+            _job_deadline.set(deadline)
+            self._running += 1
+            try:
+                result = await coro_fn(*args, **kwargs)
+                self.completed += 1
+                return result
+            except BaseException:
+                self.failed += 1
+                raise
+            finally:
+                self._running -= 1
+
+    def submit(self, coro_fn, *args, deadline: float = None, **kwargs) -> asyncio.Task:
+        """Encola sin esperar (PoolFull si no cabe); la tarea se descarta si arranca pasado deadline."""
+        if self._waiting >= self.queue_size:
+            self.rejected += 1
+            raise PoolFull(f"engine queue full ({self.queue_size})")
+        self._waiting += 1
+        task = asyncio.ensure_future(self._guarded(coro_fn, args, kwargs, deadline))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        # Evita "exception never retrieved" si el llamante abandona
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    async def run(self, coro_fn, *args, deadline: float = None, **kwargs):
+        task = self.submit(coro_fn, *args, deadline=deadline, **kwargs)
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("deadline passed while computing")
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "queued": self._waiting,
+            "running": self._running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "failed": self.failed,
+        }
+
+
+_cfg = CONFIG.get("engine_pool", {}) or {}
+slots = EngineSlots(_cfg.get("workers") or os.cpu_count() or 1)
+pool = EnginePool(_cfg.get("workers"), _cfg.get("queue_size"), _cfg.get("min_budget_s", 0.15))
+gate = AsyncEngineGate(_cfg.get("workers"), _cfg.get("queue_size"), _cfg.get("min_budget_s", 0.15))
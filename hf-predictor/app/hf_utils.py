@@ -1,15 +1,18 @@
 # app/hf_utils.py
-import json
+import math
 import os
 import logging
-import subprocess
-import tempfile
-from datetime import datetime, timedelta
+from datetime import datetime
 
+import numpy as np
 import redis
-import requests
 
 from config import CONFIG  # lee config.yaml
+from engine_pool import slots as engine_slots
+from iturhf_engine import DAY_HOURS, create_engine, grid_axes, radio_profile
+from metrics import ENGINE_SECONDS, timed
+from cty import PrefixSource
+from spacewx import service as spacewx
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,140 +24,78 @@ CACHE_EXPIRE = int(os.getenv("CACHE_EXPIRE", "3600"))
 
 r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
 
-# --- Prefijos indicativos de QTH por indicativo ---
-try:
-    with open("/app/callsign_prefixes.json", "r") as f:
-        callsign_prefix_map = json.load(f)
-    logger.info("Loaded %d prefixes", len(callsign_prefix_map))
-except Exception:
-    logger.exception("Error decoding JSON prefixes")
-    callsign_prefix_map = {}
+# --- Prefijos → QTH: cty.dat (artefacto compilado) o callsign_prefixes.json, recarga en caliente ---
+prefix_source = PrefixSource(CONFIG.get("prefixes", {}) or {})
+prefix_index = prefix_source.index
+
+
+def start_prefix_reloader():
+    prefix_source.start()
 
 
 def lookup_coords(callsign: str):
-    cs = callsign.upper()
-    matched = [
-        (prefix, coords)
-        for prefix, coords in callsign_prefix_map.items()
-        if cs.startswith(prefix.upper())
-    ]
-    if not matched:
-        return None
-    return max(matched, key=lambda x: len(x[0]))[1]
+    """Indicativo exacto o prefijo más largo que casa → (lat, lon) o None."""
+    return prefix_index.lookup(callsign)
 
 
 # --------------------------------------------------------------------
-#  Space weather desde Redis: f107/kp/ap  (ap se ignora por ahora)
+#  Space weather: instantánea en memoria que refresca spacewx.py en segundo
+#  plano (Redis spacewx:latest / fichero / NOAA). Aquí solo se lee.
 # --------------------------------------------------------------------
 
-def _spacewx_from_redis():
-    key = CONFIG.get("spacewx", {}).get("redis_key", "spacewx:latest")
-    data = r.get(key)
-    if not data:
-        return None
-    try:
-        return json.loads(data)
-    except Exception:
-        logger.warning("spacewx: invalid JSON in Redis key=%s", key)
-        return None
-
-
 def get_spacewx_indices(now_utc: datetime):
     """
-    Lee f107/kp/ap desde Redis y valida frescura.
+    f107/kp/ap vigentes de la instantánea (validada su frescura).
     Devuelve dict con f107, kp, ap y ts; o None si no válido.
     """
-    cfg = CONFIG.get("spacewx", {})
-    max_age_h = int(cfg.get("max_age_hours", 6))
-    data = _spacewx_from_redis()
-    if not data:
-        return None
+    return spacewx.indices(now_utc)
 
-    ts_str = data.get("fetched_utc") or data.get("kp_time")
-    if not ts_str:
-        return None
-
-    try:
-        ts_norm = ts_str.replace("Z", "+00:00").replace(" ", "T")
-        base = ts_norm.split("+")[0]
-        ts = datetime.fromisoformat(base)
-    except Exception:
-        logger.warning("spacewx: bad timestamp: %s", ts_str)
-        return None
 
-    if (now_utc - ts) > timedelta(hours=max_age_h):
-        logger.warning("spacewx: data too old (> %dh)", max_age_h)
-        return None
-
-    def _flt(x):
-        try:
-            return float(x)
-        except Exception:
-            return None
-
-    return {
-        "f107": _flt(data.get("f107")),
-        "kp": _flt(data.get("kp")),   # puede venir o no; opcional
-        "ap": _flt(data.get("ap")),   # ignorado de momento
-        "ts": ts,
-    }
-
-
-def f107_to_ssn(f107: float) -> int:
+def get_effective_ssn(dt: datetime) -> int:
     """
-    Conversión configurable F10.7 -> SSN (proxy para ITURHFProp).
-    SSN ≈ a * (F10.7 - b)
+    SSN de la instantánea para la fecha dt: hoy o futura → F10.7 reciente
+    como SSN equivalente (si no, NOAA de ayer; si nunca hubo datos,
+    default_ssn); pasada → SSN observado el día anterior a dt (NOAA, últimos
+    30 días) o, si no se conoce, el vigente.
     """
-    conv = CONFIG.get("spacewx", {}).get("f107_to_ssn", {})
-    a = float(conv.get("a", 1.61))
-    b = float(conv.get("b", 67.0))
-    ssn = a * (float(f107) - b)
-    return max(1, min(311, int(round(ssn))))  # rango típico
+    return spacewx.ssn_for(dt)
 
 
 # ---------------------------
-#  Fallback SSN NOAA (como tenías)
+#  Bandas HF de aficionado: (nombre, MHz mín, MHz máx, MHz de cálculo)
 # ---------------------------
 
-def get_ssn_value(dt: datetime) -> int:
-    yest = dt.date() - timedelta(days=1)
-    cache_key = f"ssn:{yest.isoformat()}"
-    if (cached := r.get(cache_key)):
-        return int(cached)
-
-    url = "https://services.swpc.noaa.gov/text/daily-solar-indices.txt"
-    try:
-        resp = requests.get(url, timeout=5)
-        resp.raise_for_status()
-        for line in resp.text.splitlines():
-            if line.startswith(f"{yest.year} {yest.month:02d} {yest.day:02d}"):
-                parts = line.split()
-                ssn = int(parts[3])
-                r.set(cache_key, ssn, ex=86400 * 7)
-                return ssn
-    except Exception:
-        logger.warning("Failed to fetch SSN, using fallback=100")
-
-    return 100
-
-
-def get_effective_ssn(dt: datetime) -> int:
-    """
-    Usa F10.7 reciente en Redis → SSN equivalente; si no, NOAA.
-    """
-    wx = get_spacewx_indices(datetime.utcnow())
-    if wx and wx.get("f107") is not None:
-        ssn = f107_to_ssn(wx["f107"])
-        logger.info("spacewx: F10.7=%.1f -> SSN=%d", wx["f107"], ssn)
-        return ssn
-    return get_ssn_value(dt)
+HF_BANDS = [
+    ("160m", 1.8, 2.0, 2.0),
+    ("80m", 3.5, 4.0, 4.0),
+    ("60m", 5.25, 5.45, 5.0),
+    ("40m", 7.0, 7.3, 7.0),
+    ("30m", 10.1, 10.15, 10.0),
+    ("20m", 14.0, 14.35, 14.0),
+    ("17m", 18.068, 18.168, 18.0),
+    ("15m", 21.0, 21.45, 21.0),
+    ("12m", 24.89, 24.99, 25.0),
+    ("10m", 28.0, 29.7, 28.0),
+]
+
+
+def band_index(freq_mhz: float):
+    """Índice en HF_BANDS de la banda que contiene la frecuencia (MHz), o None."""
+    f = float(freq_mhz)
+    for i, (_, lo, hi, _) in enumerate(HF_BANDS):
+        if lo - 0.05 <= f <= hi + 0.05:
+            return i
+    return None
 
 
 # ---------------------------
 #  ITURHFProp (perfil + métrica única por camino)
 # ---------------------------
 
-def run_iturhfprop(path_type: str, tx, rx, dt, freq, mode) -> dict:
+engine = create_engine(CONFIG.get("iturhfprop", {}), engine_slots)
+
+
+def run_iturhfprop(path_type: str, tx, rx, dt, freq, mode, ssn=None, apply_kp=True) -> dict:
     """
     Ejecuta ITURHFProp para SHORTPATH/LONGPATH y devuelve:
       { snr:int, reliability:int, metric:str, bcr:int|None, ocr:int|None, sir:float|None, snr_margin_db:float }
@@ -162,133 +103,67 @@ def run_iturhfprop(path_type: str, tx, rx, dt, freq, mode) -> dict:
       - DIGITAL (FT8/FT4): base = BCR (OCR se ignora). BW=2.5 kHz, SNRr=-12, SIRr=8, SNRXXp=50.
       - ANALOG (SSB/CW):   base = OCR si SIR creíble (si no, BCR). BW=2.7 kHz, SNRr=22, SIRr=15, SNRXXp=50.
       - Penalización por margen SNR: >=0 dB → sin penalizar; [-3,0) → ×0.6; [-6,-3) → ×0.3; < -6 → 0.
+    ssn: fuerza el SSN (tablas precalculadas); apply_kp=False omite el ajuste por Kp.
     """
-    infile = tempfile.NamedTemporaryFile("w+", suffix=".in", delete=False)
-    outfile = tempfile.NamedTemporaryFile("w+", suffix=".out", delete=False)
-    infile.close()
-    outfile.close()
-
-    in_path = infile.name
-    out_path = outfile.name
-
     # SSN efectivo (F10.7->SSN si hay; si no, NOAA)
-    ssn = get_effective_ssn(dt)
+    if ssn is None:
+        ssn = get_effective_ssn(dt)
 
     # Convertir frecuencia a MHz si viene en kHz
     freq_mhz = freq / 1000.0 if freq > 1000 else float(freq)
-    logger.info("Frecuencia convertida: %.3f MHz (original: %.1f)", freq_mhz, freq)
-
-    # Traducir modo a ANALOG/DIGITAL (SSB y CW caen en ANALOG por ahora)
-    mod = str(mode or "").upper()
-    modulation = "DIGITAL" if mod in ["DIGI", "DIGITAL", "FT8", "FT4"] else "ANALOG"
-    logger.info("Modo ITURHFProp: %s (original: %s)", modulation, mode)
-
-    # Perfiles realistas
-    if modulation == "DIGITAL":
-        bw_hz       = 2500.0
-        snr_r       = -12.0    # cómodo FT8 en 2.5 kHz (–18 mínimo)
-        sir_r       = 8.0
-        snr_pctl    = 50       # p50 por defecto
-        use_ocr     = False    # OCR/SIR poco fiables en digital NB, ahorro CPU
-    else:
-        # ANALOG (SSB y CW — de momento iguales)
-        bw_hz       = 2700.0   # si separas CW, cámbialo a 500.0 y SNRr≈11, SIRr≈10
-        snr_r       = 22.0     # umbral cómodo SSB
-        sir_r       = 15.0
-        snr_pctl    = 50       # p50; usa 80–90 para conservador (tu build interpreta “excedido XX%”)
-        use_ocr     = True
-
-    # Entorno y antenas por defecto (realistas)
-    noise_env   = "RESIDENTIAL"  # "RURAL" si QTH muy limpio
-    txgos_db    = 6.0            # dipolo/vertical (+pérdidas)
-    rxgos_db    = 6.0
-    txpower_dbw = 20.0           # 100 W
-
-    hf_input = f"""\  
-PathName "HF P2P Prediction"
-PathTXName "TX"
-Path.L_tx.lat {tx[0]}
-Path.L_tx.lng {tx[1]}
-TXAntFilePath "ISOTROPIC"
-TXGOS {txgos_db}
-PathRXName "RX"
-Path.L_rx.lat {rx[0]}
-Path.L_rx.lng {rx[1]}
-RXAntFilePath "ISOTROPIC"
-RXGOS {rxgos_db}
-AntennaOrientation "TX2RX"
-TXBearing 0.0
-RXBearing 0.0
-Path.year {dt.year}
-Path.month {dt.month}
-Path.hour {dt.hour}
-Path.SSN {ssn}
-Path.frequency {freq_mhz}
-Path.txpower {txpower_dbw}
-Path.BW {bw_hz}
-Path.SNRr {snr_r}
-Path.Relr 90
-Path.SNRXXp {snr_pctl}
-Path.SIRr {sir_r}
-Path.type 1
-Path.tx_mode 0
-Path.SorL "{path_type}"
-Path.ManMadeNoise "{noise_env}"
-Path.Modulation "{modulation}"
-LL.lat {rx[0]}
-LL.lng {rx[1]}
-LR.lat {rx[0]}
-LR.lng {rx[1]}
-UL.lat {rx[0]}
-UL.lng {rx[1]}
-UR.lat {rx[0]}
-UR.lng {rx[1]}
-latinc 1.0
-lnginc 1.0
-DataFilePath "/opt/iturhf/data/"
-RptFilePath "/tmp/"
-{ 'RptFileFormat "RPT_SNRXX | RPT_BCR"' if not use_ocr else 'RptFileFormat "RPT_SNRXX | RPT_SIRXX | RPT_BCR | RPT_OCR"' }
-"""
-
-    with open(in_path, "w") as f:
-        f.write(hf_input)
-
-    logger.info("ITURHFProp INPUT (Path: %s, SSN:%d):\n%s", path_type, ssn, hf_input)
-
-    cmd = ["/usr/bin/ITURHFProp", "-s", "-c", "-t", in_path, out_path]
-    proc = subprocess.run(cmd, capture_output=True, text=True)
-    if proc.returncode != 0:
-        logger.error("ITURHFProp failed for %s: %s", path_type, proc.stdout)
-        raise Exception(f"ITURHFProp failed for {path_type}")
-
-    # --- Parseo robusto por cabecera ---
-    snr = None; bcr = None; ocr = None; sir = None
-    try:
-        with open(out_path, "r") as f:
-            lines = [ln.strip() for ln in f if ln.strip()]
-        if len(lines) < 2:
-            raise RuntimeError("empty report")
-        header = lines[0].split(",")
-        data   = lines[-1].split(",")
-        idx = {name: header.index(name) for name in header}
-        # SNR
-        if "SNRXXp" in idx:
-            snr = float(data[idx["SNRXXp"]])
-        elif "SNR" in idx:
-            snr = float(data[idx["SNR"]])
-        # BCR / OCR
-        if "BCR" in idx:
-            bcr = float(data[idx["BCR"]])
-        if "OCR" in idx:
-            ocr = float(data[idx["OCR"]])
-        # SIR (algunas builds devuelven SIR a secas)
-        if "SIRXXp" in idx:
-            sir = float(data[idx["SIRXXp"]])
-        elif "SIR" in idx:
-            sir = float(data[idx["SIR"]])
-    except Exception:
-        logger.exception(f"Error parsing report ({path_type})")
-        raise Exception(f"Failed reading report for {path_type}")
+    logger.debug("Frecuencia convertida: %.3f MHz (original: %.1f)", freq_mhz, freq)
+
+    # Perfil realista según modo (ANALOG/DIGITAL)
+    profile = radio_profile(mode)
+    logger.debug("Modo ITURHFProp: %s (original: %s)", profile["modulation"], mode)
+
+    with timed(ENGINE_SECONDS, path_type, profile["modulation"], "p2p"):
+        values = engine.predict(path_type, tx, rx, dt, ssn, freq_mhz, profile)
+    return _finalize_prediction(values, profile, path_type, apply_kp=apply_kp)
+
+
+async def run_iturhfprop_async(path_type: str, tx, rx, dt, freq, mode, ssn=None, apply_kp=True) -> dict:
+    """
+    Igual que run_iturhfprop sin bloquear el event loop: índices solares de
+    la instantánea (leídos una vez) y motor vía asyncio.create_subprocess_exec.
+    """
+    wx = get_spacewx_indices(datetime.utcnow()) or {}
+    if ssn is None:
+        ssn = get_effective_ssn(dt)
+
+    freq_mhz = freq / 1000.0 if freq > 1000 else float(freq)
+    profile = radio_profile(mode)
+
+    with timed(ENGINE_SECONDS, path_type, profile["modulation"], "p2p"):
+        values = await engine.predict_async(path_type, tx, rx, dt, ssn, freq_mhz, profile)
+    return _finalize_prediction(values, profile, path_type, apply_kp=apply_kp, wx=wx)
+
+
+def _kp_factor(wx=None):
+    """
+    Factor de degradación por Kp (config spacewx.reliability_adjust) o None.
+    wx: índices ya leídos ({} = leídos y sin datos); None → los de la instantánea.
+    """
+    adj_cfg = CONFIG.get("spacewx", {}).get("reliability_adjust", {})
+    if not adj_cfg.get("enabled", False):
+        return None
+    if wx is None:
+        wx = spacewx.indices()
+    kp = wx.get("kp") if wx else None
+    if kp is None:
+        return None
+    slope = float(adj_cfg.get("slope", 0.07))
+    kp0   = float(adj_cfg.get("kp0", 3.0))
+    minf  = float(adj_cfg.get("min", 0.10))
+    factor = 1.0 - slope * max(0.0, float(kp) - kp0)
+    return kp, max(minf, min(1.0, factor))
+
+
+def _finalize_prediction(values: dict, profile: dict, path_type: str, apply_kp: bool = True, wx=None) -> dict:
+    """Valores crudos del motor → métrica única + penalizaciones (SNR y Kp)."""
+    modulation = profile["modulation"]
+    snr_r = profile["snr_r"]
+    snr = values["snr"]; bcr = values["bcr"]; ocr = values["ocr"]; sir = values["sir"]
 
     if snr is None or bcr is None:
         raise Exception(f"No data found in report for {path_type}")
@@ -318,19 +193,12 @@ RptFilePath "/tmp/"
         reliability = 0.0
 
     # --- Ajuste opcional por Kp sobre la fiabilidad (post-proceso) ---
-    adj_cfg = CONFIG.get("spacewx", {}).get("reliability_adjust", {})
-    if adj_cfg.get("enabled", False):
-        wx = get_spacewx_indices(datetime.utcnow())
-        kp = wx.get("kp") if wx else None
-        if kp is not None:
-            slope = float(adj_cfg.get("slope", 0.07))
-            kp0   = float(adj_cfg.get("kp0", 3.0))
-            minf  = float(adj_cfg.get("min", 0.10))
-            factor = 1.0 - slope * max(0.0, float(kp) - kp0)
-            factor = max(minf, min(1.0, factor))
-            reliability = reliability * factor
-            logger.info("Kp adjust: Kp=%.1f factor=%.2f → rel=%d",
-                        kp, factor, int(round(reliability)))
+    kp_adj = _kp_factor(wx) if apply_kp else None
+    if kp_adj is not None:
+        kp, factor = kp_adj
+        reliability = reliability * factor
+        logger.info("Kp adjust: Kp=%.1f factor=%.2f → rel=%d",
+                    kp, factor, int(round(reliability)))
 
     # Redondeos finales (mantén compatibilidad con tu UI)
     return {
@@ -343,3 +211,145 @@ RptFilePath "/tmp/"
         "sir": None if not sir_valid else round(sir, 1),
         "snr_margin_db": round(margin, 1),
     }
+
+
+# ---------------------------
+#  ITURHFProp en modo área (1 TX → rejilla de RX en una ejecución)
+# ---------------------------
+
+def _finalize_grid(values: dict, profile: dict, apply_kp: bool = True) -> dict:
+    """Versión vectorizada de _finalize_prediction sobre arrays NumPy (NaN = sin dato)."""
+    snr = values["snr"]; bcr = values["bcr"]; ocr = values["ocr"]; sir = values["sir"]
+
+    sir_valid = (sir > -100.0) & (sir < 200.0) & (np.abs(sir + 307.0) > 1e-3)
+    use_ocr = sir_valid & ~np.isnan(ocr) if profile["modulation"] == "ANALOG" else np.zeros_like(sir_valid)
+    base_rel = np.where(use_ocr, ocr, bcr)
+
+    margin = snr - profile["snr_r"]
+    factor = np.select([margin >= 0, margin >= -3, margin >= -6], [1.0, 0.6, 0.3], default=0.0)
+    reliability = base_rel * factor
+
+    kp_adj = _kp_factor() if apply_kp else None
+    if kp_adj is not None:
+        reliability = reliability * kp_adj[1]
+
+    return {
+        "snr": snr,
+        "reliability": reliability,
+        "use_ocr": use_ocr,
+        "bcr": bcr,
+        "ocr": ocr,
+        "sir": np.where(sir_valid, sir, np.nan),
+        "snr_margin_db": margin,
+    }
+
+
+def area_for_receivers(receivers, step_deg: float = None, max_cells: int = None):
+    """
+    Rejilla mínima (alineada a step_deg) que cubre todos los receptores.
+    Si excede max_cells, duplica el paso hasta que quepa.
+    """
+    area_cfg = CONFIG.get("iturhfprop", {}).get("area", {})
+    step = float(step_deg or area_cfg.get("step_deg", 2.0))
+    max_cells = int(max_cells or area_cfg.get("max_cells", 400))
+
+    lats = [float(c[0]) for c in receivers]
+    lngs = [float(c[1]) for c in receivers]
+    while True:
+        lat_min = max(-90.0, math.floor(min(lats) / step) * step)
+        lat_max = min(90.0, math.ceil(max(lats) / step) * step)
+        lng_min = max(-180.0, math.floor(min(lngs) / step) * step)
+        lng_max = min(180.0, math.ceil(max(lngs) / step) * step)
+        cells = (round((lat_max - lat_min) / step) + 1) * (round((lng_max - lng_min) / step) + 1)
+        if cells <= max_cells:
+            return (lat_min, lng_min, lat_max, lng_max, step, step)
+        step *= 2.0
+
+
+def run_iturhfprop_area(path_type: str, tx, area, dt, freq, mode) -> dict:
+    """
+    Una ejecución ITURHFProp para TX fijo y rejilla de receptores.
+    area = (lat_min, lng_min, lat_max, lng_max, latinc, lnginc).
+    Devuelve arrays NumPy (nlat × nlng) con snr/reliability/bcr/ocr/sir/snr_margin_db,
+    más los ejes "lats"/"lngs". Celdas sin dato → NaN.
+    """
+    ssn = get_effective_ssn(dt)
+    freq_mhz = freq / 1000.0 if freq > 1000 else float(freq)
+    profile = radio_profile(mode)
+
+    lats, lngs = grid_axes(area)
+    lats = np.asarray(lats); lngs = np.asarray(lngs)
+    raw = {k: np.full((len(lats), len(lngs)), np.nan) for k in ("snr", "bcr", "ocr", "sir")}
+
+    with timed(ENGINE_SECONDS, path_type, profile["modulation"], "area"):
+        cells = engine.predict_area(path_type, tx, area, dt, ssn, freq_mhz, profile)
+    for lat, lng, values in cells:
+        i = int(np.abs(lats - lat).argmin()); j = int(np.abs(lngs - lng).argmin())
+        for k, v in values.items():
+            if v is not None:
+                raw[k][i, j] = v
+
+    logger.info("ITURHFProp área %s: %d×%d celdas en una ejecución", path_type, len(lats), len(lngs))
+    grid = _finalize_grid(raw, profile)
+    grid["lats"] = lats
+    grid["lngs"] = lngs
+    return grid
+
+
+def run_iturhfprop_receivers(path_type: str, tx, receivers, dt, freq, mode) -> list:
+    """
+    Predicción TX → varios RX con una única ejecución de área.
+    Cada receptor toma la celda más cercana (aproximación: la rejilla puede ser
+    de varios grados); devuelve una lista de dicts con el mismo formato que
+    run_iturhfprop (None si la celda no tiene dato).
+    """
+    grid = run_iturhfprop_area(path_type, tx, area_for_receivers(receivers), dt, freq, mode)
+    results = []
+    for lat, lng in receivers:
+        i = int(np.abs(grid["lats"] - float(lat)).argmin())
+        j = int(np.abs(grid["lngs"] - float(lng)).argmin())
+        snr = grid["snr"][i, j]; bcr = grid["bcr"][i, j]
+        if np.isnan(snr) or np.isnan(bcr):
+            results.append(None)
+            continue
+        ocr = grid["ocr"][i, j]; sir = grid["sir"][i, j]
+        results.append({
+            "snr": int(round(snr)),
+            "reliability": int(round(grid["reliability"][i, j])),
+            "metric": "OCR" if grid["use_ocr"][i, j] else "BCR",
+            "bcr": int(round(bcr)),
+            "ocr": None if np.isnan(ocr) else int(round(ocr)),
+            "sir": None if np.isnan(sir) else round(float(sir), 1),
+            "snr_margin_db": round(float(grid["snr_margin_db"][i, j]), 1),
+        })
+    return results
+
+
+# ---------------------------
+#  ITURHFProp en modo vector (bandas HF × 24 horas de un camino en una ejecución)
+# ---------------------------
+
+def run_iturhfprop_vector(path_type: str, tx, rx, dt, mode, ssn=None, apply_kp=True) -> dict:
+    """
+    Una ejecución ITURHFProp para todas las bandas de HF_BANDS × 24 horas UTC
+    del camino (el mes lo da dt). Devuelve arrays NumPy (bandas × 24, índice =
+    hora UTC) con snr/reliability/use_ocr/bcr/ocr/sir/snr_margin_db, como
+    run_iturhfprop_area. Puntos sin dato → NaN.
+    """
+    if ssn is None:
+        ssn = get_effective_ssn(dt)
+    profile = radio_profile(mode)
+    freqs = [b[3] for b in HF_BANDS]
+    f_axis = np.asarray(freqs)
+    raw = {k: np.full((len(freqs), 24), np.nan) for k in ("snr", "bcr", "ocr", "sir")}
+
+    with timed(ENGINE_SECONDS, path_type, profile["modulation"], "vector"):
+        points = engine.predict_vector(path_type, tx, rx, dt, ssn, freqs, DAY_HOURS, profile)
+    for hour, f_mhz, values in points:
+        b = int(np.abs(f_axis - f_mhz).argmin())
+        for k, v in values.items():
+            if v is not None:
+                raw[k][b, hour % 24] = v
+
+    logger.debug("ITURHFProp vector %s: %d bandas × 24 h en una ejecución", path_type, len(freqs))
+    return _finalize_grid(raw, profile, apply_kp=apply_kp)
@@ -0,0 +1,550 @@
+# app/iturhf_engine.py
+"""
+Motor de ejecución de ITURHFProp.
+
+- SubprocessEngine: escribe el deck de entrada en un directorio temporal,
+  lanza /usr/bin/ITURHFProp y parsea el informe CSV. Limpia siempre los
+  ficheros temporales. Con slots, cada lanzamiento ocupa un hueco del límite
+  global de procesos (engine_pool.slots). Dentro de un trabajo del pool el
+  tiempo que le queda hasta su deadline es el timeout del proceso.
+- LibraryEngine: llama a P533() de libp533 (con libp372) en el propio proceso
+  vía ctypes, sobre un PathData rellenado desde Python: sin deck, sin informe
+  y sin arrancar el binario. Si las librerías o los datos no cargan,
+  create_engine vuelve a SubprocessEngine.
+
+Además del modo punto a punto ofrece modo área (1 TX → rejilla de RX) y modo
+vector (todas las frecuencias × horas de un camino en una sola ejecución, con
+listas en Path.frequency y Path.hour).
+
+Devuelve los valores crudos del informe:
+  {"snr": float|None, "bcr": float|None, "ocr": float|None, "sir": float|None}
+"""
+import asyncio
+import contextlib
+import ctypes
+import logging
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+from datetime import datetime
+
+from engine_pool import DeadlineExceeded, remaining_s
+from log_pipeline import debug_dumps, dump_logger
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BINARY = "/usr/bin/ITURHFProp"
+DEFAULT_DATA_PATH = "/opt/iturhf/data/"
+DEFAULT_P533_PATH = "/usr/lib/libp533.so"
+# libp533 abre libp372 con dlopen por este nombre (y termina el proceso si no
+# lo encuentra): tiene que estar en la ruta del cargador (/usr/lib, LD_LIBRARY_PATH)
+P372_NAME = "libp372.so"
+
+# Entorno y antenas por defecto (realistas)
+NOISE_ENV = "RESIDENTIAL"  # "RURAL" si QTH muy limpio
+TXGOS_DB = 6.0             # dipolo/vertical (+pérdidas)
+RXGOS_DB = 6.0
+TXPOWER_DBW = 20.0         # 100 W
+
+# Horas del modo vector tal y como las numera ITURHFProp (1..24; 24 = 00 UTC)
+DAY_HOURS = list(range(1, 25))
+
+
+# ---------------------------
+#  Perfiles por modo
+# ---------------------------
+
+def radio_profile(mode) -> dict:
+    """
+    Traduce el modo a ANALOG/DIGITAL (SSB y CW caen en ANALOG por ahora)
+    y devuelve el perfil de recepción asociado.
+    """
+    mod = str(mode or "").upper()
+    modulation = "DIGITAL" if mod in ["DIGI", "DIGITAL", "FT8", "FT4"] else "ANALOG"
+
+    if modulation == "DIGITAL":
+        return {
+            "modulation": "DIGITAL",
+            "bw_hz": 2500.0,
+            "snr_r": -12.0,     # cómodo FT8 en 2.5 kHz (–18 mínimo)
+            "sir_r": 8.0,
+            "snr_pctl": 50,     # p50 por defecto
+            "use_ocr": False,   # OCR/SIR poco fiables en digital NB, ahorro CPU
+        }
+    # ANALOG (SSB y CW — de momento iguales)
+    return {
+        "modulation": "ANALOG",
+        "bw_hz": 2700.0,        # si separas CW, cámbialo a 500.0 y SNRr≈11, SIRr≈10
+        "snr_r": 22.0,          # umbral cómodo SSB
+        "sir_r": 15.0,
+        "snr_pctl": 50,         # p50; usa 80–90 para conservador (tu build interpreta “excedido XX%”)
+        "use_ocr": True,
+    }
+
+
+# ---------------------------
+#  Deck de entrada y parseo de informe
+# ---------------------------
+
+def build_input_deck(path_type: str, tx, rx, dt, ssn: int, freq_mhz,
+                     profile: dict, data_path: str, rpt_path: str, area=None, hours=None) -> str:
+    """
+    Deck de entrada ITURHFProp. Sin area → rejilla 1×1 en el punto RX.
+    area = (lat_min, lng_min, lat_max, lng_max, latinc, lnginc) → rejilla de receptores.
+    freq_mhz puede ser una lista y hours una lista de horas (modo vector); sin
+    hours se usa la hora de dt.
+    """
+    hour = dt.hour if hours is None else ", ".join(str(h) for h in hours)
+    if isinstance(freq_mhz, (list, tuple)):
+        freq_mhz = ", ".join(str(f) for f in freq_mhz)
+    if area is None:
+        area = (rx[0], rx[1], rx[0], rx[1], 1.0, 1.0)
+    lat_min, lng_min, lat_max, lng_max, latinc, lnginc = area
+    rpt_format = ('RptFileFormat "RPT_SNRXX | RPT_SIRXX | RPT_BCR | RPT_OCR"'
+                  if profile["use_ocr"] else 'RptFileFormat "RPT_SNRXX | RPT_BCR"')
+    return f"""\
+PathName "HF P2P Prediction"
+PathTXName "TX"
+Path.L_tx.lat {tx[0]}
+Path.L_tx.lng {tx[1]}
+TXAntFilePath "ISOTROPIC"
+TXGOS {TXGOS_DB}
+PathRXName "RX"
+Path.L_rx.lat {rx[0]}
+Path.L_rx.lng {rx[1]}
+RXAntFilePath "ISOTROPIC"
+RXGOS {RXGOS_DB}
+AntennaOrientation "TX2RX"
+TXBearing 0.0
+RXBearing 0.0
+Path.year {dt.year}
+Path.month {dt.month}
+Path.hour {hour}
+Path.SSN {ssn}
+Path.frequency {freq_mhz}
+Path.txpower {TXPOWER_DBW}
+Path.BW {profile["bw_hz"]}
+Path.SNRr {profile["snr_r"]}
+Path.Relr 90
+Path.SNRXXp {profile["snr_pctl"]}
+Path.SIRr {profile["sir_r"]}
+Path.type 1
+Path.tx_mode 0
+Path.SorL "{path_type}"
+Path.ManMadeNoise "{NOISE_ENV}"
+Path.Modulation "{profile["modulation"]}"
+LL.lat {lat_min}
+LL.lng {lng_min}
+LR.lat {lat_min}
+LR.lng {lng_max}
+UL.lat {lat_max}
+UL.lng {lng_min}
+UR.lat {lat_max}
+UR.lng {lng_max}
+latinc {latinc}
+lnginc {lnginc}
+DataFilePath "{data_path}"
+RptFilePath "{rpt_path}"
+{rpt_format}
+"""
+
+
+def read_report(out_path: str):
+    """Devuelve (índice de cabecera, filas de datos) del informe CSV."""
+    with open(out_path, "r") as f:
+        lines = [ln.strip() for ln in f if ln.strip()]
+    if len(lines) < 2:
+        raise RuntimeError("empty report")
+    header = lines[0].split(",")
+    idx = {name: i for i, name in enumerate(header)}
+    return idx, [ln.split(",") for ln in lines[1:]]
+
+
+def report_values(idx: dict, data: list) -> dict:
+    """Extrae SNR/BCR/OCR/SIR de una fila del informe (parseo por cabecera)."""
+    def _col(*names):
+        for name in names:
+            if name in idx:
+                return float(data[idx[name]])
+        return None
+
+    return {
+        "snr": _col("SNRXXp", "SNR"),
+        "bcr": _col("BCR"),
+        "ocr": _col("OCR"),
+        # SIR (algunas builds devuelven SIR a secas)
+        "sir": _col("SIRXXp", "SIR"),
+    }
+
+
+def grid_axes(area):
+    """Ejes (lats, lngs) de la rejilla tal y como los recorre ITURHFProp."""
+    lat_min, lng_min, lat_max, lng_max, latinc, lnginc = area
+    nlat = int(round((lat_max - lat_min) / latinc)) + 1
+    nlng = int(round((lng_max - lng_min) / lnginc)) + 1
+    lats = [lat_min + i * latinc for i in range(nlat)]
+    lngs = [lng_min + j * lnginc for j in range(nlng)]
+    return lats, lngs
+
+
+def area_values(idx: dict, rows: list, area) -> list:
+    """
+    Asocia cada fila del informe de área a su celda → [(lat, lng, values), ...].
+    Usa columnas Lat/Lng si el build las emite; si no, el orden de la rejilla
+    (latitud exterior ascendente, longitud interior ascendente).
+    """
+    lat_col = next((idx[c] for c in ("Lat", "lat", "RXLat") if c in idx), None)
+    lng_col = next((idx[c] for c in ("Lng", "lng", "Lon", "RXLng") if c in idx), None)
+    if lat_col is not None and lng_col is not None:
+        return [(float(row[lat_col]), float(row[lng_col]), report_values(idx, row)) for row in rows]
+
+    lats, lngs = grid_axes(area)
+    cells = [(lat, lng) for lat in lats for lng in lngs]
+    if len(rows) < len(cells):
+        raise RuntimeError(f"area report has {len(rows)} rows for {len(cells)} cells")
+    rows = rows[-len(cells):]
+    return [(lat, lng, report_values(idx, row)) for (lat, lng), row in zip(cells, rows)]
+
+
+def vector_values(idx: dict, rows: list, freqs, hours) -> list:
+    """
+    Asocia cada fila del informe vectorial a su (hora, frecuencia) →
+    [(hour, freq_mhz, values), ...]. Usa columnas Hour/Freq si el build las
+    emite; si no, el orden de ITURHFProp (hora exterior, frecuencia interior).
+    """
+    h_col = next((idx[c] for c in ("Hour", "hour") if c in idx), None)
+    f_col = next((idx[c] for c in ("Freq", "freq", "Frequency") if c in idx), None)
+    if h_col is not None and f_col is not None:
+        return [(int(float(row[h_col])), float(row[f_col]), report_values(idx, row)) for row in rows]
+
+    cells = [(h, f) for h in hours for f in freqs]
+    if len(rows) < len(cells):
+        raise RuntimeError(f"vector report has {len(rows)} rows for {len(cells)} points")
+    rows = rows[-len(cells):]
+    return [(h, f, report_values(idx, row)) for (h, f), row in zip(cells, rows)]
+
+
+# ---------------------------
+#  Motores
+# ---------------------------
+
+def _job_timeout(path_type: str):
+    """Timeout del cálculo = lo que queda del deadline del trabajo (None fuera del pool o sin deadline)."""
+    timeout = remaining_s()
+    if timeout is not None and timeout <= 0:
+        raise DeadlineExceeded(f"no time left for {path_type}")
+    return timeout
+
+
+class SubprocessEngine:
+    name = "subprocess"
+
+    def __init__(self, binary: str = DEFAULT_BINARY, data_path: str = DEFAULT_DATA_PATH, slots=None):
+        self.binary = binary
+        self.data_path = data_path
+        self.slots = slots
+
+    def _prepare(self, tmpdir: str, path_type: str, tx, rx, dt, ssn: int, freq_mhz,
+                 profile: dict, area=None, hours=None):
+        """Escribe el deck en tmpdir y devuelve (cmd, ruta del informe)."""
+        in_path = os.path.join(tmpdir, "path.in")
+        out_path = os.path.join(tmpdir, "path.out")
+        hf_input = build_input_deck(path_type, tx, rx, dt, ssn, freq_mhz, profile,
+                                    self.data_path, tmpdir + "/", area=area, hours=hours)
+        with open(in_path, "w") as f:
+            f.write(hf_input)
+
+        if debug_dumps():
+            dump_logger.info("ITURHFProp INPUT (Path: %s, SSN:%d):\n%s", path_type, ssn, hf_input)
+        return [self.binary, "-s", "-c", "-t", in_path, out_path], out_path
+
+    @staticmethod
+    def _read(path_type: str, out_path: str):
+        try:
+            return read_report(out_path)
+        except Exception:
+            logger.exception(f"Error parsing report ({path_type})")
+            raise Exception(f"Failed reading report for {path_type}")
+
+    def _run(self, path_type: str, tx, rx, dt, ssn: int, freq_mhz, profile: dict, area=None, hours=None):
+        with tempfile.TemporaryDirectory(prefix="iturhf-") as tmpdir:
+            cmd, out_path = self._prepare(tmpdir, path_type, tx, rx, dt, ssn, freq_mhz, profile, area, hours)
+            with self.slots.slot() if self.slots else contextlib.nullcontext():
+                timeout = _job_timeout(path_type)
+                try:
+                    proc = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+                except subprocess.TimeoutExpired:
+                    raise DeadlineExceeded(f"ITURHFProp killed for {path_type}: job deadline passed")
+            if proc.returncode != 0:
+                logger.error("ITURHFProp failed for %s: %s", path_type, proc.stdout)
+                raise Exception(f"ITURHFProp failed for {path_type}")
+            return self._read(path_type, out_path)
+
+    async def predict_async(self, path_type: str, tx, rx, dt, ssn: int, freq_mhz: float, profile: dict) -> dict:
+        with tempfile.TemporaryDirectory(prefix="iturhf-") as tmpdir:
+            cmd, out_path = self._prepare(tmpdir, path_type, tx, rx, dt, ssn, freq_mhz, profile)
+            async with self.slots.slot_async() if self.slots else contextlib.nullcontext():
+                timeout = _job_timeout(path_type)
+                proc = await asyncio.create_subprocess_exec(
+                    *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+                try:
+                    stdout, _ = await asyncio.wait_for(proc.communicate(), timeout)
+                except asyncio.TimeoutError:
+                    proc.kill()
+                    await proc.wait()
+                    raise DeadlineExceeded(f"ITURHFProp killed for {path_type}: job deadline passed")
+            if proc.returncode != 0:
+                logger.error("ITURHFProp failed for %s: %s", path_type, stdout.decode(errors="ignore"))
+                raise Exception(f"ITURHFProp failed for {path_type}")
+            idx, rows = self._read(path_type, out_path)
+            return report_values(idx, rows[-1])
+
+    def predict(self, path_type: str, tx, rx, dt, ssn: int, freq_mhz: float, profile: dict) -> dict:
+        idx, rows = self._run(path_type, tx, rx, dt, ssn, freq_mhz, profile)
+        return report_values(idx, rows[-1])
+
+    def predict_area(self, path_type: str, tx, area, dt, ssn: int, freq_mhz: float, profile: dict) -> list:
+        """Una sola ejecución sobre toda la rejilla → [(lat, lng, values), ...]."""
+        rx = (area[0], area[1])
+        idx, rows = self._run(path_type, tx, rx, dt, ssn, freq_mhz, profile, area=area)
+        try:
+            return area_values(idx, rows, area)
+        except Exception:
+            logger.exception(f"Error parsing area report ({path_type})")
+            raise Exception(f"Failed reading area report for {path_type}")
+
+    def predict_vector(self, path_type: str, tx, rx, dt, ssn: int, freqs, hours, profile: dict) -> list:
+        """Una sola ejecución para todas las horas × frecuencias → [(hour, freq_mhz, values), ...]."""
+        idx, rows = self._run(path_type, tx, rx, dt, ssn, list(freqs), profile, hours=hours)
+        try:
+            return vector_values(idx, rows, freqs, hours)
+        except Exception:
+            logger.exception(f"Error parsing vector report ({path_type})")
+            raise Exception(f"Failed reading vector report for {path_type}")
+
+
+# Disposición de PathData (P533.h) del build empaquetado; se contrasta con
+# sizeofPathDataStruct() al cargar. Mes y hora en base 0, ángulos en radianes.
+PATHDATA_SIZE = 0x1098
+PD_YEAR, PD_MONTH, PD_HOUR, PD_SSN = 0x300, 0x304, 0x308, 0x30C
+PD_MODULATION, PD_SORL = 0x310, 0x314
+PD_FREQ, PD_BW, PD_TXPOWER = 0x318, 0x320, 0x328
+PD_SNRXXP, PD_SNRR, PD_SIRR = 0x330, 0x338, 0x340
+PD_DIGITAL_PARAMS = (0x348, 0x350, 0x358, 0x360, 0x368)  # F0, T0, A, TW, FW (0 como en el deck)
+PD_TX_LAT, PD_TX_LNG, PD_RX_LAT, PD_RX_LNG = 0x370, 0x378, 0x380, 0x388
+PD_A_TX, PD_A_RX = 0x390, 0x4A8
+PD_FOF2, PD_M3KF2 = 0x5C0, 0x5C8
+PD_NOISEP = 0x1000
+PD_MANMADENOISE = 0x1060
+PD_SNRXX, PD_SIR, PD_BCR, PD_OCR = 0x6E0, 0x6E8, 0x718, 0x720
+
+# Códigos de retorno correctos de libp533/libp372
+RTN_P533OK = 10
+RTN_ALLOCATEP533OK = 11
+RTN_READIONPARAOK = 14
+RTN_READP1239OK = 15
+RTN_READFAMDUDOK = 22
+
+MAN_MADE_NOISE = {"CITY": 0.0, "RESIDENTIAL": 1.0, "RURAL": 2.0,
+                  "QUIETRURAL": 3.0, "NOISY": 4.0, "QUIET": 5.0}
+DEG2RAD = 0.0174532925     # el mismo factor que usa ITURHFProp al leer el deck
+
+
+class _PathContext:
+    """PathData propio, con P.1239 y antenas ya cargados; el mes se lee bajo demanda."""
+
+    def __init__(self):
+        self.buf = ctypes.create_string_buffer(PATHDATA_SIZE)
+        self.addr = ctypes.addressof(self.buf)
+        self.month = None
+
+    def set_int(self, offset: int, value: int):
+        ctypes.c_int.from_buffer(self.buf, offset).value = int(value)
+
+    def set_double(self, offset: int, value: float):
+        ctypes.c_double.from_buffer(self.buf, offset).value = float(value)
+
+    def get_double(self, offset: int) -> float:
+        return ctypes.c_double.from_buffer(self.buf, offset).value
+
+    def get_pointer(self, offset: int):
+        return ctypes.c_void_p.from_buffer(self.buf, offset).value
+
+
+class LibraryEngine:
+    """
+    ITURHFProp en proceso: rellena un PathData y llama a P533() de libp533.
+    Cada cálculo toma un contexto del pool (uno por hilo concurrente, acotados
+    por slots) con los datos del mes ya residentes, así que el coste por
+    camino es el del propio cálculo y no el de lanzar el binario, leer los
+    ficheros de coeficientes y parsear el CSV. Los valores se redondean a dos
+    decimales, como en el informe del binario.
+    """
+    name = "library"
+
+    def __init__(self, p533_path: str = DEFAULT_P533_PATH, data_path: str = DEFAULT_DATA_PATH, slots=None):
+        # Misma búsqueda que hará libp533: si falla, OSError aquí y no exit() dentro de la librería
+        self.p372 = ctypes.CDLL(P372_NAME, mode=ctypes.RTLD_GLOBAL)
+        self.p533 = ctypes.CDLL(p533_path, mode=ctypes.RTLD_GLOBAL)
+        self.data_path = data_path.encode()
+        self.slots = slots
+        self._contexts = queue.LifoQueue()
+        self._alloc_lock = threading.Lock()
+
+        ptr = ctypes.c_void_p
+        self.p533.sizeofPathDataStruct.argtypes = []
+        self.p533.AllocatePathMemory.argtypes = [ptr]
+        self.p533.ReadP1239.argtypes = [ptr, ctypes.c_char_p]
+        self.p533.IsotropicPattern.argtypes = [ptr, ctypes.c_double, ctypes.c_int]
+        self.p533.IsotropicPattern.restype = None
+        self.p533.ReadIonParametersBin.argtypes = [ctypes.c_int, ptr, ptr, ctypes.c_char_p, ctypes.c_int]
+        self.p533.ReadIonParametersTxt.argtypes = [ptr, ctypes.c_char_p, ctypes.c_int]
+        self.p533.P533.argtypes = [ptr]
+        self.p372.ReadFamDud.argtypes = [ptr, ctypes.c_char_p, ctypes.c_int]
+
+        size = self.p533.sizeofPathDataStruct()
+        if size != PATHDATA_SIZE:
+            raise RuntimeError(f"libp533 PathData is {size} bytes, expected {PATHDATA_SIZE}")
+
+        # Primer contexto ya con el mes en curso: si faltan datos, falla aquí y no en la primera petición
+        with self._context() as ctx:
+            self._load_month(ctx, datetime.utcnow().month)
+
+    def _new_context(self) -> _PathContext:
+        ctx = _PathContext()
+        # AllocatePathMemory resuelve los símbolos de libp372 en globales de libp533
+        with self._alloc_lock:
+            rc = self.p533.AllocatePathMemory(ctx.buf)
+        if rc != RTN_ALLOCATEP533OK:
+            raise RuntimeError(f"AllocatePathMemory failed (rc={rc})")
+        rc = self.p533.ReadP1239(ctx.buf, self.data_path)
+        if rc != RTN_READP1239OK:
+            raise RuntimeError(f"ReadP1239 failed (rc={rc})")
+        self.p533.IsotropicPattern(ctx.addr + PD_A_TX, TXGOS_DB, 1)
+        self.p533.IsotropicPattern(ctx.addr + PD_A_RX, RXGOS_DB, 1)
+        return ctx
+
+    @contextlib.contextmanager
+    def _context(self):
+        try:
+            ctx = self._contexts.get_nowait()
+        except queue.Empty:
+            ctx = self._new_context()
+        try:
+            yield ctx
+        finally:
+            self._contexts.put(ctx)
+
+    def _load_month(self, ctx: _PathContext, month: int):
+        """foF2/M3kF2 (ionosMM.bin, o ionosMM.txt si no hay binario) y ruido (COEFFMMW.txt) del mes."""
+        if ctx.month == month:
+            return
+        ctx.month = None  # una carga a medias no debe reutilizarse
+        ctx.set_int(PD_MONTH, month - 1)
+        rc = self.p533.ReadIonParametersBin(month - 1, ctx.get_pointer(PD_FOF2), ctx.get_pointer(PD_M3KF2),
+                                            self.data_path, 1)
+        if rc != RTN_READIONPARAOK:
+            rc = self.p533.ReadIonParametersTxt(ctx.buf, self.data_path, 1)
+        if rc != RTN_READIONPARAOK:
+            raise RuntimeError(f"ionospheric data for month {month} not readable (rc={rc})")
+        rc = self.p372.ReadFamDud(ctx.addr + PD_NOISEP, self.data_path, month - 1)
+        if rc != RTN_READFAMDUDOK:
+            raise RuntimeError(f"noise data for month {month} not readable (rc={rc})")
+        ctx.month = month
+
+    def _compute(self, path_type: str, tx, dt, ssn: int, profile: dict, cells) -> list:
+        """
+        Evalúa cells = [(rx, hour, freq_mhz), ...] (hora como la numera
+        ITURHFProp, 1..24) con un único contexto → [values, ...].
+        """
+        with self._context() as ctx:
+            self._load_month(ctx, dt.month)
+            ctx.set_int(PD_YEAR, dt.year)
+            ctx.set_int(PD_SSN, ssn)
+            ctx.set_int(PD_MODULATION, 1 if profile["modulation"] == "DIGITAL" else 0)
+            ctx.set_int(PD_SORL, 1 if path_type == "LONGPATH" else 0)
+            ctx.set_double(PD_BW, profile["bw_hz"])
+            ctx.set_double(PD_TXPOWER, TXPOWER_DBW)
+            ctx.set_int(PD_SNRXXP, profile["snr_pctl"])
+            ctx.set_double(PD_SNRR, profile["snr_r"])
+            ctx.set_double(PD_SIRR, profile["sir_r"])
+            for offset in PD_DIGITAL_PARAMS:
+                ctx.set_double(offset, 0.0)
+            ctx.set_double(PD_MANMADENOISE, MAN_MADE_NOISE[NOISE_ENV])
+            ctx.set_double(PD_TX_LAT, tx[0] * DEG2RAD)
+            ctx.set_double(PD_TX_LNG, tx[1] * DEG2RAD)
+
+            results = []
+            for rx, hour, freq_mhz in cells:
+                # P533() no se puede interrumpir: el deadline del trabajo se comprueba entre celdas
+                _job_timeout(path_type)
+                # Mismo rango que valida ITURHFProp al leer el deck
+                if not 1.0 <= float(freq_mhz) <= 30.0:
+                    logger.error("ITURHFProp failed for %s: frequency %s MHz out of range", path_type, freq_mhz)
+                    raise Exception(f"ITURHFProp failed for {path_type}")
+                ctx.set_int(PD_HOUR, hour - 1)
+                ctx.set_double(PD_FREQ, freq_mhz)
+                ctx.set_double(PD_RX_LAT, rx[0] * DEG2RAD)
+                ctx.set_double(PD_RX_LNG, rx[1] * DEG2RAD)
+                rc = self.p533.P533(ctx.buf)
+                if rc != RTN_P533OK:
+                    logger.error("ITURHFProp failed for %s: P533 rc=%s", path_type, rc)
+                    raise Exception(f"ITURHFProp failed for {path_type}")
+                use_ocr = profile["use_ocr"]
+                results.append({
+                    "snr": round(ctx.get_double(PD_SNRXX), 2),
+                    "bcr": round(ctx.get_double(PD_BCR), 2),
+                    "ocr": round(ctx.get_double(PD_OCR), 2) if use_ocr else None,
+                    "sir": round(ctx.get_double(PD_SIR), 2) if use_ocr else None,
+                })
+            return results
+
+    def _run(self, path_type: str, tx, dt, ssn: int, profile: dict, cells) -> list:
+        with self.slots.slot() if self.slots else contextlib.nullcontext():
+            return self._compute(path_type, tx, dt, ssn, profile, cells)
+
+    async def predict_async(self, path_type: str, tx, rx, dt, ssn: int, freq_mhz: float, profile: dict) -> dict:
+        cells = [(rx, dt.hour or 24, freq_mhz)]
+        async with self.slots.slot_async() if self.slots else contextlib.nullcontext():
+            values = await asyncio.to_thread(self._compute, path_type, tx, dt, ssn, profile, cells)
+        return values[0]
+
+    def predict(self, path_type: str, tx, rx, dt, ssn: int, freq_mhz: float, profile: dict) -> dict:
+        # 00 UTC es la hora 24 de ITURHFProp
+        return self._run(path_type, tx, dt, ssn, profile, [(rx, dt.hour or 24, freq_mhz)])[0]
+
+    def predict_area(self, path_type: str, tx, area, dt, ssn: int, freq_mhz: float, profile: dict) -> list:
+        """Toda la rejilla con un mismo contexto → [(lat, lng, values), ...]."""
+        lats, lngs = grid_axes(area)
+        points = [(lat, lng) for lat in lats for lng in lngs]
+        values = self._run(path_type, tx, dt, ssn, profile,
+                           [(rx, dt.hour or 24, freq_mhz) for rx in points])
+        return [(lat, lng, v) for (lat, lng), v in zip(points, values)]
+
+    def predict_vector(self, path_type: str, tx, rx, dt, ssn: int, freqs, hours, profile: dict) -> list:
+        """Todas las horas × frecuencias con un mismo contexto → [(hour, freq_mhz, values), ...]."""
+        points = [(h, f) for h in hours for f in freqs]
+        values = self._run(path_type, tx, dt, ssn, profile, [(rx, h, f) for h, f in points])
+        return [(h, f, v) for (h, f), v in zip(points, values)]
+
+
+def create_engine(cfg: dict, slots=None):
+    """
+    Crea el motor según config.yaml -> iturhfprop (engine, binary, data_path,
+    p533_path); slots limita los cálculos simultáneos. Si el motor de
+    librería no carga (librerías, build o datos), se usa el subproceso.
+    """
+    cfg = cfg or {}
+    data_path = cfg.get("data_path", DEFAULT_DATA_PATH)
+    if cfg.get("engine", "subprocess") == "library":
+        try:
+            engine = LibraryEngine(cfg.get("p533_path", DEFAULT_P533_PATH), data_path, slots)
+            logger.info("ITURHFProp engine: library (en proceso)")
+            return engine
+        except Exception:
+            logger.exception("ITURHFProp library engine unavailable, using subprocess")
+    engine = SubprocessEngine(cfg.get("binary", DEFAULT_BINARY), data_path, slots)
+    logger.info("ITURHFProp engine: subprocess")
+    return engine
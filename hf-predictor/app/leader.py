@@ -0,0 +1,181 @@
+# app/leader.py
+"""
+Elección de líder entre procesos con leases en Redis.
+
+Con uvicorn --workers N (o varios contenedores) hay tareas que deben correr
+en un único proceso: las sesiones telnet del RBN, el constructor de tablas.
+Cada candidato intenta quedarse con la clave del lease; el que la tiene la
+renueva cada renew_s y, si el proceso muere, el lease caduca en ttl_s y otro
+candidato toma el relevo.
+
+  leader:<nombre>   STRING  "<host>-<pid>-<id>"   PX ttl_s
+
+La renovación y la liberación comprueban el dueño con WATCH/MULTI: nunca se
+alarga ni borra el lease de otro. Si no se puede renovar antes de que caduque
+(Redis caído, proceso congelado), el líder se da por depuesto y la tarea
+recibe stop antes de que otro proceso pueda arrancarla. El cliente de Redis
+de las elecciones tiene timeouts de socket muy por debajo del TTL y sin
+reintentos: una renovación que no responde a tiempo depone al líder en el
+acto, en vez de dejar la tarea viva con el lease ya en manos de otro.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+_cfg = (CONFIG.get("process", {}) or {}).get("leader", {}) or {}
+TTL_S = float(_cfg.get("ttl_s", 15))
+RENEW_S = float(_cfg.get("renew_s", 5))
+# Una renovación son 3 idas y vueltas (WATCH+GET, MULTI/EXEC): renew_s + 3 × timeout < ttl_s
+SOCKET_TIMEOUT_S = min(float(_cfg.get("socket_timeout_s", 2)), TTL_S / 6)
+
+REDIS_HOST = CONFIG["redis"]["host"]
+REDIS_PORT = CONFIG["redis"]["port"]
+r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True,
+                socket_timeout=SOCKET_TIMEOUT_S, socket_connect_timeout=SOCKET_TIMEOUT_S,
+                retry=Retry(NoBackoff(), 0))
+
+OWNER = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class LeaderElection:
+    """
+    Candidatura a un lease con nombre. Con run, al ganar se arranca
+    run(stop) en un hilo; stop se activa al perder el lease (la tarea debe
+    terminar) y, tras recuperarlo, se vuelve a arrancar. Sin run, basta con
+    consultar is_leader.
+    """
+
+    def __init__(self, name: str, run=None, ttl_s: float = None, renew_s: float = None):
+        self.name = name
+        self.key = f"leader:{name}"
+        self.owner = OWNER
+        self._run = run
+        self.ttl_s = float(ttl_s or TTL_S)
+        self.renew_s = min(float(renew_s or RENEW_S), self.ttl_s / 3)
+        self._stop = None
+        self._task = None
+        self._leader_until = 0.0   # monotonic hasta el que el lease es nuestro con seguridad
+        self._started = False
+        self.holder = None
+        self.elected = 0
+        self.lost = 0
+        self.errors = 0
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._leader_until
+
+    # ------------- lease -------------
+
+    def _acquire(self) -> bool:
+        return bool(r.set(self.key, self.owner, nx=True, px=int(self.ttl_s * 1000)))
+
+    def _if_owner(self, action) -> bool:
+        """Aplica action(pipe) solo si el lease sigue siendo nuestro (WATCH/MULTI)."""
+        with r.pipeline() as pipe:
+            try:
+                pipe.watch(self.key)
+                if pipe.get(self.key) != self.owner:
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                action(pipe)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    def _renew(self) -> bool:
+        return self._if_owner(lambda pipe: pipe.pexpire(self.key, int(self.ttl_s * 1000)))
+
+    def release(self):
+        """Cede el lease (parada ordenada): otro candidato lo toma sin esperar al TTL."""
+        self._depose(lost=False)
+        try:
+            self._if_owner(lambda pipe: pipe.delete(self.key))
+        except Exception:
+            pass
+
+    # ------------- ciclo -------------
+
+    def _elect(self, since: float):
+        self._leader_until = since + self.ttl_s
+        self.holder = self.owner
+        self.elected += 1
+        logger.info("👑 %s: líder este proceso (%s)", self.name, self.owner)
+        if self._run is not None:
+            self._stop = threading.Event()
+            self._task = threading.Thread(target=self._run, args=(self._stop,), name=f"leader-{self.name}",
+                                          daemon=True)
+            self._task.start()
+
+    def _depose(self, lost: bool = True):
+        if self._leader_until == 0.0:
+            return
+        self._leader_until = 0.0
+        if self._stop is not None:
+            self._stop.set()
+        if lost:
+            self.lost += 1
+            logger.warning(f"⚠️ {self.name}: lease perdido, tarea detenida")
+        else:
+            logger.info("%s: lease cedido", self.name)
+
+    def _cycle(self):
+        t0 = time.monotonic()
+        if self._leader_until:
+            if self._renew():
+                self._leader_until = t0 + self.ttl_s
+            else:
+                self._depose()
+        # Tras una pérdida, la tarea anterior debe haber terminado antes de volver a competir
+        if not self._leader_until and (self._task is None or not self._task.is_alive()):
+            if self._acquire():
+                self._elect(t0)
+                return
+        if not self._leader_until:
+            self.holder = r.get(self.key)
+
+    def run_forever(self):
+        while True:
+            try:
+                self._cycle()
+            except redis.TimeoutError:
+                self.errors += 1
+                # Sin respuesta no se sabe si el lease sigue siendo nuestro: se deja de ser líder ya
+                logger.warning(f"⚠️ {self.name}: timeout con Redis")
+                self._depose()
+            except Exception:
+                self.errors += 1
+                logger.exception("leader %s: error en el ciclo", self.name)
+                # Sin Redis no se puede renovar: al agotar el lease se deja de ser líder
+                if self._leader_until and time.monotonic() >= self._leader_until - self.renew_s:
+                    self._depose()
+            time.sleep(self.renew_s)
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        threading.Thread(target=self.run_forever, name=f"election-{self.name}", daemon=True).start()
+        logger.info("🧵 Candidatura a líder '%s' arrancada.", self.name)
+
+    def stats(self) -> dict:
+        return {
+            "leader": self.is_leader,
+            "holder": self.holder,
+            "elected": self.elected,
+            "lost": self.lost,
+            "errors": self.errors,
+        }
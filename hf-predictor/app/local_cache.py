@@ -0,0 +1,86 @@
+# app/local_cache.py
+"""
+Cache en proceso (LRU + TTL) delante de Redis para las predicciones.
+
+El conjunto caliente es pequeño: la mayoría de peticiones se resuelven sin
+salir del proceso y Redis queda para compartir entre workers.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from config import CONFIG
+
+_MISSING = object()
+
+
+class LocalCache:
+    def __init__(self, max_entries: int = 5000, ttl_s: float = 60.0):
+        self.max_entries = int(max_entries)
+        self.ttl_s = float(ttl_s)
+        self._data = OrderedDict()   # key → (expira_monotonic, valor)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            expires, value = item
+            if expires <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl_s: float = None):
+        """Guarda value; el TTL efectivo nunca supera el configurado."""
+        if self.max_entries <= 0:
+            return
+        ttl = self.ttl_s if ttl_s is None else min(float(ttl_s), self.ttl_s)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+_cfg = CONFIG.get("local_cache", {}) or {}
+predictions = LocalCache(
+    max_entries=_cfg.get("max_entries", 5000) if _cfg.get("enabled", True) else 0,
+    ttl_s=_cfg.get("ttl_s", 60),
+)
@@ -0,0 +1,266 @@
+# app/log_pipeline.py
+"""
+Logging de bajo coste.
+
+- setup_logging(): el root logger solo encola el LogRecord (QueueHandler);
+  formateo y escritura a stdout los hace un hilo (QueueListener). Cola
+  acotada: si se llena se descartan registros y se cuentan, nunca se bloquea
+  una petición. Nivel por subsistema y muestreo de INFO/DEBUG por subsistema
+  (los WARNING y superiores pasan siempre).
+- Volcados del motor (deck de ITURHFProp) solo bajo demanda: por petición
+  (cabecera X-Debug: 1 o ?debug=1) o globalmente con logging.engine_dumps.
+- PredictionLogWriter: /data/hf_predictions.log con el fichero abierto una
+  vez, escritura por lotes desde un hilo y rotación por tamaño.
+"""
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+from collections import deque
+from contextvars import ContextVar
+
+from config import CONFIG
+
+_cfg = CONFIG.get("logging", {}) or {}
+
+# ------------------ Cola de logging ------------------
+
+_IMMUTABLE = (str, int, float, bool, type(None))
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Encola sin formatear y descarta (contando) si la cola está llena."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Los args mutables se resuelven ya (podrían cambiar antes de que el
+        # hilo formatee); con args inmutables el formateo completo va al hilo.
+        if record.args and not all(isinstance(a, _IMMUTABLE) for a in record.args):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar una fracción de los registros < WARNING de los loggers configurados."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = {name: float(rate) for name, rate in (rates or {}).items()}
+        self.sampled_out = 0
+
+    def _rate(self, name: str):
+        while name:
+            rate = self.rates.get(name)
+            if rate is not None:
+                return rate
+            name = name.rpartition(".")[0]
+        return None
+
+    def filter(self, record) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        if rate is None or rate >= 1.0 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+_listener = None
+_queue_handler = None
+_sampler = None
+
+
+def setup_logging():
+    """Sustituye los handlers del root por la cola (idempotente)."""
+    global _listener, _queue_handler, _sampler
+    if _listener is not None:
+        return
+    fmt = logging.Formatter(_cfg.get("format", "%(levelname)s:%(name)s:%(message)s"))
+    out = logging.StreamHandler()
+    out.setFormatter(fmt)
+
+    q = queue.Queue(maxsize=int(_cfg.get("queue_size", 10000)))
+    _queue_handler = _DroppingQueueHandler(q)
+    _sampler = SamplingFilter(_cfg.get("sample"))
+    _queue_handler.addFilter(_sampler)
+
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    root.addHandler(_queue_handler)
+    root.setLevel(_cfg.get("level", "INFO"))
+    for name, level in (_cfg.get("levels") or {}).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(q, out, respect_handler_level=True)
+    _listener.start()
+
+
+def log_stats() -> dict:
+    return {
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": _DroppingQueueHandler.dropped,
+        "sampled_out": _sampler.sampled_out if _sampler else 0,
+    }
+
+
+# ------------------ Volcados del motor bajo demanda ------------------
+
+# Se activa por petición (DebugFlagMiddleware); engine_pool copia el contexto a sus hilos
+DEBUG_DUMPS = ContextVar("debug_dumps", default=False)
+ENGINE_DUMPS = bool(_cfg.get("engine_dumps", False))
+
+# Logger propio: no le afectan el nivel ni el muestreo del subsistema
+dump_logger = logging.getLogger("dumps")
+dump_logger.setLevel(logging.INFO)
+
+
+def debug_dumps() -> bool:
+    return ENGINE_DUMPS or DEBUG_DUMPS.get()
+
+
+def _debug_requested(scope) -> bool:
+    for k, v in scope.get("headers") or ():
+        if k == b"x-debug":
+            return v not in (b"", b"0", b"false")
+    qs = scope.get("query_string") or b""
+    return b"debug=1" in qs or b"debug=true" in qs
+
+
+class DebugFlagMiddleware:
+    """Middleware ASGI: con cabecera X-Debug: 1 (o ?debug=1) activa los volcados en esa petición."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _debug_requested(scope):
+            return await self.app(scope, receive, send)
+        token = DEBUG_DUMPS.set(True)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            DEBUG_DUMPS.reset(token)
+
+
+# ------------------ Log de predicciones ------------------
+
+class PredictionLogWriter:
+    """
+    Escritor en lote con rotación por tamaño. write() solo añade a una cola en
+    memoria; un hilo vuelca cada flush_interval_s (o al llegar a batch_max
+    líneas) con el fichero abierto de forma persistente.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, backup_count: int = 5,
+                 flush_interval_s: float = 1.0, batch_max: int = 500, max_pending: int = 100000):
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.backup_count = int(backup_count)
+        self.flush_interval_s = float(flush_interval_s)
+        self.batch_max = int(batch_max)
+        self._pending = deque(maxlen=int(max_pending))
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._f = None
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rotations = 0
+        self.errors = 0
+
+    def write(self, lines):
+        if self._thread is None:
+            self._start()
+        with self._lock:
+            overflow = len(self._pending) + len(lines) - self._pending.maxlen
+            if overflow > 0:
+                self.dropped += overflow
+            self._pending.extend(lines)
+            full = len(self._pending) >= self.batch_max
+        if full:
+            self._wake.set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="prediction-log", daemon=True)
+                self._thread.start()
+
+    def _take(self) -> list:
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+        return lines
+
+    def _rotate(self):
+        self._f.close()
+        self._f = None
+        for i in range(self.backup_count - 1, 0, -1):
+            src, dst = f"{self.path}.{i}", f"{self.path}.{i + 1}"
+            if os.path.exists(src):
+                os.replace(src, dst)
+        if self.backup_count > 0:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+
+    def flush(self):
+        lines = self._take()
+        if not lines:
+            return
+        try:
+            if self._f is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._f = open(self.path, "a", buffering=1024 * 1024)
+            self._f.write("\n".join(lines) + "\n")
+            self._f.flush()
+            self.written += len(lines)
+            self.batches += 1
+            if self.max_bytes > 0 and self._f.tell() >= self.max_bytes:
+                self._rotate()
+        except Exception as e:
+            self.errors += 1
+            logging.getLogger(__name__).warning(f"⚠️ Error writing to {self.path}: {e}")
+            if self._f is not None:
+                try:
+                    self._f.close()
+                except Exception:
+                    pass
+                self._f = None
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            self.flush()
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "written": self.written, "dropped": self.dropped,
+                "batches": self.batches, "rotations": self.rotations, "errors": self.errors}
+
+
+_plog_cfg = _cfg.get("prediction_log", {}) or {}
+prediction_log = PredictionLogWriter(
+    _plog_cfg.get("path", "/data/hf_predictions.log"),
+    max_bytes=int(_plog_cfg.get("max_mb", 50)) * 1024 * 1024,
+    backup_count=_plog_cfg.get("backup_count", 5),
+    flush_interval_s=_plog_cfg.get("flush_interval_s", 1.0),
+    batch_max=_plog_cfg.get("batch_max", 500),
+)
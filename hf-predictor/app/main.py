@@ -1,54 +1,152 @@
 # app/main.py
 
-import os
-import json
-import time
+import asyncio
 import logging
-from datetime import datetime, timezone
+import time
+from datetime import datetime
+from typing import List, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from pydantic import BaseModel
 
-from predict_from_spots import start_spot_predictor
-from telnet_rbn import start_telnet_sessions
-from hf_utils import lookup_coords, run_iturhfprop
+from predict_from_spots import predictor_stats
+from telnet_rbn import ingest_stats
+from path_matrix import matrices as path_matrices
+from warmer import active_users, warmer
+from hf_utils import lookup_coords, prefix_index, prefix_source, spacewx
+import roles
+from engine_pool import gate as engine_gate, pool as engine_pool, slots as engine_slots
+from local_cache import predictions as local_cache
+import metrics
+from log_pipeline import DebugFlagMiddleware, log_stats, prediction_log, setup_logging
+import spot_store
+from observed import (
+    ANSWER_WHEN_DENSE, ENABLED as OBSERVED_ENABLED, grid as observed_grid, observed_prediction,
+)
+from singleflight import flights
+from prediction import (
+    COORD_DECIMALS, compute_sp_lp_async, get_prediction_with_cache_async, is_digital,
+    norm_mode, prefill_area_async, request_deadline, revalidator, run_in_gate, to_float_coords, to_mhz,
+)
 from config import CONFIG
 
-import redis
-
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# /predict con deadline del llamante (cabecera o campo deadline_ms)
+_prog_cfg = CONFIG.get("progressive", {}) or {}
+PROGRESSIVE_ENABLED = bool(_prog_cfg.get("enabled", True))
+DEADLINE_HEADER = _prog_cfg.get("header", "X-Deadline-Ms")
+DEADLINE_MARGIN_S = float(_prog_cfg.get("margin_ms", 30)) / 1000.0
+MAX_DEADLINE_S = float(_prog_cfg.get("max_deadline_s", 5))
+ESTIMATE_ENABLED = bool(_prog_cfg.get("estimate", True))
+
 app = FastAPI()
+app.add_middleware(DebugFlagMiddleware)
+
+# Stats ya existentes → series Prometheus (se leen en cada scrape)
+_POOL_COUNTERS = ("completed", "rejected", "expired", "failed")
+metrics.register_stats("engine_pool", engine_pool.stats, _POOL_COUNTERS, doc="Pool de ITURHFProp (hilos)")
+metrics.register_stats("engine_gate", engine_gate.stats, _POOL_COUNTERS, doc="Compuerta de ITURHFProp (async)")
+metrics.register_stats("engine_slots", engine_slots.stats, ("waits",), doc="Procesos ITURHFProp simultáneos (límite común)")
+metrics.register_stats("local_cache", local_cache.stats, ("hits", "misses", "evictions", "expirations"),
+                       doc="Cache en proceso")
+metrics.register_stats("rbn_ingest", ingest_stats,
+                       ("lines", "spots", "parse_failures", "ignored", "published", "publish_errors", "reconnects"),
+                       label="session", doc="Ingesta telnet RBN")
+metrics.register_stats("rbn_predictor", predictor_stats,
+                       ("read", "received", "coalesced", "dropped", "computed", "cache_hits", "busy", "failed",
+                        "stored", "acked", "reclaimed"), doc="Consumidor del stream RBN")
+metrics.register_stats("observed", observed_grid.stats, ("observations",), doc="Rejilla observada")
+metrics.register_stats("warmer", warmer.stats,
+                       ("scheduled", "deduped", "dropped", "skipped_busy", "jobs", "area_paths", "path_runs", "failed"),
+                       doc="Precalentamiento de cache")
+metrics.register_stats("path_matrix", path_matrices.stats,
+                       ("hits", "misses", "scheduled", "dropped", "built", "failed"),
+                       doc="Matrices banda × hora por camino")
+metrics.register_stats("singleflight", flights.stats,
+                       ("leaders", "followers", "notifications", "notified", "listener_errors"),
+                       doc="Singleflight de predicciones")
+metrics.register_stats("swr", revalidator.stats,
+                       ("scheduled", "deduped", "dropped", "deferred_busy", "refreshed", "failed"),
+                       doc="Revalidación de entradas caducadas")
+metrics.register_stats("leader", lambda: roles.stats()["leaders"], ("elected", "lost", "errors"),
+                       label="name", doc="Leases de tareas únicas entre procesos")
+metrics.register_stats("spot_trim", spot_store.trim_stats, ("runs", "trimmed", "backlog_runs", "errors"),
+                       doc="Recorte de spots caducados")
+metrics.register_stats("spacewx", spacewx.stats, ("refreshes", "errors"), doc="Meteorología espacial")
+metrics.register_stats("prefixes", prefix_source.stats, ("hits", "misses", "reloads", "errors"),
+                       doc="Índice de prefijos")
+metrics.register_stats("log", log_stats, ("dropped", "sampled_out"), doc="Cola de logging")
+metrics.register_stats("prediction_log", prediction_log.stats, ("written", "dropped", "batches", "rotations", "errors"),
+                       doc="Log de predicciones")
 
 @app.on_event("startup")
 def startup_event():
-    start_telnet_sessions()
-    start_spot_predictor()
+    # Solo los hilos de los roles de este proceso (PROCESS_ROLES / process.roles)
+    roles.start_roles()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    roles.stop_roles()
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
-# ------------------ Config cache/binning ------------------
-
-# Redis
-REDIS_HOST = os.getenv("REDIS_HOST", "redis")
-REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
-r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
-
-# TTL cache principal
-CACHE_EXPIRE = int(os.getenv("CACHE_EXPIRE", "600"))  # 10 min por defecto
-
-# Binning para maximizar hits de cache sin perder utilidad operativa
-FREQ_BIN_MHZ = float(os.getenv("FREQ_BIN_MHZ", "1.0"))  # agrupa por 1 MHz
-TIME_BIN_MIN = int(os.getenv("TIME_BIN_MIN", "15"))     # agrupa por 15 min
-COORD_DECIMALS = int(os.getenv("COORD_DECIMALS", "2"))  # 2 decimales ~1-2 km
-
-# Versión de esquema de clave (si cambias binning o formato, súbela)
-CACHE_KEY_VER = "v2"
-
-DIGITAL_MODES = {"DIGITAL", "FT8", "FT4", "RTTY", "PSK", "CW"}
+@app.get("/process/stats")
+def process_stats():
+    """Roles de este proceso y estado de sus leases (quién es líder de cada tarea única)."""
+    return roles.stats()
+
+@app.get("/spacewx")
+def spacewx_stats():
+    """Instantánea de meteorología espacial que usan las predicciones (F10.7, Kp, SSN, frescura)."""
+    return spacewx.stats()
+
+@app.get("/engine/stats")
+def engine_stats():
+    """Profundidad de cola y contadores del pool de ITURHFProp (hilos y async) y procesos en curso."""
+    return {"pool": engine_pool.stats(), "async": engine_gate.stats(), "processes": engine_slots.stats()}
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Contadores de la cache en proceso (LRU) delante de Redis."""
+    return local_cache.stats()
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Métricas en formato de exposición de Prometheus."""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/rbn/stats")
+def rbn_stats():
+    """Ingesta RBN por sesión (líneas/s, fallos de parseo), workers de predicción y rejilla observada."""
+    return {"ingest": ingest_stats(), "predictor": predictor_stats(), "observed": observed_grid.stats()}
+
+@app.get("/warmer/stats")
+def warmer_stats():
+    """Usuarios activos y contadores del precalentamiento de cache."""
+    return warmer.stats()
+
+@app.get("/prefixes/stats")
+def prefixes_stats():
+    """Fuente del índice de prefijos (cty.dat/artefacto/JSON), tamaño y recargas."""
+    return prefix_source.stats()
+
+@app.get("/callsign/{callsign}")
+def callsign_info(callsign: str):
+    """QTH del indicativo (exacto o prefijo) con zonas CQ/ITU, continente y entidad si la fuente los trae."""
+    info = prefix_index.lookup_info(callsign)
+    if info is None:
+        raise HTTPException(404, "No prefix match")
+    return {"callsign": callsign.upper(), **info}
+
+@app.post("/admin/prefixes/reload")
+async def reload_prefixes():
+    """Recarga en caliente de los prefijos: sin reiniciar la API ni perder sus caches."""
+    return await asyncio.to_thread(prefix_source.reload, True)
 
 # ------------------ Modelos ------------------
 
@@ -60,6 +158,20 @@ class PredictionInput(BaseModel):
     mode: str = "ANALOG"
     timestamp: str            # ISO 8601
     comment: str = ""         # comentario original opcional
+    deadline_ms: Optional[int] = None   # ← lo que esperará el llamante (o cabecera X-Deadline-Ms)
+
+class BatchPredictionInput(BaseModel):
+    callsign_spotter: str     # ← quien hizo el spot
+    callsign_dx: str          # ← el DX
+    frequency: float
+    mode: str = "ANALOG"
+    timestamp: str            # ISO 8601
+    comment: str = ""         # comentario original opcional
+    users: List[str]          # ← usuarios conectados a los que se difunde el spot
+
+class ActiveUsersInput(BaseModel):
+    users: List[str]          # ← usuarios conectados en DXSpider
+    replace: bool = False     # True: la lista sustituye a la anterior (conectados ahora)
 
 # ------------------ Utilidades de formato ------------------
 
@@ -95,136 +207,80 @@ def format_dxspider_compact(sp_rel: int, lp_rel: int, suffix_comment: str = "")
         return f"{pred_str} {suffix_comment}".strip()[:80]
     return pred_str[:80]
 
-# ------------------ Normalización, frecuencia y claves de cache ------------------
-
-def _is_digital(mode: str) -> bool:
-    return (mode or "").upper() in DIGITAL_MODES
-
-def _norm_mode(mode: str) -> str:
-    return "DIGITAL" if _is_digital(mode) else "ANALOG"
-
-def _to_mhz(freq: float) -> float:
-    """Si parece kHz (>1000), convierte a MHz; si ya es MHz, deja igual."""
-    f = float(freq)
-    if f > 1000.0:
-        # Mensaje solo a nivel debug para no ensuciar logs
-        logger.debug("Convirtiendo frecuencia de kHz a MHz: %.3f kHz -> %.3f MHz", f, f / 1000.0)
-        return f / 1000.0
-    return f
-
-def _freq_bin_mhz(f_mhz: float) -> float:
-    # Redondeo al múltiplo más cercano de 1 MHz (o del paso configurado)
-    step = FREQ_BIN_MHZ if FREQ_BIN_MHZ > 0 else 1.0
-    binned = round(round(float(f_mhz) / step) * step, 0)
-    return float(binned)
-
-def _time_bin(dt: datetime) -> str:
-    # Devuelve cadena YYYYMMDDTHHZ al múltiplo inferior de TIME_BIN_MIN
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=timezone.utc)
-    dt = dt.astimezone(timezone.utc)
-    minute = (dt.minute // TIME_BIN_MIN) * TIME_BIN_MIN
-    dtb = dt.replace(minute=minute, second=0, microsecond=0)
-    return dtb.strftime("%Y%m%dT%H%MZ")
-
-def _cache_key(src_lat, src_lon, dst_lat, dst_lon, f_mhz: float, mode: str, dt: datetime) -> str:
-    # Asegura floats aunque vengan como str
+# ------------------ Utilidades de petición ------------------
+
+def _parse_timestamp(ts: str) -> datetime:
     try:
-        src_lat = float(src_lat); src_lon = float(src_lon)
-        dst_lat = float(dst_lat); dst_lon = float(dst_lon)
+        return datetime.fromisoformat(ts.replace("Z", "+00:00"))
     except Exception:
-        raise HTTPException(400, "Invalid coordinates (not numeric)")
-
-    fz = _freq_bin_mhz(f_mhz)
-    tz = _time_bin(dt)
-    mod = _norm_mode(mode)
-
-    fmt = f"{{:.{COORD_DECIMALS}f}}"
-    s_lat = fmt.format(src_lat); s_lon = fmt.format(src_lon)
-    d_lat = fmt.format(dst_lat); d_lon = fmt.format(dst_lon)
-    return f"pred:{CACHE_KEY_VER}:{s_lat},{s_lon}->{d_lat},{d_lon}:{fz:.0f}MHz:{mod}:{tz}"
-
-# ------------------ Núcleo: cache + singleflight ------------------
-
-def _to_float_coords(coords):
-    # coords puede venir como ('41.12','2.22') → devuelve (41.12, 2.22)
-    return (float(coords[0]), float(coords[1]))
+        raise HTTPException(400, "Invalid timestamp")
 
-def _compute_sp_lp(src_coords, dst_coords, dt: datetime, freq_mhz: float, mode: str) -> dict:
+def _caller_deadline(request: Request, deadline_ms: Optional[int] = None):
     """
-    Ejecuta ITURHFProp dos veces (SP/LP) y devuelve:
-    {
-      "short_path": {"snr": int, "reliability": int},
-      "long_path":  {"snr": int, "reliability": int}
-    }
+    (deadline monotónico, progresivo). Con deadline del llamante se responde
+    margin_ms antes y en modo progresivo; sin él, el deadline por defecto.
     """
-    short_path = run_iturhfprop("SHORTPATH", src_coords, dst_coords, dt, freq_mhz, mode)
-    long_path  = run_iturhfprop("LONGPATH",  src_coords, dst_coords, dt, freq_mhz, mode)
-    return {"short_path": short_path, "long_path": long_path}
-
-def get_prediction_with_cache(src_coords, dst_coords, dt: datetime, freq_mhz: float, mode: str):
+    raw = request.headers.get(DEADLINE_HEADER)
+    if raw is not None:
+        try:
+            deadline_ms = int(float(raw))
+        except ValueError:
+            raise HTTPException(400, f"Invalid {DEADLINE_HEADER}")
+    if deadline_ms is None:
+        return request_deadline(), False
+    budget = min(max(0.0, deadline_ms / 1000.0), MAX_DEADLINE_S)
+    return request_deadline(max(0.0, budget - DEADLINE_MARGIN_S)), PROGRESSIVE_ENABLED
+
+# ------------------ Spots humanos: almacenamiento y log ------------------
+
+async def _store_human_spot(callsign_spotter: str, callsign_dx: str, dx_coords, dt: datetime, freq_mhz: float,
+                      deadline: float = None):
+    """Predicción spotter→dx (cacheada) y objeto combinado en Redis. Best-effort."""
+    cfg = CONFIG.get("human_spot", {})
+    if not cfg.get("enabled", True):
+        return
+    spotter_coords = lookup_coords(callsign_spotter)
+    if not spotter_coords or not dx_coords:
+        return
+    spotter_coords = to_float_coords(spotter_coords)
+    try:
+        sp_pred, _ = await get_prediction_with_cache_async(spotter_coords, dx_coords, dt, freq_mhz, "ANALOG",
+                                                           deadline=deadline)
+    except HTTPException as e:
+        # No debe tumbar la respuesta al usuario, que ya está calculada
+        logger.debug("Human spot %s->%s sin predicción: %s", callsign_spotter, callsign_dx, e.detail)
+        return
+
+    # Modo real no conocido
+    await spot_store.store_async([spot_store.make_record("human", callsign_spotter, callsign_dx, freq_mhz, "", dt,
+                                                         sp_pred, cfg.get("ttl_minutes", 10) * 60)])
+
+def _log_human_predictions(user_predictions, callsign_spotter: str, callsign_dx: str,
+                           freq_mhz: float, comment: str, timestamp: str):
     """
-    Lee de cache por clave normalizada. Si no existe:
-    - Usa lock distribuido de Redis para que solo 1 proceso calcule (singleflight).
-    - El resto espera resultado en cache (poll ligero) sin recálculo.
-    Devuelve (prediction_dict, cached_bool).
+    Loguea en fichero (formato COMPLETO) si está habilitado.
+    user_predictions: [(callsign_user, prediction), ...] → se encolan al escritor por lotes.
     """
-    # Asegura que trabajamos con floats siempre
-    src_coords = _to_float_coords(src_coords)
-    dst_coords = _to_float_coords(dst_coords)
-
-    key = _cache_key(src_coords[0], src_coords[1],
-                     dst_coords[0], dst_coords[1],
-                     freq_mhz, mode, dt)
-
-    cached = r.get(key)
-    if cached:
-        return json.loads(cached), True
-
-    # Singleflight con Redis Lock
-    lock = r.lock(f"lock:{key}", timeout=30, blocking_timeout=5)
-    got = False
-    try:
-        got = lock.acquire(blocking=True)
-        if got:
-            # Doble-check de cache tras adquirir el lock
-            cached2 = r.get(key)
-            if cached2:
-                return json.loads(cached2), True
-
-            result = _compute_sp_lp(src_coords, dst_coords, dt, freq_mhz, mode)
-            r.setex(key, CACHE_EXPIRE, json.dumps(result))
-            return result, False
-        else:
-            # No adquirida: esperar a que aparezca en cache hasta 5s
-            deadline = time.time() + 5.0
-            while time.time() < deadline:
-                val = r.get(key)
-                if val:
-                    return json.loads(val), True
-                time.sleep(0.05)
-            # Último intento: si seguimos sin valor, calculamos nosotros
-            got2 = lock.acquire(blocking=False)
-            if got2:
-                try:
-                    result = _compute_sp_lp(src_coords, dst_coords, dt, freq_mhz, mode)
-                    r.setex(key, CACHE_EXPIRE, json.dumps(result))
-                    return result, False
-                finally:
-                    lock.release()
-            raise HTTPException(503, "Prediction busy, try again")
-    finally:
-        if got:
-            try:
-                lock.release()
-            except Exception:
-                pass
+    cfg = CONFIG.get("human_spot", {})
+    if not cfg.get("log_predictions", False) or not user_predictions:
+        return
+    lines = []
+    for callsign_user, prediction in user_predictions:
+        comment_for_log = format_dxspider_comment(
+            comment,
+            prediction["short_path"]["snr"], prediction["short_path"]["reliability"],
+            prediction["long_path"]["snr"],  prediction["long_path"]["reliability"]
+        )
+        lines.append(f"{callsign_user}> DX de {callsign_spotter}:  {freq_mhz}  {callsign_dx}  {comment_for_log}  {timestamp}")
+    prediction_log.write(lines)
+    logger.debug("📝 Spot humano %s→%s: %d líneas al log de predicciones", callsign_spotter, callsign_dx, len(lines))
 
 # ------------------ Endpoints ------------------
 
 @app.post("/predict")
-def predict(req: PredictionInput):
+async def predict(req: PredictionInput, request: Request):
     logger.info("📥 API /predict recibió: %s", req.dict())
+    deadline, progressive = _caller_deadline(request, req.deadline_ms)
 
     # 1. Predicción para devolver (user → dx)
     user_coords = lookup_coords(req.callsign_user)
@@ -233,21 +289,41 @@ def predict(req: PredictionInput):
         raise HTTPException(400, "No coords for one callsign")
 
     # Fuerza floats
-    user_coords = _to_float_coords(user_coords)
-    dx_coords   = _to_float_coords(dx_coords)
+    user_coords = to_float_coords(user_coords)
+    dx_coords   = to_float_coords(dx_coords)
 
     # timestamp
-    try:
-        dt = datetime.fromisoformat(req.timestamp.replace("Z", "+00:00"))
-    except Exception:
-        raise HTTPException(400, "Invalid timestamp")
+    dt = _parse_timestamp(req.timestamp)
 
     # Frecuencia en MHz (convierte si viene en kHz)
-    freq_mhz = _to_mhz(req.frequency)
-    mode_norm = _norm_mode(req.mode)
+    freq_mhz = to_mhz(req.frequency)
+    mode_norm = norm_mode(req.mode)
+
+    # Precalentamiento: el resto de usuarios pedirá este DX en esta banda
+    active_users.touch(req.callsign_user)
+    warmer.schedule(dx_coords, freq_mhz, mode_norm, dt)
 
-    # Cache + singleflight
-    prediction, was_cached = get_prediction_with_cache(user_coords, dx_coords, dt, freq_mhz, mode_norm)
+    # Canal observado (SNR de skimmers RBN): si es denso, responde sin ITURHFProp
+    observed = observed_grid.query(user_coords, dx_coords, freq_mhz, dt) if OBSERVED_ENABLED else None
+    if observed and observed["dense"] and ANSWER_WHEN_DENSE:
+        prediction, was_cached = observed_prediction(observed), True
+    else:
+        # Cache + singleflight (progresivo: SP con LP pendiente si no da tiempo a ambos)
+        try:
+            prediction, was_cached = await get_prediction_with_cache_async(user_coords, dx_coords, dt, freq_mhz,
+                                                                           mode_norm, deadline=deadline,
+                                                                           progressive=progressive)
+        except HTTPException as e:
+            if not progressive:
+                raise
+            # Ni SP a tiempo: estimación con el canal observado, aunque no sea denso
+            if e.status_code != 503 or not (ESTIMATE_ENABLED and observed):
+                metrics.PROGRESSIVE.labels("busy").inc()
+                raise
+            prediction, was_cached = {**observed_prediction(observed), "estimate": True}, False
+        if progressive:
+            metrics.PROGRESSIVE.labels("estimate" if prediction.get("estimate") else
+                                       "partial" if prediction.get("partial") else "complete").inc()
 
     # → DXSpider: formato compacto + comentario original
     new_comment = format_dxspider_compact(
@@ -257,52 +333,114 @@ def predict(req: PredictionInput):
     )
 
     # 2. Procesar si es humano (reutiliza cache también para spotter→dx)
-    is_human = not _is_digital(req.mode)
-    if is_human:
-        cfg = CONFIG.get("human_spot", {})
-        if cfg.get("enabled", True):
-            spotter_coords = lookup_coords(req.callsign_spotter)
-            if spotter_coords and dx_coords:
-                spotter_coords = _to_float_coords(spotter_coords)
-                sp_pred, _ = get_prediction_with_cache(spotter_coords, dx_coords, dt, freq_mhz, "ANALOG")
-
-                # Guarda objeto combinado (como ya hacías)
-                redis_key = f"spot:human:{req.callsign_spotter}:{req.callsign_dx}:{round(freq_mhz,1)}"
-                r.setex(redis_key, cfg.get("ttl_minutes", 10) * 60, json.dumps({
-                    "spotter": req.callsign_spotter,
-                    "dx": req.callsign_dx,
-                    "frequency": round(freq_mhz, 1),
-                    "mode": "",  # modo real no conocido
-                    "timestamp": dt.isoformat(),
-                    "spotter_coords": spotter_coords,
-                    "dx_coords": dx_coords,
-                    "source": "human",
-                    "prediction": sp_pred
-                }))
-
-        # Loguear en fichero (formato COMPLETO) si está habilitado
-        if cfg.get("log_predictions", False):
-            try:
-                comment_for_log = format_dxspider_comment(
-                    req.comment,
-                    prediction["short_path"]["snr"], prediction["short_path"]["reliability"],
-                    prediction["long_path"]["snr"],  prediction["long_path"]["reliability"]
-                )
-                line = f"{req.callsign_user}> DX de {req.callsign_spotter}:  {freq_mhz}  {req.callsign_dx}  {comment_for_log}  {req.timestamp}"
-                with open("/data/hf_predictions.log", "a") as f:
-                    f.write(line + "\n")
-                logger.info(f"📝 Spot humano logueado: {line}")
-            except Exception as e:
-                logger.warning(f"⚠️ Error writing to log: {e}")
+    if not is_digital(req.mode):
+        await _store_human_spot(req.callsign_spotter, req.callsign_dx, dx_coords, dt, freq_mhz, deadline)
+        _log_human_predictions([(req.callsign_user, prediction)], req.callsign_spotter,
+                               req.callsign_dx, freq_mhz, req.comment, req.timestamp)
 
     return {
         "prediction": prediction,
+        "observed": observed,
         "cached": was_cached,
+        "stale": bool(prediction.get("stale")),
+        "approx": bool(prediction.get("approx")),
+        "partial": bool(prediction.get("partial")),
+        "pending": ["long_path"] if prediction.get("partial") else [],
+        "estimate": bool(prediction.get("estimate")),
         "new_comment": new_comment
     }
 
+@app.post("/predict/batch")
+async def predict_batch(req: BatchPredictionInput):
+    """
+    Fan-out de un spot a todos los usuarios conectados en una sola petición.
+    Agrupa usuarios por coordenadas resueltas y calcula cada camino una vez.
+    Devuelve new_comment para cada usuario (comentario original si no hay coords).
+    """
+    logger.info("📥 API /predict/batch recibió: %s -> %s (%d usuarios)",
+                req.callsign_spotter, req.callsign_dx, len(req.users))
+    deadline = request_deadline()
+
+    dx_coords = lookup_coords(req.callsign_dx)
+    if not dx_coords:
+        raise HTTPException(400, "No coords for DX callsign")
+    dx_coords = to_float_coords(dx_coords)
+
+    dt = _parse_timestamp(req.timestamp)
+    freq_mhz = to_mhz(req.frequency)
+    mode_norm = norm_mode(req.mode)
+
+    # Agrupar usuarios por coordenadas (misma resolución que la clave de cache)
+    groups = {}
+    new_comments = {}
+    for user in req.users:
+        active_users.touch(user)
+        coords = lookup_coords(user)
+        if not coords:
+            new_comments[user] = req.comment
+            continue
+        coords = to_float_coords(coords)
+        gkey = (round(coords[0], COORD_DECIMALS), round(coords[1], COORD_DECIMALS))
+        groups.setdefault(gkey, (coords, []))[1].append(user)
+
+    # Muchos caminos sin cache → una ejecución de área en vez de N
+    await prefill_area_async(dx_coords, [coords for coords, _ in groups.values()], dt, freq_mhz, mode_norm,
+                             deadline)
+
+    # Un cálculo por camino distinto (normalmente ya en cache), todos concurrentes.
+    # Con el deadline ya vencido solo se consulta la cache: calcular no llegaría a tiempo
+    compute = time.monotonic() < deadline
+    results = await asyncio.gather(*(
+        get_prediction_with_cache_async(coords, dx_coords, dt, freq_mhz, mode_norm, deadline=deadline,
+                                        compute=compute)
+        for coords, _ in groups.values()
+    ), return_exceptions=True)
+
+    user_predictions = []
+    cached_paths = 0
+    stale_paths = 0
+    approx_paths = 0
+    for (coords, users), res in zip(groups.values(), results):
+        if isinstance(res, BaseException):
+            if not isinstance(res, HTTPException):
+                logger.warning(f"⚠️ Batch: predicción fallida {coords}->{dx_coords}: {res!r}")
+            # Pool lleno o deadline vencido: estos usuarios reciben el comentario original
+            for user in users:
+                new_comments[user] = req.comment
+            continue
+        prediction, was_cached = res
+        cached_paths += int(was_cached)
+        stale_paths += int(bool(prediction.get("stale")))
+        approx_paths += int(bool(prediction.get("approx")))
+        new_comment = format_dxspider_compact(
+            prediction["short_path"]["reliability"],
+            prediction["long_path"]["reliability"],
+            req.comment
+        )
+        for user in users:
+            new_comments[user] = new_comment
+            user_predictions.append((user, prediction))
+
+    if not is_digital(req.mode):
+        await _store_human_spot(req.callsign_spotter, req.callsign_dx, dx_coords, dt, freq_mhz, deadline)
+        _log_human_predictions(user_predictions, req.callsign_spotter,
+                               req.callsign_dx, freq_mhz, req.comment, req.timestamp)
+
+    return {
+        "new_comments": new_comments,
+        "paths": len(groups),
+        "cached_paths": cached_paths,
+        "stale_paths": stale_paths,
+        "approx_paths": approx_paths
+    }
+
+@app.post("/users/active")
+def register_active_users(req: ActiveUsersInput):
+    """DXSpider registra los usuarios conectados (objetivo del precalentamiento de cache)."""
+    return {"registered": active_users.register(req.users, replace=req.replace)}
+
 @app.post("/predict_manual")
-def predict_manual(req: PredictionInput):
+async def predict_manual(req: PredictionInput):
     """
     Predicción directa: no se cachea, no se almacena, no se loguea.
     """
@@ -312,18 +450,35 @@ def predict_manual(req: PredictionInput):
         raise HTTPException(400, "No coords for one callsign")
 
     # Fuerza floats
-    tx = _to_float_coords(tx)
-    rx = _to_float_coords(rx)
-
-    try:
-        dt = datetime.fromisoformat(req.timestamp.replace("Z", "+00:00"))
-    except Exception:
-        raise HTTPException(400, "Invalid timestamp")
+    tx = to_float_coords(tx)
+    rx = to_float_coords(rx)
 
-    freq_mhz = _to_mhz(req.frequency)
-    short_path = run_iturhfprop("SHORTPATH", tx, rx, dt, freq_mhz, req.mode)
-    long_path  = run_iturhfprop("LONGPATH",  tx, rx, dt, freq_mhz, req.mode)
+    dt = _parse_timestamp(req.timestamp)
 
-    prediction = {"short_path": short_path, "long_path": long_path}
+    freq_mhz = to_mhz(req.frequency)
+    # Sin deadline (consulta manual), pero sujeta a la admisión del pool
+    prediction = await run_in_gate(compute_sp_lp_async, tx, rx, dt, freq_mhz, req.mode)
 
     return {"prediction": prediction, "cached": False}
+
+# ------------------ Consultas de spots ------------------
+
+def _spots_response(spots: list, coords_of: str, **query) -> dict:
+    for spot in spots:
+        coords = lookup_coords(spot[coords_of])
+        spot[f"{coords_of}_coords"] = list(coords) if coords else None
+    return {**query, "count": len(spots), "spots": spots}
+
+@app.get("/spots/heard")
+async def spots_heard(dx: str, minutes: float = 15, band: Optional[str] = None, source: Optional[str] = None,
+                      limit: Optional[int] = None):
+    """¿Quién ha oído a `dx` en los últimos `minutes`? (opcional: band=20m, source=rbn|human)"""
+    spots = await spot_store.heard(dx, minutes, band, source, limit)
+    return _spots_response(spots, "spotter", dx=dx.upper(), minutes=minutes, band=band)
+
+@app.get("/spots/by-spotter")
+async def spots_by_spotter(spotter: str, minutes: float = 15, band: Optional[str] = None,
+                           source: Optional[str] = None, limit: Optional[int] = None):
+    """¿A quién ha oído `spotter` (skimmer o usuario) en los últimos `minutes`?"""
+    spots = await spot_store.by_spotter(spotter, minutes, band, source, limit)
+    return _spots_response(spots, "dx", spotter=spotter.upper(), minutes=minutes, band=band)
@@ -0,0 +1,118 @@
+# app/metrics.py
+"""
+Métricas Prometheus (GET /metrics).
+
+Dos tipos:
+  - Instrumentación en línea (contadores/histogramas) en el camino caliente:
+    cache por nivel, duración de ITURHFProp, singleflight (eventos y esperas), 503 y latencia de
+    ida y vuelta a Redis.
+  - Colectores que, en cada scrape, traducen los stats() que ya mantienen los
+    módulos (ingesta RBN, consumidor del stream, pool del motor, cache local)
+    a series Prometheus, sin contar dos veces en el bucle de ingesta.
+
+Un solo proceso uvicorn → registro por defecto de prometheus_client.
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+# ------------------ Instrumentación en línea ------------------
+
+CACHE_REQUESTS = Counter(
+    "hf_cache_requests_total", "Consultas de cache de predicción por nivel y resultado",
+    ["tier", "result"])   # tier: tables | local | redis | matrix | stale ; result: hit | miss
+
+ENGINE_SECONDS = Histogram(
+    "hf_engine_duration_seconds", "Duración de ITURHFProp por tipo de camino y modo",
+    ["path_type", "mode", "kind"],   # kind: p2p | area | vector
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.35, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0))
+
+SINGLEFLIGHT = Counter(
+    "hf_singleflight_total", "Resultado del singleflight por clave",
+    ["event"])   # acquired | acquired_cached | local_wait | notified | late_acquired | timeout
+
+SINGLEFLIGHT_WAIT = Histogram(
+    "hf_singleflight_wait_seconds", "Espera del valor calculado por otro (Future en proceso o notificación de otro proceso)",
+    ["level"],   # local | remote
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+BUSY = Counter(
+    "hf_prediction_busy_total", "Respuestas 503 de predicción por causa",
+    ["reason"])   # pool_full | deadline | lock
+
+PROGRESSIVE = Counter(
+    "hf_progressive_total", "Respuestas de /predict con deadline del llamante por resultado",
+    ["result"])   # complete | partial | estimate | busy
+
+REDIS_RTT = Histogram(
+    "hf_redis_roundtrip_seconds", "Latencia de ida y vuelta a Redis por operación",
+    ["op"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5))
+
+RBN_STREAM = Gauge(
+    "hf_rbn_stream_backlog", "Entradas del stream RBN pendientes por grupo (lag sin leer / leídas sin ACK)",
+    ["group", "state"])   # state: lag | pending
+
+
+@contextmanager
+def timed(histogram, *labels):
+    """with timed(ENGINE_SECONDS, "SHORTPATH", "ANALOG", "p2p"): ..."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        (histogram.labels(*labels) if labels else histogram).observe(time.perf_counter() - t0)
+
+
+# ------------------ Colectores sobre stats() existentes ------------------
+
+class StatsCollector:
+    """
+    Expone un dict de stats() como métricas hf_<prefix>_<clave>. Las claves de
+    `counters` son acumulados (→ _total), el resto numéricas son gauges.
+    Con `label`, fn devuelve {valor_etiqueta: dict} (p. ej. una sesión RBN por clave).
+    """
+
+    def __init__(self, prefix: str, fn, counters=(), label: str = None, doc: str = ""):
+        self.prefix = prefix
+        self.fn = fn
+        self.counters = set(counters)
+        self.label = label
+        self.doc = doc or prefix
+
+    def collect(self):
+        try:
+            data = self.fn()
+        except Exception:
+            logger.exception("metrics: stats '%s' failed", self.prefix)
+            return
+        groups = data.items() if self.label else [(None, data)]
+        families = {}
+        for lv, stats in groups:
+            for key, value in stats.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                fam = families.get(key)
+                if fam is None:
+                    name = f"hf_{self.prefix}_{key}"
+                    labels = [self.label] if self.label else []
+                    cls = CounterMetricFamily if key in self.counters else GaugeMetricFamily
+                    fam = families[key] = cls(name, f"{self.doc}: {key}", labels=labels)
+                fam.add_metric([str(lv)] if self.label else [], value)
+        yield from families.values()
+
+
+def register_stats(prefix: str, fn, counters=(), label: str = None, doc: str = ""):
+    REGISTRY.register(StatsCollector(prefix, fn, counters, label, doc))
+
+
+def render():
+    """(cuerpo, content-type) para la respuesta de /metrics."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
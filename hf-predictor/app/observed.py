@@ -0,0 +1,229 @@
+# app/observed.py
+"""
+Rejilla empírica de propagación a partir del SNR medido por los skimmers RBN.
+
+Agregado por (celda RX = skimmer, celda TX = DX, banda, hora UTC) con
+decaimiento exponencial (constante tau):
+
+  w   = Σ peso                    (nº efectivo de spots)
+  wx  = Σ peso · snr              → snr observado = wx / w
+  wg  = Σ peso · [snr ≥ good_snr] → % de spots con señal cómoda
+
+Todo el decaimiento es vectorial: cada minuto se multiplican los arrays
+completos por exp(-Δt/tau). Cada proceso que consume RBN vuelca su rejilla a
+/data/observed/obs-<consumidor>.npz; el resto la suma a la suya al consultar
+(mismo patrón de ficheros compartidos que las tablas de propagación).
+"""
+import glob
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from config import CONFIG
+from hf_utils import HF_BANDS, band_index
+
+logger = logging.getLogger(__name__)
+
+_cfg = CONFIG.get("observed", {}) or {}
+N_HOURS = 24
+DECAY_STEP_S = 60.0
+
+
+class ObservedGrid:
+    def __init__(self, path: str, name: str, cell_deg: float = 5.0, tau_s: float = 3600.0,
+                 good_snr_db: float = 10.0, min_weight: float = 8.0):
+        self.path = path
+        self.name = name
+        self.cell_deg = float(cell_deg)
+        self.tau_s = float(tau_s)
+        self.good_snr_db = float(good_snr_db)
+        self.min_weight = float(min_weight)
+        self._lock = threading.Lock()
+        self._rows = {}                  # (rx_lat, rx_lon, tx_lat, tx_lon) en celdas → fila
+        self._w = self._wx = self._wg = np.zeros((0, len(HF_BANDS), N_HOURS))
+        self._t = time.time()            # instante al que están decaídos los arrays
+        self._dirty = False
+        self._peers = {}                 # fichero → (mtime, filas, w, wx, wg, t)
+        self.observations = 0
+
+    # ------------- agregado -------------
+
+    def _cell(self, coords):
+        return (int(math.floor((float(coords[0]) + 90.0) / self.cell_deg)),
+                int(math.floor((float(coords[1]) + 180.0) / self.cell_deg)))
+
+    def _row(self, rx, tx) -> int:
+        key = self._cell(rx) + self._cell(tx)
+        row = self._rows.get(key)
+        if row is None:
+            row = len(self._rows)
+            if row >= self._w.shape[0]:
+                cap = max(256, 2 * self._w.shape[0])
+                self._w, self._wx, self._wg = (np.resize(a, (cap,) + a.shape[1:]) for a in (self._w, self._wx, self._wg))
+                for a in (self._w, self._wx, self._wg):
+                    a[row:] = 0.0
+            self._rows[key] = row
+        return row
+
+    def _decay_to(self, now: float):
+        dt = now - self._t
+        if dt <= 0:
+            return
+        f = math.exp(-dt / self.tau_s)
+        n = len(self._rows)
+        for a in (self._w, self._wx, self._wg):
+            a[:n] *= f
+        self._t = now
+
+    def add_many(self, observations):
+        """observations: iterable de (rx_coords, tx_coords, freq_mhz, dt, snr_db)."""
+        rows, bands, hours, snrs = [], [], [], []
+        with self._lock:
+            for rx, tx, freq_mhz, dt, snr in observations:
+                band = band_index(freq_mhz)
+                if band is None or snr is None or not rx or not tx:
+                    continue
+                rows.append(self._row(rx, tx)); bands.append(band); hours.append(dt.hour); snrs.append(snr)
+            if not rows:
+                return
+            now = time.time()
+            if now - self._t >= DECAY_STEP_S:
+                self._decay_to(now)
+            idx = (np.asarray(rows), np.asarray(bands), np.asarray(hours))
+            snr = np.asarray(snrs, dtype=float)
+            np.add.at(self._w, idx, 1.0)
+            np.add.at(self._wx, idx, snr)
+            np.add.at(self._wg, idx, (snr >= self.good_snr_db).astype(float))
+            self.observations += len(rows)
+            self._dirty = True
+
+    # ------------- consulta -------------
+
+    def _cell_values(self, key, band: int, hour: int, now: float):
+        w = wx = wg = 0.0
+        sources = [(self._rows, self._w, self._wx, self._wg, self._t)]
+        sources += [p[1:] for p in self._peers.values()]
+        for rows, aw, awx, awg, t in sources:
+            row = rows.get(key)
+            if row is None:
+                continue
+            f = math.exp(-max(0.0, now - t) / self.tau_s)
+            w += f * float(aw[row, band, hour])
+            wx += f * float(awx[row, band, hour])
+            wg += f * float(awg[row, band, hour])
+        return w, wx, wg
+
+    def query(self, rx, tx, freq_mhz: float, dt: datetime):
+        """
+        SNR observado en RX (usuario) de TX (DX) para la banda y hora de dt,
+        o None si no hay spots. dense=True si hay suficientes para responder
+        sin ejecutar ITURHFProp.
+        """
+        band = band_index(freq_mhz)
+        if band is None:
+            return None
+        w, wx, wg = self._cell_values(self._cell(rx) + self._cell(tx), band, dt.hour, time.time())
+        if w <= 1e-3:
+            return None
+        return {
+            "snr": int(round(wx / w)),
+            "good_pct": int(round(100.0 * wg / w)),
+            "weight": round(w, 1),
+            "dense": w >= self.min_weight,
+            "band": HF_BANDS[band][0],
+            "hour": dt.hour,
+            "metric": "OBS",
+        }
+
+    def stats(self) -> dict:
+        return {"pairs": len(self._rows), "observations": self.observations,
+                "peers": len(self._peers), "cell_deg": self.cell_deg, "tau_s": self.tau_s}
+
+    # ------------- compartición entre procesos -------------
+
+    def _file(self) -> str:
+        return os.path.join(self.path, f"obs-{self.name}.npz")
+
+    def snapshot(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self._decay_to(time.time())
+            n = len(self._rows)
+            keys = np.array(list(self._rows), dtype=np.int32).reshape(n, 4)
+            w, wx, wg, t = self._w[:n].copy(), self._wx[:n].copy(), self._wg[:n].copy(), self._t
+            self._dirty = False
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self._file() + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, keys=keys, w=w, wx=wx, wg=wg, t=np.array(t))
+        os.replace(tmp, self._file())
+
+    def load_peers(self):
+        """(Re)carga las rejillas de otros procesos; ignora las ya decaídas del todo."""
+        stale = time.time() - 10 * self.tau_s
+        peers = {}
+        for fname in glob.glob(os.path.join(self.path, "obs-*.npz")):
+            if fname == self._file():
+                continue
+            try:
+                mtime = os.path.getmtime(fname)
+                if mtime < stale:
+                    continue
+                old = self._peers.get(fname)
+                if old is not None and old[0] == mtime:
+                    peers[fname] = old
+                    continue
+                with np.load(fname) as z:
+                    rows = {tuple(int(v) for v in k): i for i, k in enumerate(z["keys"])}
+                    peers[fname] = (mtime, rows, z["w"], z["wx"], z["wg"], float(z["t"]))
+            except Exception:
+                logger.exception("observed: error loading %s", fname)
+        self._peers = peers
+
+    def run_forever(self, interval: float):
+        while True:
+            try:
+                self.snapshot()
+                self.load_peers()
+            except Exception:
+                logger.exception("observed: snapshot cycle failed")
+            time.sleep(interval)
+
+
+grid = ObservedGrid(
+    _cfg.get("path", "/data/observed"),
+    name=f"{socket.gethostname()}-{os.getpid()}",
+    cell_deg=_cfg.get("cell_deg", 5.0),
+    tau_s=float(_cfg.get("tau_minutes", 60)) * 60,
+    good_snr_db=_cfg.get("good_snr_db", 10.0),
+    min_weight=_cfg.get("min_weight", 8.0),
+)
+ENABLED = bool(_cfg.get("enabled", True))
+ANSWER_WHEN_DENSE = bool(_cfg.get("answer_when_dense", True))
+
+
+def observed_prediction(obs: dict) -> dict:
+    """
+    Predicción en el formato de ITURHFProp a partir del canal observado.
+    Los skimmers no distinguen SP/LP: se atribuye al camino corto y LP queda a 0.
+    """
+    return {
+        "short_path": {"snr": obs["snr"], "reliability": obs["good_pct"], "metric": "OBS"},
+        "long_path": {"snr": 0, "reliability": 0, "metric": "OBS"},
+    }
+
+
+def start_observed_sync():
+    """Arranca el hilo que vuelca la rejilla propia y recarga la de otros procesos."""
+    if not ENABLED:
+        return
+    threading.Thread(target=grid.run_forever, args=(float(_cfg.get("snapshot_interval_s", 30)),),
+                     daemon=True).start()
+    logger.info("🧵 Hilo de rejilla observada (RBN SNR) arrancado.")
@@ -0,0 +1,223 @@
+# app/path_matrix.py
+"""
+Matriz banda × hora por camino.
+
+Los usuarios saltan de banda continuamente y cada (camino, banda, franja)
+era una ejecución de ITURHFProp por SP/LP. Aquí una sola ejecución en modo
+vector por SP/LP evalúa todas las bandas HF × 24 horas UTC, y la matriz se
+guarda por (camino, mes, cubeta de SSN, modulación): cualquier /predict
+posterior de ese camino, en cualquier banda u hora, es una consulta.
+
+  matrix:v1:<src>-><dst>:<YYYYMM>:<ssn>:<ANALOG|DIGITAL>   JSON, TTL ttl_hours
+    {"v": [camino][banda][hora][snr, reliability, ocr]}   (null = sin dato)
+
+La fiabilidad se guarda sin ajuste Kp (se aplica al consultar, como en
+prop_tables). Si falta la matriz, se calcula en segundo plano a baja
+prioridad; la petición que la echa en falta sigue por el camino punto a punto
+dentro de su deadline. Las consultas van primero a la copia en memoria del
+proceso; una matriz ausente también se recuerda (miss_ttl_s), así que un
+camino sin matriz no cuesta un GET a Redis en cada petición.
+"""
+import json
+import logging
+from datetime import datetime
+
+import numpy as np
+import redis
+import redis.asyncio as aioredis
+
+from config import CONFIG
+from engine_pool import PRIORITY_LOW, PoolFull, pool as engine_pool
+from hf_utils import HF_BANDS, _kp_factor, band_index, get_effective_ssn, run_iturhfprop_vector
+from local_cache import LocalCache
+from metrics import CACHE_REQUESTS, REDIS_RTT, timed
+from prop_tables import PATHS, pair_key, ssn_bucket
+
+logger = logging.getLogger(__name__)
+
+REDIS_HOST = CONFIG["redis"]["host"]
+REDIS_PORT = CONFIG["redis"]["port"]
+r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+ar = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+MATRIX_VER = "v1"
+
+_cfg = CONFIG.get("path_matrix", {}) or {}
+ENABLED = bool(_cfg.get("enabled", True))
+TTL_S = int(float(_cfg.get("ttl_hours", 24)) * 3600)
+BACKGROUND = bool(_cfg.get("background", True))
+RETRY_S = float(_cfg.get("retry_s", 300))
+MISS_TTL_S = float(_cfg.get("miss_ttl_s", 30))
+
+
+def _encode(matrix: np.ndarray) -> str:
+    return json.dumps({"v": np.where(np.isnan(matrix), None, np.round(matrix, 1)).tolist()})
+
+
+def _decode(raw: str) -> np.ndarray:
+    return np.array(json.loads(raw)["v"], dtype=np.float32)
+
+
+def compute_matrix(src, dst, dt: datetime, modulation: str, ssn: int) -> np.ndarray:
+    """Una ejecución vectorial por SP/LP → array (camino, banda, hora, [snr, rel, ocr])."""
+    out = np.full((len(PATHS), len(HF_BANDS), 24, 3), np.nan, dtype=np.float32)
+    for p, path_type in enumerate(PATHS):
+        grid = run_iturhfprop_vector(path_type, src, dst, dt, modulation, ssn=ssn, apply_kp=False)
+        out[p, :, :, 0] = grid["snr"]
+        out[p, :, :, 1] = grid["reliability"]
+        out[p, :, :, 2] = grid["use_ocr"]
+    return out
+
+
+class PathMatrices:
+    def __init__(self):
+        self._local = LocalCache(max_entries=int(_cfg.get("local_entries", 2000)),
+                                 ttl_s=float(_cfg.get("local_ttl_s", 600)))
+        # Ausente en Redis hace poco: no se vuelve a consultar hasta miss_ttl_s
+        self._absent = LocalCache(max_entries=int(_cfg.get("local_entries", 2000)) * 4, ttl_s=MISS_TTL_S)
+        # Una matriz pedida en segundo plano no se vuelve a pedir hasta retry_s
+        self._scheduled = LocalCache(max_entries=20000, ttl_s=RETRY_S)
+        self.hits = 0
+        self.misses = 0
+        self.scheduled = 0
+        self.dropped = 0
+        self.built = 0
+        self.failed = 0
+
+    # ------------- condiciones (SSN y Kp) -------------
+
+    @staticmethod
+    def _conditions(dt: datetime):
+        """(cubeta de SSN, factor Kp) de la instantánea de meteorología espacial (sin E/S)."""
+        kp_adj = _kp_factor()
+        return ssn_bucket(get_effective_ssn(dt)), kp_adj[1] if kp_adj is not None else 1.0
+
+    # ------------- consulta -------------
+
+    @staticmethod
+    def key(src, dst, dt: datetime, modulation: str, ssn: int) -> str:
+        return f"matrix:{MATRIX_VER}:{pair_key(src, dst)}:{dt.year:04d}{dt.month:02d}:{ssn}:{modulation}"
+
+    @staticmethod
+    def _cell(matrix: np.ndarray, band: int, hour: int, factor: float):
+        v = matrix[:, band, hour]   # (camino, [snr, rel, ocr])
+        if np.isnan(v[:, :2]).any():
+            return None
+        return {
+            name: {"snr": int(round(float(v[i, 0]))),
+                   "reliability": int(round(float(v[i, 1]) * factor)),
+                   "metric": "OCR" if v[i, 2] > 0 else "BCR"}
+            for i, name in ((0, "short_path"), (1, "long_path"))
+        }
+
+    def _result(self, matrix, band: int, dt: datetime, factor: float):
+        if matrix is None:
+            self.misses += 1
+            return None
+        res = self._cell(matrix, band, dt.hour, factor)
+        if res is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return res
+
+    def _prepare(self, src, dst, dt: datetime, freq_mhz: float, modulation: str):
+        """(clave, banda, factor Kp, ssn, matriz local | None, consultar Redis) o None si no aplica."""
+        band = band_index(freq_mhz)
+        if not ENABLED or band is None:
+            return None
+        ssn, factor = self._conditions(dt)
+        key = self.key(src, dst, dt, modulation, ssn)
+        matrix = self._local.get(key)
+        return key, band, factor, ssn, matrix, matrix is None and self._absent.get(key) is None
+
+    def _fetched(self, raw, key: str, src, dst, dt: datetime, modulation: str, ssn: int):
+        CACHE_REQUESTS.labels("matrix", "hit" if raw else "miss").inc()
+        if raw is None:
+            self._absent.set(key, True)
+            self.schedule(key, src, dst, dt, modulation, ssn)
+            return None
+        matrix = _decode(raw)
+        self._local.set(key, matrix)
+        return matrix
+
+    def lookup(self, src, dst, dt: datetime, freq_mhz: float, modulation: str):
+        """
+        Predicción SP/LP desde la matriz del camino, o None. Si la matriz no
+        existe se encarga su cálculo en segundo plano.
+        """
+        prep = self._prepare(src, dst, dt, freq_mhz, modulation)
+        if prep is None:
+            return None
+        key, band, factor, ssn, matrix, fetch = prep
+        if fetch:
+            with timed(REDIS_RTT, "matrix_get"):
+                raw = r.get(key)
+            matrix = self._fetched(raw, key, src, dst, dt, modulation, ssn)
+        return self._result(matrix, band, dt, factor)
+
+    async def lookup_async(self, src, dst, dt: datetime, freq_mhz: float, modulation: str):
+        prep = self._prepare(src, dst, dt, freq_mhz, modulation)
+        if prep is None:
+            return None
+        key, band, factor, ssn, matrix, fetch = prep
+        if fetch:
+            with timed(REDIS_RTT, "matrix_get"):
+                raw = await ar.get(key)
+            matrix = self._fetched(raw, key, src, dst, dt, modulation, ssn)
+        return self._result(matrix, band, dt, factor)
+
+    # ------------- cálculo en segundo plano -------------
+
+    def schedule(self, key: str, src, dst, dt: datetime, modulation: str, ssn: int):
+        """No bloqueante: encarga la matriz al pool a baja prioridad si está ocioso."""
+        if not BACKGROUND or self._scheduled.get(key) is not None:
+            return
+        # Sin colas de peticiones delante: la matriz nunca ocupa un hueco que haga falta
+        if engine_pool.stats()["queued"] > 0:
+            self.dropped += 1
+            return
+        self._scheduled.set(key, True)
+        try:
+            engine_pool.submit(self.build, key, src, dst, dt, modulation, ssn, priority=PRIORITY_LOW)
+            self.scheduled += 1
+        except PoolFull:
+            self.dropped += 1
+            self._scheduled.delete(key)
+
+    def build(self, key: str, src, dst, dt: datetime, modulation: str, ssn: int):
+        """Calcula y publica la matriz (un solo constructor por clave entre procesos)."""
+        lock = r.lock(f"lock:{key}", timeout=120)
+        if not lock.acquire(blocking=False):
+            return
+        try:
+            if r.exists(key):
+                return
+            matrix = compute_matrix(src, dst, dt, modulation, ssn)
+            r.setex(key, TTL_S, _encode(matrix))
+            self._local.set(key, matrix)
+            self._absent.delete(key)
+            self.built += 1
+        except Exception:
+            self.failed += 1
+            logger.exception("path_matrix: error calculando %s", key)
+        finally:
+            try:
+                lock.release()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "enabled": ENABLED,
+            "local_entries": self._local.stats()["entries"],
+            "hits": self.hits,
+            "misses": self.misses,
+            "scheduled": self.scheduled,
+            "dropped": self.dropped,
+            "built": self.built,
+            "failed": self.failed,
+        }
+
+
+matrices = PathMatrices()
@@ -1,10 +1,24 @@
 # app/predict_from_spots.py
+import os
 import redis
+import queue
+import socket
 import threading
-import json
+import time
 import logging
+from collections import Counter
 from datetime import datetime
-from hf_utils import lookup_coords, run_iturhfprop
+from fastapi import HTTPException
+from hf_utils import HF_BANDS, band_index, lookup_coords, run_iturhfprop
+from iturhf_engine import radio_profile
+from log_pipeline import prediction_log
+from metrics import RBN_STREAM
+import spot_store
+from observed import ENABLED as OBSERVED_ENABLED, grid as observed_grid
+from warmer import WARM_RBN, warmer
+from prediction import (
+    COORD_DECIMALS, _freq_bin_mhz, _time_bin, get_prediction_with_cache, request_deadline, to_float_coords,
+)
 from config import CONFIG
 
 logger = logging.getLogger(__name__)
@@ -12,7 +26,9 @@ logging.basicConfig(level=logging.INFO)
 
 REDIS_HOST = CONFIG["redis"]["host"]
 REDIS_PORT = CONFIG["redis"]["port"]
-OUTPUT_FILE = "/data/hf_predictions.log"
+
+# RBN no tiene cliente esperando: margen amplio frente a los 0.5 s de la API
+RBN_DEADLINE_S = float(CONFIG.get("rbn", {}).get("deadline_s", 30))
 
 r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
 
@@ -53,80 +69,278 @@ def _ttl_for_rbn_mode(mode: str) -> int:
     return int(rbn_conf.get("digi", {}).get("ttl_minutes", 10)) * 60
 
 # -----------------------
-# Procesado de mensajes RBN (pubsub predict-hf)
+# Procesado de mensajes RBN (Redis Stream + consumer group)
 # -----------------------
-
-def _handle_rbn_message(msg: str):
+#
+# telnet_rbn.py hace XADD al stream; cada proceso lee con XREADGROUP, de modo
+# que varios procesos/contenedores se reparten los spots sin duplicar trabajo.
+# El ACK se hace al guardar el spot (entrega al menos una vez) y las entradas
+# de un consumidor caído se reclaman con XAUTOCLAIM.
+#
+# El lector solo parsea y encola; N workers calculan. Los spots
+# equivalentes (misma celda de skimmer, celda DX, banda, modulación y franja
+# horaria) se agrupan y se calculan una sola vez: decenas de skimmers
+# reportan el mismo DX en segundos.
+
+_rbn_conf = CONFIG.get("rbn", {}) or {}
+RBN_WORKERS = int(_rbn_conf.get("workers", 4))
+RBN_QUEUE_SIZE = int(_rbn_conf.get("queue_size", 1000))
+
+_stream_conf = _rbn_conf.get("stream", {}) or {}
+STREAM_KEY = _stream_conf.get("key", "rbn:spots")
+STREAM_GROUP = _stream_conf.get("group", "predictors")
+STREAM_READ_COUNT = int(_stream_conf.get("read_count", 200))
+STREAM_CLAIM_IDLE_MS = int(_stream_conf.get("claim_idle_ms", 60000))
+CONSUMER_NAME = f"{socket.gethostname()}-{os.getpid()}"
+
+_work = queue.Queue(maxsize=RBN_QUEUE_SIZE)   # claves de grupo pendientes
+_groups = {}                                  # clave de grupo → [spots]
+_groups_lock = threading.Lock()
+_inflight_ids = set()                         # entradas del stream leídas y aún sin ACK
+_counters = Counter()
+_counters_lock = threading.Lock()
+
+
+def _count(name: str, n: int = 1):
+    with _counters_lock:
+        _counters[name] += n
+
+
+def _parse_rbn_message(msg: str):
     """
-    Mensaje publicado por telnet_rbn.py:
+    Campo "msg" de la entrada del stream escrita por telnet_rbn.py:
       "rbn|<spotter>|<dx>|<freq_mhz>|<mode>|<ts_iso>"
+    Devuelve el spot (dict) o None.
     """
     parts = msg.strip().split("|")
     if len(parts) != 6:
         logger.warning(f"RBN mensaje inválido: {msg}")
-        return
+        return None
 
     user, spotter, dx, freq_s, mode, ts = parts
     if user != "rbn":
-        logger.debug(f"Ignorado no-RBN en canal predict-hf: {msg}")
-        return
+        logger.debug("Ignorado no-RBN en stream %s: %s", STREAM_KEY, msg)
+        return None
 
     try:
         freq_mhz = _normalize_freq_mhz(freq_s)
         dt = _parse_ts_to_dt(ts)
     except Exception as e:
         logger.warning(f"RBN parse error (freq/ts): {e} msg={msg}")
-        return
+        return None
 
-    # Coordenadas
-    spotter_coords = lookup_coords(spotter)
-    dx_coords = lookup_coords(dx)
+    return {
+        "spotter": spotter, "dx": dx, "freq_mhz": freq_mhz, "mode": mode, "dt": dt,
+        "spotter_coords": lookup_coords(spotter), "dx_coords": lookup_coords(dx),
+    }
 
-    prediction = None
-    if spotter_coords and dx_coords:
+def _group_key(spot: dict):
+    """(celda skimmer, celda DX, banda, modulación, franja) o None si faltan coordenadas."""
+    if not spot["spotter_coords"] or not spot["dx_coords"]:
+        return None
+    band = band_index(spot["freq_mhz"])
+    f_calc = HF_BANDS[band][3] if band is not None else _freq_bin_mhz(spot["freq_mhz"])
+    # Perfil según el modo tal cual llega (CW → ANALOG, FT8/FT4 → DIGITAL…)
+    modulation = radio_profile(spot["mode"])["modulation"]
+    src = to_float_coords(spot["spotter_coords"]); dst = to_float_coords(spot["dx_coords"])
+    return (round(src[0], COORD_DECIMALS), round(src[1], COORD_DECIMALS),
+            round(dst[0], COORD_DECIMALS), round(dst[1], COORD_DECIMALS),
+            f_calc, modulation, _time_bin(spot["dt"]))
+
+def _store_rbn_spots(spots: list, prediction=None):
+    """Guarda los spots y confirma (XACK) sus entradas del stream en el mismo viaje."""
+    pipe = r.pipeline(transaction=False)
+    spot_store.queue_writes(pipe, [
+        spot_store.make_record("rbn", spot["spotter"], spot["dx"], spot["freq_mhz"], spot["mode"], spot["dt"],
+                               prediction, _ttl_for_rbn_mode(spot["mode"]))
+        for spot in spots
+    ])
+    ids = [spot["entry_id"] for spot in spots if spot.get("entry_id")]
+    if ids:
+        pipe.xack(STREAM_KEY, STREAM_GROUP, *ids)
+    pipe.execute()
+    with _groups_lock:
+        _inflight_ids.difference_update(ids)
+    _count("stored", len(spots))
+    _count("acked", len(ids))
+    logger.debug("💾 RBN cacheados %d spots (predicción: %s)", len(spots), "sí" if prediction else "no")
+
+def _ack(entry_id: str):
+    r.xack(STREAM_KEY, STREAM_GROUP, entry_id)
+    with _groups_lock:
+        _inflight_ids.discard(entry_id)
+    _count("acked")
+
+def _handle_rbn_message(msg: str, entry_id: str = None, level=None):
+    """Parsea y encola (o agrupa con un cálculo ya pendiente). No calcula. Devuelve el spot."""
+    spot = _parse_rbn_message(msg)
+    if spot is None:
+        if entry_id:
+            _ack(entry_id)
+        return None
+    spot["entry_id"] = entry_id
+    spot["level"] = level
+    _count("received")
+
+    gkey = _group_key(spot)
+    if gkey is None:
+        _store_rbn_spots([spot])
+        return spot
+
+    with _groups_lock:
+        group = _groups.get(gkey)
+        if group is not None:
+            group.append(spot)
+            _count("coalesced")
+            return spot
+        _groups[gkey] = [spot]
+    try:
+        _work.put_nowait(gkey)
+    except queue.Full:
+        # Backlog lleno: el spot se guarda sin predicción
+        with _groups_lock:
+            spots = _groups.pop(gkey, [spot])
+        _count("dropped", len(spots))
+        _store_rbn_spots(spots)
+    return spot
+
+def _rbn_worker():
+    while True:
+        gkey = _work.get()
         try:
-            # Usamos el modo tal cual llega (CW/FT8/FT4/PSK/RTTY…)
-            sp = run_iturhfprop("SHORTPATH", spotter_coords, dx_coords, dt, freq_mhz, mode)
-            lp = run_iturhfprop("LONGPATH",  spotter_coords, dx_coords, dt, freq_mhz, mode)
-            prediction = {"short_path": sp, "long_path": lp}
-        except Exception as e:
-            logger.warning(f"RBN predicción fallida {spotter}->{dx} @ {freq_mhz} {mode}: {e}")
-
-    # Guardar en Redis
-    key = f"spot:rbn:{spotter}:{dx}:{freq_mhz:.1f}"
-    payload = {
-        "source": "rbn",
-        "spotter": spotter,
-        "dx": dx,
-        "frequency": float(f"{freq_mhz:.1f}"),
-        "mode": mode or "",
-        "timestamp": dt.isoformat(),
+            s_lat, s_lon, d_lat, d_lon, f_calc, modulation, _ = gkey
+            with _groups_lock:
+                first = _groups[gkey][0]
+            prediction = None
+            try:
+                prediction, cached = get_prediction_with_cache((s_lat, s_lon), (d_lat, d_lon), first["dt"],
+                                                               f_calc, modulation,
+                                                               deadline=request_deadline(RBN_DEADLINE_S))
+                _count("cache_hits" if cached else "computed")
+            except HTTPException as e:
+                # Backpressure: la API tiene prioridad; los spots se guardan sin predicción
+                _count("busy")
+                logger.debug("RBN sin predicción (%s) %s->%s", e.detail, first["spotter"], first["dx"])
+            except Exception as e:
+                _count("failed")
+                logger.warning(f"RBN predicción fallida {first['spotter']}->{first['dx']} "
+                               f"@ {first['freq_mhz']} {first['mode']}: {e}")
+            # Los spots que llegaron mientras se calculaba se llevan la misma predicción
+            with _groups_lock:
+                spots = _groups.pop(gkey, [])
+            _store_rbn_spots(spots, prediction)
+        except Exception:
+            logger.exception("Error en worker RBN")
+        finally:
+            _work.task_done()
+
+def predictor_stats() -> dict:
+    with _groups_lock:
+        pending_spots = sum(len(g) for g in _groups.values())
+    return {
+        "workers": RBN_WORKERS,
+        "queue_size": RBN_QUEUE_SIZE,
+        "backlog": _work.qsize(),
+        "pending_spots": pending_spots,
+        "consumer": CONSUMER_NAME,
+        **{k: _counters[k] for k in ("read", "received", "coalesced", "dropped", "computed",
+                                     "cache_hits", "busy", "failed", "stored", "acked", "reclaimed")},
     }
-    if spotter_coords:
-        payload["spotter_coords"] = spotter_coords
-    if dx_coords:
-        payload["dx_coords"] = dx_coords
-    if prediction:
-        payload["prediction"] = prediction
 
-    ttl = _ttl_for_rbn_mode(mode)
-    r.setex(key, ttl, json.dumps(payload, ensure_ascii=False))
-    logger.info(f"💾 RBN cacheado: {key} (ttl {ttl}s)")
+def _ensure_group():
+    try:
+        r.xgroup_create(STREAM_KEY, STREAM_GROUP, id="0", mkstream=True)
+        logger.info(f"Consumer group '{STREAM_GROUP}' creado en {STREAM_KEY}")
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
 
-def _rbn_subscriber_loop():
-    logger.info("📡 Suscriptor RBN en Redis canal 'predict-hf' iniciado.")
-    pubsub = r.pubsub()
-    pubsub.subscribe("predict-hf")
-    for item in pubsub.listen():
-        if not item or item.get("type") != "message":
-            continue
-        data = item.get("data")
-        if not data:
+def _level(fields: dict):
+    try:
+        return float(fields["level"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def _dispatch(entries, reclaimed: bool = False):
+    observations = []
+    for entry_id, fields in entries:
+        with _groups_lock:
+            if entry_id in _inflight_ids:
+                # Reclamada a nosotros mismos: ya está en cola en este proceso
+                continue
+            _inflight_ids.add(entry_id)
+        _count("reclaimed" if reclaimed else "read")
+        msg = (fields or {}).get("msg")
+        if not msg:
+            # Entrada recortada por MAXLEN antes de procesarse
+            _ack(entry_id)
             continue
         try:
-            _handle_rbn_message(data)
+            spot = _handle_rbn_message(msg, entry_id, _level(fields))
+            if spot and WARM_RBN:
+                # DXSpider pedirá /predict de este DX para cada usuario conectado
+                # Modulación como en _group_key (CW/RTTY/PSK → perfil ANALOG), no el modo crudo
+                warmer.schedule(spot["dx_coords"], spot["freq_mhz"], radio_profile(spot["mode"])["modulation"],
+                                spot["dt"])
+            if spot and spot["level"] is not None:
+                # Skimmer = RX, DX = TX
+                observations.append((spot["spotter_coords"], spot["dx_coords"], spot["freq_mhz"],
+                                     spot["dt"], spot["level"]))
+        except Exception:
+            # Sin ACK: se reintentará vía XAUTOCLAIM
+            with _groups_lock:
+                _inflight_ids.discard(entry_id)
+            logger.exception(f"Error procesando mensaje RBN: {msg}")
+    if OBSERVED_ENABLED and observations:
+        observed_grid.add_many(observations)
+
+def _reclaim_idle():
+    """Reclama entradas sin ACK de consumidores caídos o atascados (XAUTOCLAIM)."""
+    start = "0-0"
+    while True:
+        resp = r.xautoclaim(STREAM_KEY, STREAM_GROUP, CONSUMER_NAME, STREAM_CLAIM_IDLE_MS,
+                            start_id=start, count=STREAM_READ_COUNT)
+        start, entries = resp[0], resp[1]
+        if entries:
+            _dispatch(entries, reclaimed=True)
+        if not entries or start in ("0-0", b"0-0"):
+            return
+
+def _update_stream_backlog():
+    """Lag (sin leer) y pendientes (sin ACK) de cada grupo del stream → métricas."""
+    for g in r.xinfo_groups(STREAM_KEY):
+        lag = g.get("lag")
+        if lag is not None:   # Redis >= 7
+            RBN_STREAM.labels(g["name"], "lag").set(lag)
+        RBN_STREAM.labels(g["name"], "pending").set(g.get("pending", 0))
+
+def _rbn_subscriber_loop():
+    logger.info(f"📡 Consumidor RBN '{CONSUMER_NAME}' en stream {STREAM_KEY} (grupo {STREAM_GROUP}) iniciado.")
+    claim_every = max(1.0, STREAM_CLAIM_IDLE_MS / 2000.0)
+    last_claim = 0.0
+    group_ready = False
+    while True:
+        try:
+            if not group_ready:
+                _ensure_group()
+                group_ready = True
+            if time.monotonic() - last_claim >= claim_every:
+                last_claim = time.monotonic()
+                _reclaim_idle()
+                _update_stream_backlog()
+            resp = r.xreadgroup(STREAM_GROUP, CONSUMER_NAME, {STREAM_KEY: ">"},
+                                count=STREAM_READ_COUNT, block=int(claim_every * 1000))
+            for _, entries in resp or []:
+                _dispatch(entries)
+        except redis.ResponseError as e:
+            if "NOGROUP" in str(e):
+                group_ready = False   # stream o grupo borrados: se recrean
+                continue
+            logger.exception("Error leyendo stream RBN")
+            time.sleep(1)
         except Exception:
-            logger.exception(f"Error procesando mensaje RBN: {data}")
+            logger.exception("Error leyendo stream RBN")
+            time.sleep(1)
 
 # -----------------------
 # (Opcional) soporte legado para spots humanos
@@ -186,9 +400,8 @@ def handle_spot(msg: str):
         line = f"{user}> DX de {spotter_clean}:  {freq}  {dx}  {comment}  {ts}"
 
         if CONFIG.get("human_spot", {}).get("log_predictions", False):
-            with open(OUTPUT_FILE, "a") as f:
-                f.write(line + "\n")
-            logger.info(f"📝 Spot humano logueado: {line}")
+            prediction_log.write([line])
+            logger.debug("📝 Spot humano logueado: %s", line)
 
         # Si quisieras cachear también este flujo:
         # spotter_coords = lookup_coords(spotter_clean)
@@ -218,8 +431,10 @@ def handle_spot(msg: str):
 
 def start_spot_predictor():
     """
-    Arranca el hilo que escucha el canal 'predict-hf' para RBN.
+    Arranca el hilo consumidor del stream RBN y sus workers.
     """
+    for i in range(RBN_WORKERS):
+        threading.Thread(target=_rbn_worker, name=f"rbn-worker-{i}", daemon=True).start()
     t = threading.Thread(target=_rbn_subscriber_loop, daemon=True)
     t.start()
-    logger.info("🧵 Hilo de predicción por spots (RBN subscriber) arrancado.")
+    logger.info(f"🧵 Hilo de predicción por spots (RBN subscriber + {RBN_WORKERS} workers) arrancado.")
@@ -0,0 +1,732 @@
+# app/prediction.py
+"""
+Núcleo de predicción compartido por la API y los procesos de fondo:
+normalización/binning, claves de cache, singleflight en dos niveles (Future
+en proceso + lock de Redis con notificación pub/sub entre procesos),
+stale-while-revalidate entre franjas y ejecución en el pool de ITURHFProp.
+Versiones síncrona y asíncrona.
+"""
+import asyncio
+import json
+import os
+import time
+import logging
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+
+import redis
+import redis.asyncio as aioredis
+
+from config import CONFIG
+from engine_pool import PRIORITY_LOW, PRIORITY_NORMAL, DeadlineExceeded, PoolFull, gate as engine_gate, pool as engine_pool
+from hf_utils import run_iturhfprop, run_iturhfprop_async, run_iturhfprop_receivers
+from local_cache import LocalCache, predictions as local_cache
+from metrics import BUSY, CACHE_REQUESTS, REDIS_RTT, SINGLEFLIGHT, SINGLEFLIGHT_WAIT, timed
+from path_matrix import matrices as path_matrices
+from singleflight import flights
+from prop_tables import tables as prop_tables
+from revalidator import (
+    DEADLINE_S as SWR_DEADLINE_S, GRACE_S as STALE_GRACE_S, STALE_LOCAL_TTL_S, Revalidator,
+)
+
+logger = logging.getLogger(__name__)
+
+# ------------------ Config cache/binning ------------------
+
+# Redis
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
+ar = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
+
+# TTL cache principal
+CACHE_EXPIRE = int(os.getenv("CACHE_EXPIRE", "600"))  # 10 min por defecto
+
+# Binning para maximizar hits de cache sin perder utilidad operativa
+FREQ_BIN_MHZ = float(os.getenv("FREQ_BIN_MHZ", "1.0"))  # agrupa por 1 MHz
+TIME_BIN_MIN = int(os.getenv("TIME_BIN_MIN", "15"))     # agrupa por 15 min
+COORD_DECIMALS = int(os.getenv("COORD_DECIMALS", "2"))  # 2 decimales ~1-2 km
+
+# Versión de esquema de clave (si cambias binning o formato, súbela)
+CACHE_KEY_VER = "v2"
+
+# Pool de ITURHFProp: deadline por petición (DXSpider abandona a los 0.5 s)
+_pool_cfg = CONFIG.get("engine_pool", {}) or {}
+ENGINE_DEADLINE_S = float(_pool_cfg.get("deadline_s", 0.5))
+RETRY_AFTER_S = int(_pool_cfg.get("retry_after_s", 1))
+
+# Deadline del llamante (/predict progresivo): el cálculo sigue tras el deadline hasta
+# background_s para rellenar la cache
+_prog_cfg = CONFIG.get("progressive", {}) or {}
+PROGRESSIVE_BACKGROUND_S = float(_prog_cfg.get("background_s", 10))
+
+# Singleflight: vida del lock de cálculo y espera máxima de la notificación de otro proceso
+LOCK_TTL_S = 30
+MAX_WAIT_S = 5.0
+
+# Caducadas servidas (stale-while-revalidate): copia local mientras llega el recálculo
+stale_cache = LocalCache(max_entries=local_cache.max_entries, ttl_s=STALE_LOCAL_TTL_S)
+
+DIGITAL_MODES = {"DIGITAL", "FT8", "FT4", "RTTY", "PSK", "CW"}
+
+# ------------------ Normalización, frecuencia y claves de cache ------------------
+
+def is_digital(mode: str) -> bool:
+    return (mode or "").upper() in DIGITAL_MODES
+
+def norm_mode(mode: str) -> str:
+    return "DIGITAL" if is_digital(mode) else "ANALOG"
+
+def to_mhz(freq: float) -> float:
+    """Si parece kHz (>1000), convierte a MHz; si ya es MHz, deja igual."""
+    f = float(freq)
+    if f > 1000.0:
+        # Mensaje solo a nivel debug para no ensuciar logs
+        logger.debug("Convirtiendo frecuencia de kHz a MHz: %.3f kHz -> %.3f MHz", f, f / 1000.0)
+        return f / 1000.0
+    return f
+
+def _freq_bin_mhz(f_mhz: float) -> float:
+    # Redondeo al múltiplo más cercano de 1 MHz (o del paso configurado)
+    step = FREQ_BIN_MHZ if FREQ_BIN_MHZ > 0 else 1.0
+    binned = round(round(float(f_mhz) / step) * step, 0)
+    return float(binned)
+
+def _time_bin(dt: datetime) -> str:
+    # Devuelve cadena YYYYMMDDTHHZ al múltiplo inferior de TIME_BIN_MIN
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    dt = dt.astimezone(timezone.utc)
+    minute = (dt.minute // TIME_BIN_MIN) * TIME_BIN_MIN
+    dtb = dt.replace(minute=minute, second=0, microsecond=0)
+    return dtb.strftime("%Y%m%dT%H%MZ")
+
+def cache_key(src_lat, src_lon, dst_lat, dst_lon, f_mhz: float, mode: str, dt: datetime) -> str:
+    # Asegura floats aunque vengan como str
+    try:
+        src_lat = float(src_lat); src_lon = float(src_lon)
+        dst_lat = float(dst_lat); dst_lon = float(dst_lon)
+    except Exception:
+        raise HTTPException(400, "Invalid coordinates (not numeric)")
+
+    fz = _freq_bin_mhz(f_mhz)
+    tz = _time_bin(dt)
+    mod = norm_mode(mode)
+
+    fmt = f"{{:.{COORD_DECIMALS}f}}"
+    s_lat = fmt.format(src_lat); s_lon = fmt.format(src_lon)
+    d_lat = fmt.format(dst_lat); d_lon = fmt.format(dst_lon)
+    return f"pred:{CACHE_KEY_VER}:{s_lat},{s_lon}->{d_lat},{d_lon}:{fz:.0f}MHz:{mod}:{tz}"
+
+# ------------------ Núcleo: cache + singleflight ------------------
+
+def to_float_coords(coords):
+    # coords puede venir como ('41.12','2.22') → devuelve (41.12, 2.22)
+    return (float(coords[0]), float(coords[1]))
+
+def compute_sp_lp(src_coords, dst_coords, dt: datetime, freq_mhz: float, mode: str) -> dict:
+    """
+    Ejecuta ITURHFProp dos veces (SP/LP) y devuelve:
+    {
+      "short_path": {"snr": int, "reliability": int},
+      "long_path":  {"snr": int, "reliability": int}
+    }
+    """
+    short_path = run_iturhfprop("SHORTPATH", src_coords, dst_coords, dt, freq_mhz, mode)
+    long_path  = run_iturhfprop("LONGPATH",  src_coords, dst_coords, dt, freq_mhz, mode)
+    return {"short_path": short_path, "long_path": long_path}
+
+def request_deadline(seconds: float = None) -> float:
+    return time.monotonic() + (ENGINE_DEADLINE_S if seconds is None else seconds)
+
+# ------------------ Cache en dos niveles: proceso (LRU) → Redis ------------------
+
+def _ttl_from_pttl(pttl) -> float:
+    # PTTL de Redis en ms (-1 sin TTL, -2 no existe) → segundos de vida fresca
+    # (Redis guarda además STALE_GRACE_S en los que la entrada ya está caducada)
+    return pttl / 1000.0 - STALE_GRACE_S if pttl and pttl > 0 else CACHE_EXPIRE
+
+def _prev_bin_key(key: str, dt: datetime) -> str:
+    # Misma clave con la franja anterior (solo cambia el sufijo de tiempo)
+    return key[:key.rindex(":") + 1] + _time_bin(dt - timedelta(minutes=TIME_BIN_MIN))
+
+def _read_pipeline(pipe, keys):
+    for k in keys:
+        pipe.get(k)
+        pipe.pttl(k)
+
+def _classify(key: str, replies):
+    """
+    Respuestas GET/PTTL de [clave, (clave de la franja anterior)] →
+    (fresca, caducada). La fresca pasa a la cache local con su vida restante.
+    """
+    raw, pttl = replies[0], replies[1]
+    if raw:
+        ttl = _ttl_from_pttl(pttl)
+        if ttl > 0:
+            CACHE_REQUESTS.labels("redis", "hit").inc()
+            val = json.loads(raw)
+            local_cache.set(key, val, ttl)
+            return val, None
+    CACHE_REQUESTS.labels("redis", "miss").inc()
+    # Caducada dentro del margen o, si no hay, la de la franja anterior
+    stale_raw = raw or (replies[2] if len(replies) > 2 else None)
+    return None, (json.loads(stale_raw) if stale_raw else None)
+
+def cache_get(key: str):
+    """Cache local y, si falla, Redis (GET + PTTL en un viaje). Devuelve dict fresco o None."""
+    val = local_cache.get(key)
+    if val is not None:
+        CACHE_REQUESTS.labels("local", "hit").inc()
+        return val
+    CACHE_REQUESTS.labels("local", "miss").inc()
+    pipe = r.pipeline(transaction=False)
+    _read_pipeline(pipe, [key])
+    with timed(REDIS_RTT, "cache_get"):
+        replies = pipe.execute()
+    return _classify(key, replies)[0]
+
+async def cache_get_async(key: str):
+    val = local_cache.get(key)
+    if val is not None:
+        CACHE_REQUESTS.labels("local", "hit").inc()
+        return val
+    CACHE_REQUESTS.labels("local", "miss").inc()
+    pipe = ar.pipeline(transaction=False)
+    _read_pipeline(pipe, [key])
+    with timed(REDIS_RTT, "cache_get"):
+        replies = await pipe.execute()
+    return _classify(key, replies)[0]
+
+def cache_get_swr(key: str, dt: datetime):
+    """
+    Como cache_get, pero en el mismo viaje a Redis trae también lo servible
+    caducado: la entrada pasada de CACHE_EXPIRE (dentro del margen) o la de
+    la franja anterior. Devuelve (fresca, caducada); como mucho una no es None.
+    """
+    val = local_cache.get(key)
+    if val is not None:
+        CACHE_REQUESTS.labels("local", "hit").inc()
+        return val, None
+    CACHE_REQUESTS.labels("local", "miss").inc()
+    stale = stale_cache.get(key)
+    if stale is not None:
+        return None, stale
+    keys = [key, _prev_bin_key(key, dt)] if STALE_GRACE_S > 0 else [key]
+    pipe = r.pipeline(transaction=False)
+    _read_pipeline(pipe, keys)
+    with timed(REDIS_RTT, "cache_get"):
+        replies = pipe.execute()
+    return _classify(key, replies)
+
+async def cache_get_swr_async(key: str, dt: datetime):
+    val = local_cache.get(key)
+    if val is not None:
+        CACHE_REQUESTS.labels("local", "hit").inc()
+        return val, None
+    CACHE_REQUESTS.labels("local", "miss").inc()
+    stale = stale_cache.get(key)
+    if stale is not None:
+        return None, stale
+    keys = [key, _prev_bin_key(key, dt)] if STALE_GRACE_S > 0 else [key]
+    pipe = ar.pipeline(transaction=False)
+    _read_pipeline(pipe, keys)
+    with timed(REDIS_RTT, "cache_get"):
+        replies = await pipe.execute()
+    return _classify(key, replies)
+
+def _serve_stale(key: str, stale: dict, args) -> dict:
+    """Entrada caducada servida ya; el recálculo queda encargado en segundo plano."""
+    CACHE_REQUESTS.labels("stale", "hit").inc()
+    stale_cache.set(key, stale)
+    revalidator.schedule(key, *args)
+    return {**stale, "stale": True}
+
+def _store(pipe, key: str, result: dict, ttl: int = None):
+    """SETEX + notificación a quien espera esa clave en otros procesos (mismo viaje)."""
+    ttl = CACHE_EXPIRE if ttl is None else ttl
+    raw = json.dumps(result)
+    pipe.setex(key, ttl + int(STALE_GRACE_S), raw)
+    flights.publish(pipe, key, raw)
+    local_cache.set(key, result, ttl)
+    stale_cache.delete(key)
+
+def _compute_and_store(key: str, src_coords, dst_coords, dt: datetime, freq_mhz: float, mode: str) -> dict:
+    # Se ejecuta en el pool: aunque el cliente abandone, si acaba antes del deadline del trabajo llena la cache
+    result = compute_sp_lp(src_coords, dst_coords, dt, freq_mhz, mode)
+    pipe = r.pipeline(transaction=False)
+    _store(pipe, key, result)
+    with timed(REDIS_RTT, "cache_set"):
+        pipe.execute()
+    return result
+
+def run_in_pool(fn, *args, deadline: float = None, priority: int = PRIORITY_NORMAL):
+    """Ejecuta en el pool de ITURHFProp traduciendo rechazo/deadline a 503."""
+    try:
+        return engine_pool.run(fn, *args, deadline=deadline, priority=priority)
+    except PoolFull:
+        BUSY.labels("pool_full").inc()
+        raise HTTPException(503, "Prediction busy, try again",
+                            headers={"Retry-After": str(RETRY_AFTER_S)})
+    except DeadlineExceeded:
+        BUSY.labels("deadline").inc()
+        raise HTTPException(503, "Prediction deadline exceeded",
+                            headers={"Retry-After": str(RETRY_AFTER_S)})
+
+def get_prediction_with_cache(src_coords, dst_coords, dt: datetime, freq_mhz: float, mode: str,
+                              deadline: float = None, priority: int = PRIORITY_NORMAL, allow_stale: bool = True):
+    """
+    Primero tablas precalculadas (mmap); después cache por clave normalizada y la
+    matriz banda × hora del camino (path_matrix). Con allow_stale, una entrada
+    caducada (margen de gracia o franja anterior) se devuelve al momento con
+    "stale": True y se recalcula en segundo plano. Si no hay nada:
+    - En el proceso, llamadas concurrentes con la misma clave esperan un único Future.
+    - Entre procesos, lock distribuido de Redis: solo 1 calcula (singleflight) y
+      publica el resultado; el resto lo recibe por pub/sub, sin polling.
+    - El cálculo va al pool acotado de ITURHFProp con el deadline de la petición.
+    Devuelve (prediction_dict, cached_bool).
+    """
+    if deadline is None:
+        deadline = request_deadline()
+
+    # Asegura que trabajamos con floats siempre
+    src_coords = to_float_coords(src_coords)
+    dst_coords = to_float_coords(dst_coords)
+
+    # Tablas precalculadas: índice de array, sin Redis ni ITURHFProp
+    tbl = prop_tables.lookup(src_coords, dst_coords, dt, freq_mhz, mode)
+    if tbl is not None:
+        CACHE_REQUESTS.labels("tables", "hit").inc()
+        return tbl, True
+    if prop_tables.enabled:
+        CACHE_REQUESTS.labels("tables", "miss").inc()
+    prop_tables.note_pair(src_coords, dst_coords)
+
+    key = cache_key(src_coords[0], src_coords[1],
+                     dst_coords[0], dst_coords[1],
+                     freq_mhz, mode, dt)
+
+    cached, stale = cache_get_swr(key, dt) if allow_stale else (cache_get(key), None)
+    if cached is not None:
+        return cached, True
+
+    # Matriz banda × hora del camino: si falta, se encarga en segundo plano
+    vec = path_matrices.lookup(src_coords, dst_coords, dt, freq_mhz, norm_mode(mode))
+    if vec is not None:
+        return vec, True
+
+    if stale is not None:
+        return _serve_stale(key, stale, (src_coords, dst_coords, dt, freq_mhz, mode)), True
+
+    fut, leader = flights.join(key)
+    if not leader:
+        return _follow(fut, deadline), True
+    try:
+        result = _lead(key, fut, src_coords, dst_coords, dt, freq_mhz, mode, deadline, priority)
+    except BaseException as e:
+        flights.finish(key, fut, exc=e if isinstance(e, Exception) else _lock_busy())
+        raise
+    flights.finish(key, fut, result[0])
+    return result
+
+def _lock_busy() -> HTTPException:
+    SINGLEFLIGHT.labels("timeout").inc()
+    BUSY.labels("lock").inc()
+    return HTTPException(503, "Prediction busy, try again")
+
+def _follow(fut, deadline: float) -> dict:
+    """Misma clave ya en vuelo en este proceso: espera el resultado de la líder (sin Redis)."""
+    t_wait = time.perf_counter()
+    try:
+        val = fut.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeout:
+        raise _lock_busy()
+    finally:
+        SINGLEFLIGHT_WAIT.labels("local").observe(time.perf_counter() - t_wait)
+    SINGLEFLIGHT.labels("local_wait").inc()
+    return val
+
+def _lead(key: str, fut, src_coords, dst_coords, dt: datetime, freq_mhz: float, mode: str,
+          deadline: float, priority: int):
+    """Líder del proceso: calcula si gana el lock de Redis; si no, espera la notificación."""
+    lock = r.lock(f"lock:{key}", timeout=LOCK_TTL_S)
+    if lock.acquire(blocking=False):
+        try:
+            # Doble-check de cache tras adquirir el lock
+            cached2 = cache_get(key)
+            if cached2 is not None:
+                SINGLEFLIGHT.labels("acquired_cached").inc()
+                return cached2, True
+            SINGLEFLIGHT.labels("acquired").inc()
+            return run_in_pool(_compute_and_store, key, src_coords, dst_coords, dt, freq_mhz, mode,
+                               deadline=deadline, priority=priority), False
+        finally:
+            try:
+                lock.release()
+            except Exception:
+                pass
+
+    # Otro proceso calcula: el suscriptor resuelve nuestro Future al publicarse el resultado.
+    # Suscrito antes de releer la cache → no se pierde un fin que ocurra entre medias.
+    t_wait = time.perf_counter()
+    flights.ensure_listener()
+    val = cache_get(key)
+    if val is None:
+        try:
+            val = fut.result(timeout=max(0.0, min(MAX_WAIT_S, deadline - time.monotonic())))
+        except FutureTimeout:
+            val = cache_get(key)   # notificación perdida (suscriptor reconectando)
+    SINGLEFLIGHT_WAIT.labels("remote").observe(time.perf_counter() - t_wait)
+    if val is not None:
+        local_cache.set(key, val, CACHE_EXPIRE)
+        SINGLEFLIGHT.labels("notified").inc()
+        return val, True
+
+    # Sin resultado a tiempo: si el lock quedó libre, calculamos nosotros
+    if lock.acquire(blocking=False):
+        SINGLEFLIGHT.labels("late_acquired").inc()
+        try:
+            return run_in_pool(_compute_and_store, key, src_coords, dst_coords, dt, freq_mhz, mode,
+                               deadline=deadline, priority=priority), False
+        finally:
+            try:
+                lock.release()
+            except Exception:
+                pass
+    raise _lock_busy()
+
+# ------------------ Revalidación en segundo plano (stale-while-revalidate) ------------------
+
+def _revalidate(key: str, src_coords, dst_coords, dt: datetime, freq_mhz: float, mode: str):
+    # Hilo del revalidador (nunca un worker del pool): singleflight normal a baja prioridad
+    get_prediction_with_cache(src_coords, dst_coords, dt, freq_mhz, mode,
+                              deadline=request_deadline(SWR_DEADLINE_S), priority=PRIORITY_LOW, allow_stale=False)
+
+revalidator = Revalidator(_revalidate)
+
+def start_revalidator():
+    """Arranca el hilo que recalcula las entradas servidas caducadas."""
+    revalidator.start()
+
+_area_cfg = CONFIG.get("iturhfprop", {}).get("area", {}) or {}
+# /predict/batch: parte del deadline que se espera a la ejecución de área
+AREA_BUDGET_FRAC = float(_area_cfg.get("budget_frac", 0.6))
+# Celda más cercana de una rejilla gruesa, no el punto exacto: vida corta y marca "approx".
+# Al caducar se sirve como stale y el revalidador la sustituye por el cálculo exacto.
+AREA_TTL_S = int(_area_cfg.get("ttl_s", 120))
+
+def _area_min_receivers() -> int:
+    return max(1, int(_area_cfg.get("min_receivers", 4)))
+
+def _area_sp_lp(dx_coords, receivers, dt: datetime, freq_mhz: float, mode: str):
+    return (run_iturhfprop_receivers("SHORTPATH", dx_coords, receivers, dt, freq_mhz, mode),
+            run_iturhfprop_receivers("LONGPATH",  dx_coords, receivers, dt, freq_mhz, mode))
+
+def _area_results(missing, sps, lps):
+    """[(clave, predicción aproximada)] de los receptores con dato SP y LP."""
+    return [(key, {"short_path": sp, "long_path": lp, "approx": True})
+            for (key, _), sp, lp in zip(missing, sps, lps) if sp and lp]
+
+def missing_paths(dx_coords, src_coords_list, dt: datetime, freq_mhz: float, mode: str) -> list:
+    """[(clave, coords)] de los caminos src→dx que no están en cache (local ni Redis)."""
+    keys = [cache_key(c[0], c[1], dx_coords[0], dx_coords[1], freq_mhz, mode, dt) for c in src_coords_list]
+    remote = [(k, c) for k, c in zip(keys, src_coords_list) if local_cache.get(k) is None]
+    values = r.mget([k for k, _ in remote]) if remote else []
+    return [kc for kc, v in zip(remote, values) if v is None]
+
+def _area_compute_and_store(dx_coords, missing, dt: datetime, freq_mhz: float, mode: str) -> int:
+    # Se ejecuta en el pool: aunque el llamante deje de esperar, si acaba antes del deadline llena la cache
+    sps, lps = _area_sp_lp(dx_coords, [c for _, c in missing], dt, freq_mhz, mode)
+    filled = _area_results(missing, sps, lps)
+    pipe = r.pipeline(transaction=False)
+    for key, pred in filled:
+        _store(pipe, key, pred, AREA_TTL_S)
+    with timed(REDIS_RTT, "cache_set"):
+        pipe.execute()
+    return len(filled)
+
+def prefill_area(dx_coords, src_coords_list, dt: datetime, freq_mhz: float, mode: str,
+                 deadline: float = None, priority: int = PRIORITY_NORMAL) -> int:
+    """
+    Fan-out: rellena la cache de varios caminos src→dx con una única ejecución
+    de área por SP/LP (TX = DX, rejilla de RX = usuarios; se asume reciprocidad
+    del camino). Solo actúa si hay suficientes caminos sin cache.
+    Devuelve el número de claves rellenadas (0 si no llegó a tiempo).
+    """
+    missing = missing_paths(dx_coords, src_coords_list, dt, freq_mhz, mode)
+    if len(missing) < _area_min_receivers():
+        return 0
+
+    try:
+        return engine_pool.run(_area_compute_and_store, dx_coords, missing, dt, freq_mhz, mode, deadline=deadline,
+                               priority=priority)
+    except Exception as e:
+        logger.warning(f"⚠️ Ejecución de área fallida, se calcula por camino: {e}")
+        return 0
+
+# ------------------ Camino asíncrono ------------------
+
+async def compute_sp_lp_async(src_coords, dst_coords, dt: datetime, freq_mhz: float, mode: str) -> dict:
+    """SP y LP en paralelo (asyncio.create_subprocess_exec), mismo formato que compute_sp_lp."""
+    short_path, long_path = await asyncio.gather(
+        run_iturhfprop_async("SHORTPATH", src_coords, dst_coords, dt, freq_mhz, mode),
+        run_iturhfprop_async("LONGPATH",  src_coords, dst_coords, dt, freq_mhz, mode),
+    )
+    return {"short_path": short_path, "long_path": long_path}
+
+async def _compute_and_store_async(key: str, src_coords, dst_coords, dt: datetime, freq_mhz: float, mode: str) -> dict:
+    result = await compute_sp_lp_async(src_coords, dst_coords, dt, freq_mhz, mode)
+    pipe = ar.pipeline(transaction=False)
+    _store(pipe, key, result)
+    with timed(REDIS_RTT, "cache_set"):
+        await pipe.execute()
+    return result
+
+async def run_in_gate(coro_fn, *args, deadline: float = None):
+    """Como run_in_pool pero en la compuerta asíncrona (sin hilos)."""
+    try:
+        return await engine_gate.run(coro_fn, *args, deadline=deadline)
+    except PoolFull:
+        BUSY.labels("pool_full").inc()
+        raise HTTPException(503, "Prediction busy, try again",
+                            headers={"Retry-After": str(RETRY_AFTER_S)})
+    except DeadlineExceeded:
+        BUSY.labels("deadline").inc()
+        raise HTTPException(503, "Prediction deadline exceeded",
+                            headers={"Retry-After": str(RETRY_AFTER_S)})
+
+async def get_prediction_with_cache_async(src_coords, dst_coords, dt: datetime, freq_mhz: float, mode: str,
+                                          deadline: float = None, allow_stale: bool = True,
+                                          progressive: bool = False, compute: bool = True):
+    """
+    Versión asíncrona de get_prediction_with_cache: Redis asíncrono, lock
+    awaitable y esperas sobre el mismo Future compartido; el event loop nunca se bloquea.
+    Con progressive, si hay que calcular se hace SP primero: al vencer el
+    deadline se devuelve SP con LP pendiente ("partial": True) y el cálculo
+    sigue en segundo plano (hasta background_s más) para completar la cache.
+    Sin compute solo se consulta (tablas, cache, matriz, caducada): si no hay
+    nada, 503 sin encargar cálculo (p. ej. deadline ya vencido en /predict/batch).
+    Devuelve (prediction_dict, cached_bool).
+    """
+    if deadline is None:
+        deadline = request_deadline()
+
+    src_coords = to_float_coords(src_coords)
+    dst_coords = to_float_coords(dst_coords)
+
+    tbl = prop_tables.lookup(src_coords, dst_coords, dt, freq_mhz, mode)
+    if tbl is not None:
+        CACHE_REQUESTS.labels("tables", "hit").inc()
+        return tbl, True
+    if prop_tables.enabled:
+        CACHE_REQUESTS.labels("tables", "miss").inc()
+    prop_tables.note_pair(src_coords, dst_coords)
+
+    key = cache_key(src_coords[0], src_coords[1],
+                    dst_coords[0], dst_coords[1],
+                    freq_mhz, mode, dt)
+
+    if allow_stale:
+        cached, stale = await cache_get_swr_async(key, dt)
+    else:
+        cached, stale = await cache_get_async(key), None
+    if cached is not None:
+        return cached, True
+
+    vec = await path_matrices.lookup_async(src_coords, dst_coords, dt, freq_mhz, norm_mode(mode))
+    if vec is not None:
+        return vec, True
+
+    if stale is not None:
+        return _serve_stale(key, stale, (src_coords, dst_coords, dt, freq_mhz, mode)), True
+
+    if not compute:
+        BUSY.labels("deadline").inc()
+        raise HTTPException(503, "Prediction deadline exceeded", headers={"Retry-After": str(RETRY_AFTER_S)})
+
+    fut, leader = flights.join(key)
+    if not leader:
+        try:
+            return await _follow_async(fut, deadline), True
+        except HTTPException:
+            # La líder ya tiene SP y calcula LP: mismo parcial que ella
+            if progressive and key in _sp_partial:
+                return partial_prediction(_sp_partial[key]), False
+            raise
+    try:
+        result = await _lead_async(key, fut, src_coords, dst_coords, dt, freq_mhz, mode, deadline, progressive)
+    except BaseException as e:
+        # Cancelación (cliente que abandona) incluida: las seguidoras reciben un 503, no CancelledError
+        flights.finish(key, fut, exc=e if isinstance(e, Exception) else _lock_busy())
+        raise
+    if not result[0].get("partial"):
+        # Parcial: las seguidoras esperan al resultado completo (lo entrega el cálculo en segundo plano)
+        flights.finish(key, fut, result[0])
+    return result
+
+async def _await_flight(fut, timeout: float):
+    # shield: si vence la espera no se cancela el Future compartido
+    waiter = asyncio.wrap_future(fut)
+    try:
+        return await asyncio.wait_for(asyncio.shield(waiter), max(0.0, timeout))
+    finally:
+        if not waiter.done():
+            # Nadie lo esperará ya: se consume su excepción para que asyncio no la registre
+            waiter.add_done_callback(lambda w: w.cancelled() or w.exception())
+
+async def _follow_async(fut, deadline: float) -> dict:
+    t_wait = time.perf_counter()
+    try:
+        val = await _await_flight(fut, deadline - time.monotonic())
+    except asyncio.TimeoutError:
+        raise _lock_busy()
+    finally:
+        SINGLEFLIGHT_WAIT.labels("local").observe(time.perf_counter() - t_wait)
+    SINGLEFLIGHT.labels("local_wait").inc()
+    return val
+
+async def _lead_async(key: str, fut, src_coords, dst_coords, dt: datetime, freq_mhz: float, mode: str,
+                      deadline: float, progressive: bool = False):
+    lock = ar.lock(f"lock:{key}", timeout=LOCK_TTL_S)
+    if await lock.acquire(blocking=False):
+        try:
+            cached2 = await cache_get_async(key)
+            if cached2 is not None:
+                SINGLEFLIGHT.labels("acquired_cached").inc()
+                await _release(lock)
+                return cached2, True
+            SINGLEFLIGHT.labels("acquired").inc()
+        except BaseException:
+            await _release(lock)
+            raise
+        return await _compute_locked_async(key, fut, lock, src_coords, dst_coords, dt, freq_mhz, mode,
+                                           deadline, progressive)
+
+    t_wait = time.perf_counter()
+    if not flights.listening:
+        await asyncio.to_thread(flights.ensure_listener)
+    val = await cache_get_async(key)
+    if val is None:
+        try:
+            val = await _await_flight(fut, min(MAX_WAIT_S, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            val = await cache_get_async(key)
+    SINGLEFLIGHT_WAIT.labels("remote").observe(time.perf_counter() - t_wait)
+    if val is not None:
+        local_cache.set(key, val, CACHE_EXPIRE)
+        SINGLEFLIGHT.labels("notified").inc()
+        return val, True
+
+    if await lock.acquire(blocking=False):
+        SINGLEFLIGHT.labels("late_acquired").inc()
+        return await _compute_locked_async(key, fut, lock, src_coords, dst_coords, dt, freq_mhz, mode,
+                                           deadline, progressive)
+    raise _lock_busy()
+
+async def _release(lock):
+    try:
+        await lock.release()
+    except Exception:
+        pass
+
+async def _compute_locked_async(key: str, fut, lock, src_coords, dst_coords, dt: datetime, freq_mhz: float,
+                                mode: str, deadline: float, progressive: bool):
+    """Cálculo con el lock ya adquirido; lo libera siempre (en modo progresivo, al terminar el cálculo)."""
+    if progressive:
+        return await _compute_progressive_async(key, fut, lock, src_coords, dst_coords, dt, freq_mhz, mode,
+                                                deadline)
+    try:
+        return await run_in_gate(_compute_and_store_async, key, src_coords, dst_coords, dt, freq_mhz, mode,
+                                 deadline=deadline), False
+    finally:
+        await _release(lock)
+
+# ------------------ Modo progresivo: SP primero, LP pendiente ------------------
+
+_background = set()   # referencias a los cálculos que siguen tras responder
+_sp_partial = {}      # clave → SP ya calculado mientras LP sigue en curso
+
+async def _compute_sp_first_async(key: str, src_coords, dst_coords, dt: datetime, freq_mhz: float, mode: str,
+                                  sp_ready: asyncio.Future) -> dict:
+    """SP (lo que DXSpider muestra antes) y después LP; SP se publica en sp_ready en cuanto existe."""
+    short_path = await run_iturhfprop_async("SHORTPATH", src_coords, dst_coords, dt, freq_mhz, mode)
+    if not sp_ready.done():
+        sp_ready.set_result(short_path)
+    _sp_partial[key] = short_path
+    try:
+        long_path = await run_iturhfprop_async("LONGPATH", src_coords, dst_coords, dt, freq_mhz, mode)
+    finally:
+        _sp_partial.pop(key, None)
+    result = {"short_path": short_path, "long_path": long_path}
+    pipe = ar.pipeline(transaction=False)
+    _store(pipe, key, result)
+    with timed(REDIS_RTT, "cache_set"):
+        await pipe.execute()
+    return result
+
+async def _finish_in_background(task, key: str, fut, lock):
+    # Dueña del singleflight y del lock tras responder: las seguidoras reciben el resultado completo
+    try:
+        flights.finish(key, fut, await task)
+    except BaseException as e:
+        flights.finish(key, fut, exc=e if isinstance(e, Exception) else HTTPException(503, "Prediction cancelled"))
+    finally:
+        await _release(lock)
+
+def partial_prediction(short_path: dict) -> dict:
+    return {"short_path": short_path,
+            "long_path": {"snr": 0, "reliability": 0, "pending": True},
+            "partial": True}
+
+async def _compute_progressive_async(key: str, fut, lock, src_coords, dst_coords, dt: datetime,
+                                     freq_mhz: float, mode: str, deadline: float):
+    sp_ready = asyncio.get_running_loop().create_future()
+    try:
+        # Encolado aunque venza el deadline del llamante: arranca si queda hueco en background_s
+        task = engine_gate.submit(_compute_sp_first_async, key, src_coords, dst_coords, dt, freq_mhz, mode,
+                                  sp_ready, deadline=deadline + PROGRESSIVE_BACKGROUND_S)
+    except PoolFull:
+        await _release(lock)
+        BUSY.labels("pool_full").inc()
+        raise HTTPException(503, "Prediction busy, try again",
+                            headers={"Retry-After": str(RETRY_AFTER_S)})
+    bg = asyncio.ensure_future(_finish_in_background(task, key, fut, lock))
+    _background.add(bg)
+    bg.add_done_callback(_background.discard)
+
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), max(0.0, deadline - time.monotonic())), False
+    except asyncio.TimeoutError:
+        pass
+    if sp_ready.done():
+        return partial_prediction(sp_ready.result()), False
+    BUSY.labels("deadline").inc()
+    raise HTTPException(503, "Prediction deadline exceeded", headers={"Retry-After": str(RETRY_AFTER_S)})
+
+async def prefill_area_async(dx_coords, src_coords_list, dt: datetime, freq_mhz: float, mode: str,
+                             deadline: float = None) -> int:
+    """
+    prefill_area sin bloquear el event loop (la ejecución de área va al pool
+    de hilos). Se espera solo AREA_BUDGET_FRAC del tiempo hasta deadline: el
+    resto queda para los caminos sueltos. Si no llega, la ejecución sigue hasta
+    el deadline y, si acaba, rellena la cache (guarda en el propio trabajo del pool).
+    """
+    keys = [cache_key(c[0], c[1], dx_coords[0], dx_coords[1], freq_mhz, mode, dt) for c in src_coords_list]
+    remote = [(k, c) for k, c in zip(keys, src_coords_list) if local_cache.get(k) is None]
+    values = await ar.mget([k for k, _ in remote]) if remote else []
+    missing = [kc for kc, v in zip(remote, values) if v is None]
+    if len(missing) < _area_min_receivers():
+        return 0
+
+    timeout = None if deadline is None else AREA_BUDGET_FRAC * (deadline - time.monotonic())
+    try:
+        fut = engine_pool.submit(_area_compute_and_store, dx_coords, missing, dt, freq_mhz, mode, deadline=deadline)
+        return await _await_flight(fut, timeout) if timeout is not None else await asyncio.wrap_future(fut)
+    except asyncio.TimeoutError:
+        logger.debug("Ejecución de área fuera de plazo: sigue en segundo plano (%d caminos)", len(missing))
+        return 0
+    except Exception as e:
+        logger.warning(f"⚠️ Ejecución de área fallida, se calcula por camino: {e!r}")
+        return 0
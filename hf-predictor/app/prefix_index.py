@@ -0,0 +1,114 @@
+# app/prefix_index.py
+import logging
+from collections import OrderedDict
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+# Campos de una entrada completa (cty.dat); las del JSON solo traen (lat, lon)
+INFO_FIELDS = ("lat", "lon", "cq", "itu", "continent", "entity")
+
+
+class PrefixIndex:
+    """
+    Índice de prefijos para búsqueda por prefijo más largo.
+
+    - Tabla única prefijo→entrada; la búsqueda prueba cs[:L] desde la longitud
+      máxima de prefijo hacia abajo → O(len(callsign)) lookups de dict.
+    - Indicativos exactos (=CALL de cty.dat) antes que cualquier prefijo.
+    - Cache frontal LRU (indicativo → entrada) para los indicativos que se
+      repiten continuamente (usuarios conectados, skimmers RBN).
+    - replace() sustituye las tablas de golpe (recarga en caliente): los
+      lectores ven las tablas viejas o las nuevas, nunca una mezcla.
+    """
+
+    def __init__(self, prefix_map: dict, front_cache_size: int = 4096, exact: dict = None, source: str = ""):
+        self._state = self._build(prefix_map, exact)
+        self.source = source
+
+        self._front = OrderedDict()
+        self._front_size = int(front_cache_size)
+        self._front_lock = Lock()
+        self._gen = 0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    @staticmethod
+    def _build(prefix_map: dict, exact: dict = None):
+        table = {}
+        for prefix, entry in prefix_map.items():
+            p = prefix.upper()
+            # Mismo criterio que el escaneo lineal: ante duplicados gana el primero
+            if p and p not in table:
+                table[p] = tuple(entry)
+        exact_table = {call.upper(): tuple(entry) for call, entry in (exact or {}).items()}
+        return table, exact_table, max((len(p) for p in table), default=0)
+
+    def replace(self, prefix_map: dict, exact: dict = None, source: str = ""):
+        """Cambio atómico de tablas; la cache frontal se vacía (y no admite resultados viejos)."""
+        state = self._build(prefix_map, exact)
+        with self._front_lock:
+            self._state = state
+            self.source = source
+            self._front.clear()
+            self._gen += 1
+            self.reloads += 1
+
+    def __len__(self):
+        return len(self._state[0])
+
+    @staticmethod
+    def _resolve(cs: str, state):
+        table, exact, max_len = state
+        entry = exact.get(cs)
+        if entry is not None:
+            return entry
+        for n in range(min(len(cs), max_len), 0, -1):
+            entry = table.get(cs[:n])
+            if entry is not None:
+                return entry
+        return None
+
+    def _entry(self, callsign: str):
+        cs = (callsign or "").upper()
+        front = self._front
+        with self._front_lock:
+            if cs in front:
+                front.move_to_end(cs)
+                self.hits += 1
+                return front[cs]
+            gen, state = self._gen, self._state
+
+        entry = self._resolve(cs, state)
+
+        with self._front_lock:
+            self.misses += 1
+            # Si hubo recarga mientras se resolvía, el resultado es de la tabla vieja
+            if self._front_size > 0 and gen == self._gen:
+                front[cs] = entry
+                if len(front) > self._front_size:
+                    front.popitem(last=False)
+        return entry
+
+    def lookup(self, callsign: str):
+        """Devuelve (lat, lon) del indicativo exacto o del prefijo más largo que casa, o None."""
+        entry = self._entry(callsign)
+        return entry[:2] if entry is not None else None
+
+    def lookup_info(self, callsign: str):
+        """Como lookup, con zonas CQ/ITU, continente y entidad si la fuente los trae."""
+        entry = self._entry(callsign)
+        return dict(zip(INFO_FIELDS, entry)) if entry is not None else None
+
+    def stats(self) -> dict:
+        table, exact, _ = self._state
+        return {
+            "source": self.source,
+            "prefixes": len(table),
+            "exact": len(exact),
+            "front_cache": len(self._front),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+        }
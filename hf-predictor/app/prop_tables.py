@@ -0,0 +1,272 @@
+# app/prop_tables.py
+"""
+Tablas de propagación precalculadas con lectura memory-mapped.
+
+Para los pares de localizaciones más pedidos se precalcula SNR y fiabilidad
+SP/LP por (par, modo, banda, hora UTC) con el SSN del mes en curso (por
+cubetas). Se guardan como .npy y se abren con mmap: sobreviven a reinicios
+del contenedor y una consulta es un índice de array.
+
+  tabla[par, modo, banda, hora, camino, métrica]   (float32, NaN = sin dato)
+    modo:    0 ANALOG, 1 DIGITAL
+    camino:  0 SHORTPATH, 1 LONGPATH
+    métrica: 0 snr, 1 reliability (sin ajuste Kp; se aplica al consultar)
+
+Se reconstruyen al cambiar el mes o la cubeta de SSN (la generación nueva
+recalcula todos los pares y se publica completa); los pares nuevos se añaden
+de forma incremental. Una tabla de otra cubeta de SSN no responde consultas. Las ejecuciones van al pool de ITURHFProp con
+PRIORITY_LOW, una a una, como las matrices de path_matrix.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+
+from config import CONFIG
+from engine_pool import PRIORITY_LOW, PoolFull, pool as engine_pool
+from hf_utils import HF_BANDS, band_index, get_effective_ssn, r, run_iturhfprop_vector, _kp_factor
+from leader import LeaderElection
+
+logger = logging.getLogger(__name__)
+
+MODES = ("ANALOG", "DIGITAL")
+PATHS = ("SHORTPATH", "LONGPATH")
+COORD_DECIMALS = int(os.getenv("COORD_DECIMALS", "2"))
+
+PAIRS_KEY = "proptable:pairs"        # ZSET par → peticiones
+POOL_RETRY_S = 1.0                   # cola del pool llena: espera antes de reintentar
+
+
+def _cfg() -> dict:
+    return CONFIG.get("prop_tables", {}) or {}
+
+
+def pair_key(src, dst) -> str:
+    fmt = f"{{:.{COORD_DECIMALS}f}}"
+    return (f"{fmt.format(float(src[0]))},{fmt.format(float(src[1]))}"
+            f"->{fmt.format(float(dst[0]))},{fmt.format(float(dst[1]))}")
+
+
+def _parse_pair_key(pk: str):
+    src, dst = pk.split("->")
+    s_lat, s_lon = src.split(","); d_lat, d_lon = dst.split(",")
+    return (float(s_lat), float(s_lon)), (float(d_lat), float(d_lon))
+
+
+def ssn_bucket(ssn: int) -> int:
+    step = max(1, int(_cfg().get("ssn_bucket", 10)))
+    return int(ssn) // step * step + step // 2
+
+
+class PropTables:
+    def __init__(self, path: str, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self.meta_path = os.path.join(path, "meta.json")
+        self._table = None      # np.memmap (solo lectura)
+        self._pairs = {}        # pair_key → fila
+        self._meta = {}
+        self._meta_mtime = None
+        self._pending = Counter()
+        self._pending_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # ------------- lectura -------------
+
+    def reload(self):
+        """Reabre la tabla si meta.json ha cambiado (publicada por otro proceso)."""
+        try:
+            mtime = os.path.getmtime(self.meta_path)
+        except OSError:
+            return
+        if mtime == self._meta_mtime:
+            return
+        try:
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+            table = np.load(os.path.join(self.path, meta["table_file"]), mmap_mode="r")
+        except Exception:
+            logger.exception("prop_tables: error loading %s", self.meta_path)
+            return
+        # Intercambio por referencia: los lectores ven la tabla vieja o la nueva
+        self._table, self._pairs, self._meta = table, {p: i for i, p in enumerate(meta["pairs"])}, meta
+        self._meta_mtime = mtime
+        logger.info("prop_tables: loaded %d pairs (%04d-%02d SSN≈%d)",
+                    len(meta["pairs"]), meta["year"], meta["month"], meta["ssn"])
+
+    def lookup(self, src, dst, dt: datetime, freq_mhz: float, mode: str):
+        """
+        Devuelve {"short_path": {...}, "long_path": {...}} interpolando entre
+        horas, o None si no hay entrada (par, mes, cubeta de SSN o banda fuera
+        de tabla).
+        """
+        table, meta = self._table, self._meta
+        if table is None or dt.year != meta.get("year") or dt.month != meta.get("month"):
+            return None
+        # Tabla de otra cubeta de SSN (aún sin reconstruir): mejor calcular que servir datos viejos
+        if meta.get("ssn") != ssn_bucket(get_effective_ssn(dt)):
+            return None
+        row = self._pairs.get(pair_key(src, dst))
+        band = band_index(freq_mhz)
+        if row is None or band is None:
+            self.misses += 1
+            return None
+
+        m = 1 if mode == "DIGITAL" else 0
+        h0 = dt.hour; h1 = (h0 + 1) % 24
+        w = dt.minute / 60.0
+        v = (1.0 - w) * table[row, m, band, h0] + w * table[row, m, band, h1]   # (camino, métrica)
+        if np.isnan(v).any():
+            self.misses += 1
+            return None
+
+        kp_adj = _kp_factor()
+        factor = kp_adj[1] if kp_adj is not None else 1.0
+        self.hits += 1
+        return {
+            name: {"snr": int(round(v[i, 0])), "reliability": int(round(v[i, 1] * factor)), "metric": "TABLE"}
+            for i, name in ((0, "short_path"), (1, "long_path"))
+        }
+
+    def note_pair(self, src, dst):
+        """Cuenta una petición que no pudo responder la tabla (candidato a precálculo)."""
+        if not self.enabled:
+            return
+        with self._pending_lock:
+            self._pending[pair_key(src, dst)] += 1
+
+    # ------------- construcción -------------
+
+    def _flush_pending(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, Counter()
+        if pending:
+            pipe = r.pipeline()
+            for pk, n in pending.items():
+                pipe.zincrby(PAIRS_KEY, n, pk)
+            pipe.execute()
+
+    @staticmethod
+    def _run_in_pool(fn, *args, **kwargs):
+        # Pool acotado a baja prioridad, de uno en uno: nunca adelanta ni desplaza a peticiones
+        while True:
+            try:
+                return engine_pool.submit(fn, *args, priority=PRIORITY_LOW, **kwargs).result()
+            except PoolFull:
+                time.sleep(POOL_RETRY_S)
+
+    def _compute_pair(self, src, dst, year: int, month: int, ssn: int) -> np.ndarray:
+        # Modo vector: una ejecución por (modo, camino) cubre todas las bandas × 24 h
+        out = np.full((len(MODES), len(HF_BANDS), 24, len(PATHS), 2), np.nan, dtype=np.float32)
+        dt = datetime(year, month, 15)
+        for m, mode in enumerate(MODES):
+            for p, path_type in enumerate(PATHS):
+                try:
+                    grid = self._run_in_pool(run_iturhfprop_vector, path_type, src, dst, dt, mode, ssn=ssn,
+                                             apply_kp=False)
+                except Exception as e:
+                    logger.debug("prop_tables: %s %s: %s", path_type, mode, e)
+                    continue
+                out[m, :, :, p, 0] = grid["snr"]
+                out[m, :, :, p, 1] = grid["reliability"]
+        return out
+
+    def _publish(self, table: np.ndarray, pairs: list, year: int, month: int, ssn: int):
+        os.makedirs(self.path, exist_ok=True)
+        table_file = f"table-{year:04d}{month:02d}-{ssn}-{int(time.time())}.npy"
+        tmp = os.path.join(self.path, table_file + ".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, table)
+        os.replace(tmp, os.path.join(self.path, table_file))
+
+        meta = {"year": year, "month": month, "ssn": ssn, "pairs": pairs,
+                "table_file": table_file, "built_utc": datetime.utcnow().isoformat()}
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.meta_path)
+
+        # Borra generaciones antiguas (los mmap abiertos siguen siendo válidos)
+        for name in os.listdir(self.path):
+            if name.startswith("table-") and name.endswith(".npy") and name != table_file:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+        self.reload()
+
+    def build_once(self):
+        """Un ciclo del constructor: reconstruye o amplía la tabla si hace falta."""
+        cfg = _cfg()
+        self._flush_pending()
+
+        now = datetime.utcnow()
+        ssn = ssn_bucket(get_effective_ssn(now))
+        max_pairs = int(cfg.get("max_pairs", 300))
+        min_hits = float(cfg.get("min_hits", 3))
+        wanted = [pk for pk, n in r.zrevrange(PAIRS_KEY, 0, max_pairs - 1, withscores=True) if n >= min_hits]
+
+        meta = self._meta
+        same_gen = (self._table is not None and meta.get("year") == now.year
+                    and meta.get("month") == now.month and meta.get("ssn") == ssn)
+        if same_gen:
+            pairs = list(meta["pairs"])
+            rows = [np.asarray(self._table[i]) for i in range(len(pairs))]
+        else:
+            pairs, rows = [], []
+            # La nueva generación recalcula también los pares de la anterior (no encoge la tabla)
+            popular = set(wanted)
+            wanted += [pk for pk in meta.get("pairs", []) if pk not in popular]
+            # Nuevo mes: reinicia la popularidad para seguir al tráfico actual
+            if meta and (meta.get("year"), meta.get("month")) != (now.year, now.month):
+                r.delete(PAIRS_KEY)
+
+        known = set(pairs)
+        new_pairs = [pk for pk in wanted if pk not in known][: max(0, max_pairs - len(pairs))]
+        if not new_pairs and same_gen:
+            return
+
+        # Ampliaciones: se publican por tandas. Generación nueva: solo completa; hasta entonces
+        # sigue publicada la anterior con todos sus pares
+        publish_every = max(1, int(cfg.get("publish_every", 10))) if same_gen else len(new_pairs)
+        logger.info("prop_tables: building %d new pairs (%04d-%02d SSN≈%d)", len(new_pairs), now.year, now.month, ssn)
+        for n, pk in enumerate(new_pairs, 1):
+            src, dst = _parse_pair_key(pk)
+            rows.append(self._compute_pair(src, dst, now.year, now.month, ssn))
+            pairs.append(pk)
+            if n % publish_every == 0 or n == len(new_pairs):
+                self._publish(np.stack(rows), pairs, now.year, now.month, ssn)
+
+    def run_forever(self):
+        interval = int(_cfg().get("check_interval_s", 300))
+        while True:
+            try:
+                self.reload()
+                # Un solo constructor entre procesos (lease renovado mientras vive); el resto solo recarga
+                if builder.is_leader:
+                    self.build_once()
+                else:
+                    self._flush_pending()
+            except Exception:
+                logger.exception("prop_tables: builder cycle failed")
+            time.sleep(interval)
+
+
+tables = PropTables(_cfg().get("path", "/data/prop_tables"), enabled=bool(_cfg().get("enabled", False)))
+builder = LeaderElection("prop-tables")
+
+
+def start_table_builder():
+    """Arranca el hilo de construcción/recarga de tablas (si está habilitado)."""
+    if not tables.enabled:
+        return
+    tables.reload()
+    builder.start()
+    threading.Thread(target=tables.run_forever, daemon=True).start()
+    logger.info("🧵 Hilo de tablas de propagación arrancado.")
@@ -0,0 +1,139 @@
+# app/revalidator.py
+"""
+Stale-while-revalidate para las predicciones en cache.
+
+Las claves llevan la franja de TIME_BIN_MIN minutos: en cada cambio de franja
+todas las claves calientes quedan frías a la vez y cada usuario conectado
+provocaba un cálculo. Ahora:
+
+- Redis guarda cada predicción CACHE_EXPIRE + grace_s; pasado CACHE_EXPIRE
+  sigue sirviéndose durante grace_s, marcada como "stale".
+- Al estrenar franja se sirve la entrada de la franja anterior (también
+  "stale") si la actual aún no existe.
+- Cada entrada servida caducada se recalcula aquí, una sola vez por clave,
+  a baja prioridad y con un retardo aleatorio de hasta jitter_s: los
+  recálculos de un cambio de franja se reparten en el tiempo en vez de
+  llegar juntos al pool de ITURHFProp.
+"""
+import heapq
+import logging
+import random
+import threading
+import time
+
+from fastapi import HTTPException
+
+from config import CONFIG
+from engine_pool import gate as engine_gate, pool as engine_pool
+from local_cache import LocalCache
+
+logger = logging.getLogger(__name__)
+
+_cfg = CONFIG.get("swr", {}) or {}
+ENABLED = bool(_cfg.get("enabled", True))
+GRACE_S = float(_cfg.get("grace_s", 300)) if ENABLED else 0.0
+JITTER_S = float(_cfg.get("jitter_s", 30))
+BUSY_RETRY_S = float(_cfg.get("busy_retry_s", 2))
+RETRY_S = float(_cfg.get("retry_s", 60))
+MAX_PENDING = int(_cfg.get("max_pending", 5000))
+DEADLINE_S = float(_cfg.get("deadline_s", 10))
+STALE_LOCAL_TTL_S = float(_cfg.get("local_ttl_s", 60))
+
+
+class Revalidator:
+    """
+    Cola por vencimiento de claves a recalcular. refresh(key, *args) hace el
+    cálculo (lo aporta prediction.py); aquí solo se decide cuándo y una vez.
+    """
+
+    def __init__(self, refresh):
+        self._refresh = refresh
+        self._cond = threading.Condition()
+        self._heap = []             # (vence_monotonic, seq, clave, args)
+        self._pending = set()
+        self._seq = 0
+        # Clave cuyo recálculo acaba de fallar: no se reintenta hasta retry_s
+        self._cooldown = LocalCache(max_entries=20000, ttl_s=RETRY_S)
+        self.scheduled = 0
+        self.deduped = 0
+        self.dropped = 0
+        self.deferred_busy = 0
+        self.refreshed = 0
+        self.failed = 0
+
+    def schedule(self, key: str, *args):
+        """No bloqueante: encarga el recálculo de key con retardo aleatorio (jitter)."""
+        if not ENABLED:
+            return
+        with self._cond:
+            if key in self._pending or self._cooldown.get(key) is not None:
+                self.deduped += 1
+                return
+            if len(self._pending) >= MAX_PENDING:
+                self.dropped += 1
+                return
+            self._push(time.monotonic() + random.uniform(0.0, JITTER_S), key, args)
+            self._pending.add(key)
+            self.scheduled += 1
+
+    def _push(self, due: float, key: str, args):
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, key, args))
+        self._cond.notify()
+
+    def _next(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    return heapq.heappop(self._heap)
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
+
+    @staticmethod
+    def _busy() -> bool:
+        # Las peticiones en curso tienen prioridad: con cola en el motor se espera
+        return engine_pool.stats()["queued"] > 0 or engine_gate.stats()["queued"] > 0
+
+    def run_forever(self):
+        while True:
+            _, _, key, args = self._next()
+            if self._busy():
+                self.deferred_busy += 1
+                with self._cond:
+                    self._push(time.monotonic() + random.uniform(BUSY_RETRY_S / 2, BUSY_RETRY_S), key, args)
+                continue
+            try:
+                self._refresh(key, *args)
+                self.refreshed += 1
+            except HTTPException:
+                # Pool lleno/deadline: la siguiente petición stale lo volverá a encargar
+                self.failed += 1
+                self._cooldown.set(key, True, BUSY_RETRY_S)
+            except Exception:
+                self.failed += 1
+                self._cooldown.set(key, True)
+                logger.exception("swr: error recalculando %s", key)
+            finally:
+                with self._cond:
+                    self._pending.discard(key)
+
+    def start(self):
+        if not ENABLED:
+            return
+        threading.Thread(target=self.run_forever, name="swr-revalidator", daemon=True).start()
+        logger.info("🧵 Hilo de revalidación de cache (stale-while-revalidate) arrancado.")
+
+    def stats(self) -> dict:
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            "enabled": ENABLED,
+            "grace_s": GRACE_S,
+            "pending": pending,
+            "scheduled": self.scheduled,
+            "deduped": self.deduped,
+            "dropped": self.dropped,
+            "deferred_busy": self.deferred_busy,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# app/roles.py
+"""
+Roles de proceso para desplegar en varios procesos/núcleos.
+
+  api               endpoints HTTP (uvicorn main:app, escalable con --workers N)
+  ingest            sesiones telnet del RBN → stream rbn:spots; una sola vez
+                    entre todos los procesos (líder por lease en Redis)
+  predictor-worker  consumidor del stream (grupo de consumidores: se reparten
+                    los spots entre procesos) y constructor de tablas
+
+Cada proceso arranca solo los hilos de sus roles: config process.roles o,
+con prioridad, la variable PROCESS_ROLES="api,predictor-worker". Por defecto
+los tres, como el despliegue de un solo proceso; con --workers N el lease
+garantiza una única ingesta aunque todos los workers tengan el rol ingest.
+
+Procesos sin HTTP:
+    PROCESS_ROLES=ingest python roles.py
+"""
+import logging
+import os
+import signal
+import sys
+import time
+
+from config import CONFIG
+from leader import LeaderElection
+
+logger = logging.getLogger(__name__)
+
+ROLES = ("api", "ingest", "predictor-worker")
+
+_cfg = CONFIG.get("process", {}) or {}
+
+
+def configured_roles() -> tuple:
+    raw = os.getenv("PROCESS_ROLES")
+    roles = raw.split(",") if raw else _cfg.get("roles", ROLES)
+    roles = tuple(dict.fromkeys(r.strip().lower() for r in roles if r and r.strip()))
+    unknown = [r for r in roles if r not in ROLES]
+    if unknown:
+        raise ValueError(f"unknown process roles {unknown}; valid: {', '.join(ROLES)}")
+    return roles
+
+
+ACTIVE = configured_roles()
+elections = {}
+
+
+def _start_ingest():
+    from telnet_rbn import run_telnet_sessions
+    if not _cfg.get("leader_ingest", True):
+        # Despliegue con un único proceso ingest garantizado por fuera: sin lease
+        from telnet_rbn import start_telnet_sessions
+        start_telnet_sessions()
+        return
+    elections["rbn-ingest"] = election = LeaderElection("rbn-ingest", run=run_telnet_sessions)
+    election.start()
+
+
+def start_roles(roles=None):
+    """Arranca los hilos de fondo de los roles (cada arrancador una sola vez)."""
+    roles = ACTIVE if roles is None else roles
+    # Importes diferidos: un proceso solo ingest no carga motor, caches ni tablas
+    starters = []
+    if "api" in roles or "predictor-worker" in roles:
+        from hf_utils import start_prefix_reloader
+        from spacewx import start_spacewx
+        from observed import start_observed_sync
+        from prediction import start_revalidator
+        from prop_tables import builder, start_table_builder, tables
+        from spot_store import start_spot_trimmer, trimmer
+        from warmer import start_cache_warmer
+        starters += [start_spacewx, start_prefix_reloader, start_observed_sync, start_table_builder, start_cache_warmer,
+                     start_revalidator, start_spot_trimmer]
+        if tables.enabled:
+            elections["prop-tables"] = builder
+        elections["spot-trim"] = trimmer
+    if "predictor-worker" in roles:
+        from predict_from_spots import start_spot_predictor
+        starters.append(start_spot_predictor)
+    if "ingest" in roles:
+        starters.append(_start_ingest)
+    for start in starters:
+        start()
+    logger.info("Roles de este proceso: %s", ", ".join(roles))
+
+
+def stop_roles():
+    """Parada ordenada: cede los leases para que otro proceso los tome sin esperar al TTL."""
+    for election in elections.values():
+        election.release()
+
+
+def stats() -> dict:
+    return {
+        "roles": list(ACTIVE),
+        "leaders": {name: e.stats() for name, e in elections.items()},
+    }
+
+
+if __name__ == "__main__":
+    from log_pipeline import setup_logging
+    setup_logging()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    start_roles()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_roles()
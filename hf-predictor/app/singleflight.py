@@ -0,0 +1,134 @@
+# app/singleflight.py
+"""
+Singleflight en dos niveles para el cálculo de predicciones.
+
+- En proceso: la primera llamada por clave es la líder; las concurrentes
+  (hilos o corrutinas) esperan su Future sin tocar Redis.
+- Entre procesos: la líder compite por el lock de Redis. Quien calcula
+  publica la clave y el resultado en el canal pred:done; un único hilo
+  suscriptor por proceso resuelve el Future pendiente de esa clave. Ninguna
+  espera hace polling.
+
+  PUBLISH pred:done "<clave>\\n<json>"
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+
+import redis
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+REDIS_HOST = CONFIG["redis"]["host"]
+REDIS_PORT = CONFIG["redis"]["port"]
+r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+CHANNEL = "pred:done"
+
+
+def _resolve(fut: Future, result=None, exc: BaseException = None):
+    if fut.done():
+        return
+    try:
+        if exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(result)
+    except InvalidStateError:
+        pass   # carrera con el suscriptor: ya resuelto
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}               # clave → Future de la líder
+        self._subscribed = threading.Event()
+        self._listener = None
+        self.leaders = 0
+        self.followers = 0
+        self.notifications = 0
+        self.notified = 0
+        self.listener_errors = 0
+
+    def join(self, key: str):
+        """(Future, es_líder). La líder debe llamar siempre a finish()."""
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.followers += 1
+                return fut, False
+            fut = self._inflight[key] = Future()
+            self.leaders += 1
+            return fut, True
+
+    def finish(self, key: str, fut: Future, result=None, exc: BaseException = None):
+        with self._lock:
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+        _resolve(fut, result, exc)
+
+    @staticmethod
+    def publish(pipe, key: str, raw: str):
+        """Añade la notificación de fin a un pipeline (el mismo que escribe la cache)."""
+        pipe.publish(CHANNEL, f"{key}\n{raw}")
+
+    # ------------- suscriptor -------------
+
+    @property
+    def listening(self) -> bool:
+        return self._subscribed.is_set()
+
+    def ensure_listener(self, timeout: float = 1.0) -> bool:
+        """Arranca el hilo suscriptor (una vez) y espera a que esté suscrito."""
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, name="singleflight", daemon=True)
+                    self._listener.start()
+        return self._subscribed.wait(timeout)
+
+    def _on_message(self, data: str):
+        self.notifications += 1
+        key, _, raw = data.partition("\n")
+        fut = self._inflight.get(key)
+        if fut is None or fut.done():
+            return
+        try:
+            _resolve(fut, json.loads(raw))
+            self.notified += 1
+        except ValueError:
+            logger.warning("singleflight: notificación ilegible para %s", key)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = r.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                self._subscribed.set()
+                for msg in pubsub.listen():
+                    if msg and msg.get("type") == "message":
+                        self._on_message(msg["data"])
+            except Exception:
+                # Sin suscripción las esperas acaban por deadline y revisan la cache
+                self._subscribed.clear()
+                self.listener_errors += 1
+                logger.exception("singleflight: suscriptor caído, reconectando")
+                time.sleep(1)
+
+    def stats(self) -> dict:
+        return {
+            "inflight": len(self._inflight),
+            "subscribed": self.listening,
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "notifications": self.notifications,
+            "notified": self.notified,
+            "listener_errors": self.listener_errors,
+        }
+
+
+flights = SingleFlight()
@@ -0,0 +1,343 @@
+# app/spacewx.py
+"""
+Meteorología espacial en segundo plano.
+
+Cada ejecución de ITURHFProp necesita el SSN efectivo y, con el ajuste por
+Kp, el Kp vigente. Antes se leía y parseaba spacewx:latest de Redis en cada
+camino y, si faltaba F10.7, se consultaba NOAA por HTTP (timeout 5 s) dentro
+de la petición. Ahora un hilo refresca cada refresh_s una instantánea en
+memoria y el camino caliente solo lee una referencia: sin locks, sin Redis y
+sin HTTP.
+
+Fuentes (spacewx.sources, en orden; la primera que aporta un campo gana y
+las que ya no aportan nada no se consultan):
+
+  redis   clave spacewx:latest que publica descarga_spacewx.pl
+  file    el JSON de caché de descarga_spacewx.pl (despliegue sin red/Redis)
+  noaa    SSN diario de SWPC: el de ayer (si no hay F10.7) y los de los últimos 30
+          días para predicciones de fechas pasadas (una vez al día, en Redis ssn:<fecha>)
+  paquete.modulo:fabrica   fuente propia: fabrica(cfg) → objeto con name, provides y fetch()
+
+fetch() devuelve un dict con algunos de f107, kp, ap, ssn, daily ({fecha: ssn}),
+fetched_utc/kp_time (o None).
+"""
+import importlib
+import json
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+
+import redis
+import requests
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+REDIS_HOST = CONFIG["redis"]["host"]
+REDIS_PORT = CONFIG["redis"]["port"]
+r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+DEFAULT_SSN = 100
+DAILY_DAYS = 30      # días de SSN observado que publica SWPC (y se guardan en ssn:<fecha>)
+NOAA_URL = "https://services.swpc.noaa.gov/text/daily-solar-indices.txt"
+
+
+def f107_to_ssn(f107: float, conv: dict = None) -> int:
+    """
+    Conversión configurable F10.7 -> SSN (proxy para ITURHFProp).
+    SSN ≈ a * (F10.7 - b)
+    """
+    if conv is None:
+        conv = CONFIG.get("spacewx", {}).get("f107_to_ssn", {})
+    a = float(conv.get("a", 1.61))
+    b = float(conv.get("b", 67.0))
+    ssn = a * (float(f107) - b)
+    return max(1, min(311, int(round(ssn))))  # rango típico
+
+
+def _flt(x):
+    try:
+        return float(x)
+    except Exception:
+        return None
+
+
+def _parse_ts(ts_str):
+    if not ts_str:
+        return None
+    try:
+        ts_norm = str(ts_str).replace("Z", "+00:00").replace(" ", "T")
+        return datetime.fromisoformat(ts_norm.split("+")[0])
+    except Exception:
+        logger.warning("spacewx: bad timestamp: %s", ts_str)
+        return None
+
+
+# ------------------ Fuentes ------------------
+
+class RedisSource:
+    """spacewx:latest (JSON {fetched_utc, f107, ap, kp, kp_time})."""
+    name = "redis"
+    provides = ("f107", "kp", "ap")
+
+    def __init__(self, cfg: dict):
+        self.key = cfg.get("redis_key", "spacewx:latest")
+
+    def fetch(self):
+        raw = r.get(self.key)
+        if not raw:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            logger.warning("spacewx: invalid JSON in Redis key=%s", self.key)
+            return None
+
+
+class FileSource:
+    """El mismo JSON desde fichero (--cache de descarga_spacewx.pl): sin Redis ni red."""
+    name = "file"
+    provides = ("f107", "kp", "ap")
+
+    def __init__(self, cfg: dict):
+        self.path = cfg.get("file", "/data/spacewx_cache.json")
+
+    def fetch(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+
+class NoaaSsnSource:
+    """
+    SSN diario observado (SWPC): el de ayer y los de los últimos DAILY_DAYS.
+    Una descarga al día, compartida entre procesos vía Redis (ssn:<fecha>).
+    """
+    name = "noaa"
+    provides = ("ssn", "daily")
+
+    def __init__(self, cfg: dict):
+        self.timeout_s = float(cfg.get("noaa_timeout_s", 5))
+        self.retry_s = float(cfg.get("noaa_retry_s", 600))
+        self._day = None           # fecha de "ayer" ya resuelta
+        self._daily = {}
+        self._next_try = 0.0
+
+    def _cached(self, today: date) -> dict:
+        days = [today - timedelta(days=i) for i in range(1, DAILY_DAYS + 1)]
+        values = r.mget([f"ssn:{d.isoformat()}" for d in days])
+        return {d: int(v) for d, v in zip(days, values) if v}
+
+    def _download(self) -> dict:
+        resp = requests.get(NOAA_URL, timeout=self.timeout_s)
+        resp.raise_for_status()
+        daily = {}
+        for line in resp.text.splitlines():
+            parts = line.split()
+            if len(parts) > 3 and parts[0].isdigit() and len(parts[0]) == 4:
+                try:
+                    daily[date(int(parts[0]), int(parts[1]), int(parts[2]))] = int(parts[3])
+                except ValueError:
+                    continue
+        if daily:
+            pipe = r.pipeline(transaction=False)
+            for d, ssn in daily.items():
+                pipe.set(f"ssn:{d.isoformat()}", ssn, ex=86400 * (DAILY_DAYS + 7))
+            pipe.execute()
+        return daily
+
+    def fetch(self):
+        today = datetime.utcnow().date()
+        yest = today - timedelta(days=1)
+        if self._day != yest:
+            daily = self._cached(today)
+            if yest not in daily and time.monotonic() >= self._next_try:
+                self._next_try = time.monotonic() + self.retry_s
+                daily.update(self._download())
+            if daily:
+                self._daily = daily
+            if yest in daily:
+                self._day = yest
+        if not self._daily:
+            return None
+        return {"ssn": self._daily.get(yest), "daily": self._daily}
+
+
+SOURCES = {"redis": RedisSource, "file": FileSource, "noaa": NoaaSsnSource}
+
+
+def make_source(spec: str, cfg: dict):
+    if spec in SOURCES:
+        return SOURCES[spec](cfg)
+    module, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(f"unknown spacewx source {spec!r}")
+    return getattr(importlib.import_module(module), attr)(cfg)
+
+
+# ------------------ Instantánea ------------------
+
+class Snapshot(NamedTuple):
+    f107: Optional[float]
+    kp: Optional[float]
+    ap: Optional[float]
+    ts: Optional[datetime]        # hora de los datos (fetched_utc / kp_time)
+    ssn: int                      # SSN efectivo para ITURHFProp
+    ssn_source: str               # f107 | noaa | last | default
+    source: str                   # fuentes que aportaron datos
+    refreshed_utc: Optional[datetime]
+    daily: dict                   # fecha → SSN observado (no se modifica: se sustituye entero)
+
+
+class SpaceWeather:
+    """
+    Instantánea inmutable reemplazada de golpe por el hilo de refresco: los
+    lectores toman self._snap (una referencia) y nunca ven un estado a medias.
+    """
+
+    def __init__(self, cfg: dict):
+        self.cfg = cfg
+        self.refresh_s = float(cfg.get("refresh_s", 60))
+        self.max_age = timedelta(hours=float(cfg.get("max_age_hours", 6)))
+        self.sources = [make_source(s, cfg) for s in cfg.get("sources", ["redis", "noaa"])]
+        self._snap = Snapshot(None, None, None, None, int(cfg.get("default_ssn", DEFAULT_SSN)), "default", "",
+                              None, {})
+        self._started = False
+        self.refreshes = 0
+        self.errors = 0
+        self.source_errors = {s.name: 0 for s in self.sources}
+
+    # ------------- lectura (camino caliente) -------------
+
+    @property
+    def snapshot(self) -> Snapshot:
+        return self._snap
+
+    def _fresh_ts(self, ts, now_utc: datetime = None) -> bool:
+        return ts is not None and (now_utc or datetime.utcnow()) - ts <= self.max_age
+
+    def fresh(self, snap: Snapshot, now_utc: datetime = None) -> bool:
+        return self._fresh_ts(snap.ts, now_utc)
+
+    def indices(self, now_utc: datetime = None):
+        """f107/kp/ap vigentes (dict con ts) o None si no hay datos frescos."""
+        snap = self._snap
+        if not self.fresh(snap, now_utc):
+            return None
+        return {"f107": snap.f107, "kp": snap.kp, "ap": snap.ap, "ts": snap.ts}
+
+    @property
+    def ssn(self) -> int:
+        return self._snap.ssn
+
+    def ssn_for(self, dt: datetime) -> int:
+        """
+        SSN para la fecha de la predicción. Hoy o futura (no hay previsión):
+        el vigente. Pasada: el observado el día anterior a dt, como el antiguo
+        fallback NOAA; si no está entre los DAILY_DAYS conocidos, el vigente.
+        """
+        snap = self._snap
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+        day = dt.date()
+        if day >= datetime.utcnow().date():
+            return snap.ssn
+        return snap.daily.get(day - timedelta(days=1), snap.ssn)
+
+    def publish(self, data: dict, source: str = "manual"):
+        """Sustituye la instantánea a partir de datos ya reunidos (refresco, o fijos en bench/pruebas)."""
+        prev = self._snap
+        ts = _parse_ts(data.get("fetched_utc") or data.get("kp_time"))
+        f107, kp, ap = _flt(data.get("f107")), _flt(data.get("kp")), _flt(data.get("ap"))
+        daily = data.get("daily") or prev.daily
+        snap = Snapshot(f107, kp, ap, ts, prev.ssn, prev.ssn_source, source, datetime.utcnow(), daily)
+        if f107 is not None and self.fresh(snap):
+            ssn, ssn_source = f107_to_ssn(f107, self.cfg.get("f107_to_ssn", {})), "f107"
+        elif data.get("ssn") is not None:
+            ssn, ssn_source = int(data["ssn"]), "noaa"
+        elif prev.ssn_source != "default":
+            ssn, ssn_source = prev.ssn, "last"
+        else:
+            ssn, ssn_source = prev.ssn, "default"
+        self._snap = snap._replace(ssn=ssn, ssn_source=ssn_source)
+        if (ssn, f107, kp) != (prev.ssn, prev.f107, prev.kp):
+            logger.info("spacewx: F10.7=%s Kp=%s → SSN=%d (%s, %s)", f107, kp, ssn, ssn_source, source or "-")
+        return self._snap
+
+    # ------------- refresco (hilo de fondo) -------------
+
+    def _collect(self):
+        data, used = {}, []
+        for src in self.sources:
+            if all(data.get(f) is not None for f in src.provides):
+                continue
+            try:
+                got = src.fetch()
+            except Exception as e:
+                self.source_errors[src.name] = self.source_errors.get(src.name, 0) + 1
+                logger.warning(f"⚠️ spacewx: fuente {src.name} falló: {e}")
+                continue
+            if not got:
+                continue
+            used.append(src.name)
+            for k, v in got.items():
+                if data.get(k) is None and v is not None:
+                    data[k] = v
+        return data, "+".join(used)
+
+    def refresh(self) -> Snapshot:
+        data, used = self._collect()
+        self.refreshes += 1
+        return self.publish(data, used)
+
+    def run_forever(self):
+        while True:
+            time.sleep(self.refresh_s)
+            try:
+                self.refresh()
+            except Exception:
+                self.errors += 1
+                logger.exception("spacewx: refresh failed")
+
+    def start(self):
+        """Primer refresco aquí (arranque, no en una petición) y después el hilo periódico."""
+        if self._started:
+            return
+        self._started = True
+        try:
+            self.refresh()
+        except Exception:
+            self.errors += 1
+            logger.exception("spacewx: initial refresh failed")
+        threading.Thread(target=self.run_forever, name="spacewx", daemon=True).start()
+        logger.info("🧵 Hilo de meteorología espacial arrancado.")
+
+    def stats(self) -> dict:
+        snap = self._snap
+        now = datetime.utcnow()
+        return {
+            "source": snap.source,
+            "f107": snap.f107,
+            "kp": snap.kp,
+            "ap": snap.ap,
+            "ssn": snap.ssn,
+            "ssn_source": snap.ssn_source,
+            "daily_days": len(snap.daily),
+            "fresh": self.fresh(snap, now),
+            "data_age_s": round((now - snap.ts).total_seconds()) if snap.ts else None,
+            "refresh_age_s": round((now - snap.refreshed_utc).total_seconds()) if snap.refreshed_utc else None,
+            "refreshes": self.refreshes,
+            "errors": self.errors + sum(self.source_errors.values()),
+        }
+
+
+service = SpaceWeather(CONFIG.get("spacewx", {}) or {})
+
+
+def start_spacewx():
+    service.start()
@@ -0,0 +1,260 @@
+# app/spot_store.py
+"""
+Almacén compacto de spots (RBN y humanos) indexado por DX y por spotter.
+
+  spots:rec             HASH  id → registro empaquetado (una línea, sin JSON)
+  spots:exp             ZSET  id → epoch de caducidad (recorte por TTL)
+  spots:dx:<DX>         ZSET  id → epoch del spot
+  spots:by:<SPOTTER>    ZSET  id → epoch del spot
+
+id = "<source>:<spotter>:<dx>:<freq>": un spot repetido sobrescribe al
+anterior (misma semántica que las antiguas claves spot:<source>:...).
+"¿Quién ha oído a X en 20 m en los últimos 10 min?" es un ZRANGEBYSCORE más
+un HMGET, sin SCAN del keyspace.
+
+spots:rec y spots:exp no caducan solos: el recorte de registros caducados lo
+hace un hilo (un único proceso, líder "spot-trim") que vacía todo lo vencido
+en cada pasada, por lotes atómicos (script Lua) de trim_batch, en vez de los
+escritores.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+import redis
+import redis.asyncio as aioredis
+
+from config import CONFIG
+from hf_utils import HF_BANDS
+from leader import LeaderElection
+
+logger = logging.getLogger(__name__)
+
+REDIS_HOST = CONFIG["redis"]["host"]
+REDIS_PORT = CONFIG["redis"]["port"]
+r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+ar = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+REC_KEY = "spots:rec"
+EXP_KEY = "spots:exp"
+DX_PREFIX = "spots:dx:"
+SPOTTER_PREFIX = "spots:by:"
+
+_cfg = CONFIG.get("spot_store", {}) or {}
+TRIM_INTERVAL_S = float(_cfg.get("trim_interval_s", 5))
+TRIM_BATCH = int(_cfg.get("trim_batch", 1000))
+TRIM_BUDGET_S = float(_cfg.get("trim_budget_s", 1.0))
+MAX_RESULTS = int(_cfg.get("max_results", 500))
+QUERY_PAGE = int(_cfg.get("query_page", 1000))
+
+# Orden de campos del registro empaquetado (list_spots.pl lo lee igual)
+FIELDS = ("timestamp", "source", "spotter", "dx", "frequency", "mode",
+          "sp_rel", "sp_snr", "lp_rel", "lp_snr")
+
+_trim_stats = {"runs": 0, "trimmed": 0, "backlog_runs": 0, "errors": 0}
+
+
+def max_ttl() -> int:
+    """TTL más largo configurado: los índices por DX/spotter caducan tras él."""
+    rbn = CONFIG.get("rbn", {}) or {}
+    minutes = [rbn.get("cw", {}).get("ttl_minutes", 10), rbn.get("digi", {}).get("ttl_minutes", 10),
+               CONFIG.get("human_spot", {}).get("ttl_minutes", 10)]
+    return int(max(minutes)) * 60
+
+
+def _epoch(dt: datetime) -> float:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _num(v) -> str:
+    return "" if v is None else str(v)
+
+
+def make_record(source: str, spotter: str, dx: str, freq_mhz: float, mode: str, dt: datetime,
+                prediction: dict = None, ttl: int = 600) -> dict:
+    sp = (prediction or {}).get("short_path") or {}
+    lp = (prediction or {}).get("long_path") or {}
+    return {
+        "id": f"{source}:{spotter}:{dx}:{freq_mhz:.1f}",
+        "ts": _epoch(dt),
+        "ttl": int(ttl),
+        "timestamp": dt.isoformat(),
+        "source": source,
+        "spotter": spotter,
+        "dx": dx,
+        "frequency": f"{freq_mhz:.1f}",
+        "mode": mode or "",
+        "sp_rel": _num(sp.get("reliability")), "sp_snr": _num(sp.get("snr")),
+        "lp_rel": _num(lp.get("reliability")), "lp_snr": _num(lp.get("snr")),
+    }
+
+
+def _pack(rec: dict) -> str:
+    return "|".join(rec[f] for f in FIELDS)
+
+
+def _unpack(raw: str) -> dict:
+    out = dict(zip(FIELDS, raw.split("|")))
+    out["frequency"] = float(out["frequency"])
+    for f in ("sp_rel", "sp_snr", "lp_rel", "lp_snr"):
+        out[f] = int(out[f]) if out[f] else None
+    return out
+
+
+def queue_writes(pipe, records: list, now: float = None):
+    """Encola en pipe (síncrono o asíncrono) la escritura de los registros."""
+    now = time.time() if now is None else now
+    idx_ttl = max_ttl()
+    cutoff = now - idx_ttl
+    touched = set()
+    for rec in records:
+        pipe.hset(REC_KEY, rec["id"], _pack(rec))
+        pipe.zadd(EXP_KEY, {rec["id"]: now + rec["ttl"]})
+        for key in (DX_PREFIX + rec["dx"].upper(), SPOTTER_PREFIX + rec["spotter"].upper()):
+            pipe.zadd(key, {rec["id"]: rec["ts"]})
+            touched.add(key)
+    for key in touched:
+        pipe.zremrangebyscore(key, "-inf", cutoff)
+        pipe.expire(key, idx_ttl)
+
+
+# Un lote de recorte (lectura de lo caducado + borrado) en una sola operación atómica: un spot
+# re-publicado entre ambas no pierde su registro nuevo. WATCH sobre spots:exp no sirve aquí:
+# cada escritura de spot lo toca y la transacción fallaría casi siempre en pleno concurso.
+# KEYS: spots:rec, spots:exp · ARGV: now, lote, prefijo DX, prefijo spotter (id = source:spotter:dx:freq)
+_TRIM_LUA = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, sid in ipairs(ids) do
+  redis.call('HDEL', KEYS[1], sid)
+  redis.call('ZREM', KEYS[2], sid)
+  local spotter, dx = string.match(sid, '^[^:]*:([^:]*):([^:]*):')
+  if dx then
+    redis.call('ZREM', ARGV[3] .. string.upper(dx), sid)
+    redis.call('ZREM', ARGV[4] .. string.upper(spotter), sid)
+  end
+end
+return #ids
+"""
+_trim_batch = r.register_script(_TRIM_LUA)
+
+
+def _drain(now: float, budget_s: float):
+    """(borrados, vaciado): lotes de TRIM_BATCH hasta uno corto o hasta agotar budget_s."""
+    t_end = time.monotonic() + budget_s
+    total = 0
+    while True:
+        n = int(_trim_batch(keys=[REC_KEY, EXP_KEY], args=[now, TRIM_BATCH, DX_PREFIX, SPOTTER_PREFIX]))
+        total += n
+        if n < TRIM_BATCH:
+            return total, True
+        if time.monotonic() >= t_end:
+            return total, False
+
+
+def trim(now: float = None, budget_s: float = None) -> int:
+    """Borra los registros caducados (todos, salvo que se agote budget_s). Devuelve cuántos."""
+    now = time.time() if now is None else now
+    return _drain(now, TRIM_BUDGET_S if budget_s is None else budget_s)[0]
+
+
+def run_trimmer(stop: threading.Event):
+    """Tarea del líder "spot-trim": vacía lo caducado; si el presupuesto no alcanza, repite sin esperar."""
+    while not stop.is_set():
+        try:
+            n, drained = _drain(time.time(), TRIM_BUDGET_S)
+            _trim_stats["runs"] += 1
+            _trim_stats["trimmed"] += n
+            if not drained:
+                # Atraso (pico de concurso): siguiente pasada ya
+                _trim_stats["backlog_runs"] += 1
+                continue
+        except Exception:
+            _trim_stats["errors"] += 1
+            logger.exception("spot_store: trim failed")
+        stop.wait(TRIM_INTERVAL_S)
+
+
+trimmer = LeaderElection("spot-trim", run=run_trimmer)
+
+
+def start_spot_trimmer():
+    """Candidatura a recortar spots:rec/spots:exp (solo lo hace un proceso a la vez)."""
+    trimmer.start()
+
+
+def trim_stats() -> dict:
+    return dict(_trim_stats)
+
+
+def store(records: list):
+    if not records:
+        return
+    pipe = r.pipeline(transaction=False)
+    queue_writes(pipe, records)
+    pipe.execute()
+
+
+async def store_async(records: list):
+    if not records:
+        return
+    pipe = ar.pipeline(transaction=False)
+    queue_writes(pipe, records)
+    await pipe.execute()
+
+# ------------------ Consultas ------------------
+
+def _band_range(band: str):
+    for name, lo, hi, _ in HF_BANDS:
+        if name.lower() == band.lower():
+            return lo - 0.05, hi + 0.05
+    return None
+
+
+def _filter(ids: list, raws: list, band: str = None, source: str = None) -> list:
+    rng = _band_range(band) if band else None
+    out = []
+    for sid, raw in zip(ids, raws):
+        if not raw:
+            continue
+        rec = _unpack(raw)
+        if rng and not (rng[0] <= rec["frequency"] <= rng[1]):
+            continue
+        if source and rec["source"] != source:
+            continue
+        out.append(rec)
+    return out
+
+
+async def _query(index_key: str, minutes: float, band: str = None, source: str = None,
+                 limit: int = None) -> list:
+    now = time.time()
+    limit = min(int(limit or MAX_RESULTS), MAX_RESULTS)
+    # Con filtro, el límite cuenta tras filtrar: se pagina el índice hasta llenarlo o agotarlo
+    page = max(limit, QUERY_PAGE) if (band or source) else limit
+    out, seen, start = [], set(), 0
+    while len(out) < limit:
+        # Más recientes primero
+        batch = await ar.zrevrangebyscore(index_key, "+inf", now - minutes * 60, start=start, num=page)
+        # Un spot nuevo desplaza el índice entre páginas: no repetir los ya vistos
+        ids = [sid for sid in batch if sid not in seen]
+        seen.update(ids)
+        if ids:
+            out += _filter(ids, await ar.hmget(REC_KEY, ids), band, source)
+        if len(batch) < page:
+            break
+        start += page
+    return out[:limit]
+
+
+async def heard(dx: str, minutes: float = 15, band: str = None, source: str = None, limit: int = None) -> list:
+    """Spots de un DX (quién lo ha oído) en los últimos `minutes`."""
+    return await _query(DX_PREFIX + dx.upper(), minutes, band, source, limit)
+
+
+async def by_spotter(spotter: str, minutes: float = 15, band: str = None, source: str = None,
+                     limit: int = None) -> list:
+    """Spots de un spotter/skimmer (a quién ha oído) en los últimos `minutes`."""
+    return await _query(SPOTTER_PREFIX + spotter.upper(), minutes, band, source, limit)
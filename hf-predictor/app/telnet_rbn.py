@@ -1,22 +1,35 @@
-import telnetlib
+import asyncio
 import threading
 import time
 import logging
 import re
-import redis
-import json
+import redis.asyncio as aioredis
 from config import CONFIG
+from metrics import REDIS_RTT, timed
 
 logger = logging.getLogger(__name__)
 
-# Inicializa Redis
-redis_client = redis.Redis(host="redis", port=6379, decode_responses=True)
+REDIS_HOST = CONFIG["redis"]["host"]
+REDIS_PORT = CONFIG["redis"]["port"]
+_rbn_conf = CONFIG.get("rbn", {}) or {}
+_stream_conf = _rbn_conf.get("stream", {}) or {}
+STREAM_KEY = _stream_conf.get("key", "rbn:spots")
+STREAM_MAXLEN = int(_stream_conf.get("maxlen", 100000))
+BATCH_MAX = int(_rbn_conf.get("batch_max", 200))             # spots por pipeline
+FLUSH_INTERVAL_S = float(_rbn_conf.get("flush_interval_s", 0.2))
+STATS_INTERVAL_S = float(_rbn_conf.get("stats_interval_s", 60))
+
+# Modos que publica RBN (CW, RTTY, PSK31/63/125, FT8/FT4, JT65/JT9, MSK144…)
+_SPOT_RE = re.compile(
+    r"DX de ([\w\-/]+?)-?#:\s+(\d+\.\d+)\s+([\w/]+)\s+"
+    r"(CW|RTTY|FT8|FT4|PSK\d*|BPSK\d*|QPSK\d*|JT\d+\w?|MSK\d+|FSK\d*|SSTV|SYN)\s+(-?\d+)\s+dB"
+)
+# Negociación telnet (IAC …): se descarta, RBN funciona sin responderla
+_IAC_RE = re.compile(rb"\xff[\xfb-\xfe].|\xff[\xf0-\xfa]", re.S)
+
 
 def parse_rbn_line(line: str):
-    match = re.search(
-        r"DX de ([\w\-]+)-?#:\s+(\d+\.\d+)\s+(\w+)\s+(CW|FT8|FT4|RTT|PSK)\s+(-?\d+)\s+dB",
-        line
-    )
+    match = _SPOT_RE.search(line)
     if match:
         spotter = match.group(1).replace("-", "")  # Eliminar también guión
         frequency = float(match.group(2))
@@ -32,65 +45,191 @@ def parse_rbn_line(line: str):
         }
     return None
 
-def listen_to_rbn(label, host, port, username, ttl):
+
+class IngestStats:
+    """Contadores por sesión (se leen desde la API, se escriben en el hilo de ingesta)."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.lines = 0
+        self.spots = 0
+        self.parse_failures = 0     # líneas "DX de" que no encajan con el patrón
+        self.ignored = 0            # > 30 MHz
+        self.published = 0
+        self.publish_errors = 0
+        self.reconnects = 0
+        self.connected = False
+        self.lines_per_s = 0.0
+        self._mark_t = time.monotonic()
+        self._mark_lines = 0
+
+    def tick(self) -> float:
+        now = time.monotonic()
+        dt = now - self._mark_t
+        if dt > 0:
+            self.lines_per_s = (self.lines - self._mark_lines) / dt
+        self._mark_t, self._mark_lines = now, self.lines
+        return self.lines_per_s
+
+    def as_dict(self) -> dict:
+        return {
+            "connected": self.connected,
+            "lines": self.lines,
+            "lines_per_s": round(self.lines_per_s, 1),
+            "spots": self.spots,
+            "parse_failures": self.parse_failures,
+            "ignored": self.ignored,
+            "published": self.published,
+            "publish_errors": self.publish_errors,
+            "reconnects": self.reconnects,
+        }
+
+
+_stats = {}
+
+
+def ingest_stats() -> dict:
+    return {label: s.as_dict() for label, s in _stats.items()}
+
+
+def _stream_entry(spot: dict) -> dict:
+    now_utc = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    message = "|".join(("rbn", spot["spotter"], spot["dx"], str(spot["frequency"]), spot["mode"], now_utc))
+    # SNR medido por el skimmer (dB): alimenta la rejilla observada
+    return {"msg": message, "level": spot["level"]}
+
+
+async def _flush(client, pending: list, st: IngestStats):
+    if not pending:
+        return
+    batch = pending[:]
+    pending.clear()
+    try:
+        pipe = client.pipeline(transaction=False)
+        for entry in batch:
+            pipe.xadd(STREAM_KEY, entry, maxlen=STREAM_MAXLEN, approximate=True)
+        with timed(REDIS_RTT, "xadd"):
+            await pipe.execute()
+        st.published += len(batch)
+    except Exception as e:
+        st.publish_errors += len(batch)
+        logger.warning(f"⚠️ [{st.label}] Publicación RBN fallida ({len(batch)} spots): {e}")
+
+
+async def _session(label, host, port, username, ttl, client, st: IngestStats):
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=10)
+    st.connected = True
+    pending = []
+    try:
+        logger.info(f"🔌 [{label}] Conectado a {host}:{port} como {username}")
+        try:
+            await asyncio.wait_for(reader.readuntil(b"call:"), timeout=10)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        writer.write(username.encode("ascii") + b"\r\n")
+        await writer.drain()
+
+        last_activity = last_flush = last_stats = time.monotonic()
+        while True:
+            try:
+                raw = await asyncio.wait_for(reader.readline(), timeout=FLUSH_INTERVAL_S)
+            except asyncio.TimeoutError:
+                raw = None
+            else:
+                if not raw:
+                    raise ConnectionError("connection closed by server")
+
+            now = time.monotonic()
+            if raw:
+                last_activity = now
+                line = _IAC_RE.sub(b"", raw).decode("utf-8", errors="ignore").strip()
+                if line:
+                    st.lines += 1
+                    spot = parse_rbn_line(line)
+                    if spot is None:
+                        if line.startswith("DX de"):
+                            st.parse_failures += 1
+                            logger.debug("[%s] Línea no reconocida: %s", label, line)
+                    elif spot["frequency"] > 30.0:
+                        st.ignored += 1
+                    else:
+                        st.spots += 1
+                        pending.append(_stream_entry(spot))
+
+            if len(pending) >= BATCH_MAX or (pending and now - last_flush >= FLUSH_INTERVAL_S):
+                await _flush(client, pending, st)
+                last_flush = now
+
+            if now - last_stats >= STATS_INTERVAL_S:
+                st.tick()
+                last_stats = now
+                logger.info(f"📊 [{label}] {st.lines_per_s:.1f} líneas/s, spots={st.spots} "
+                            f"fallos={st.parse_failures} publicados={st.published}")
+
+            if now - last_activity > ttl:
+                logger.warning(f"⚠️ [{label}] TTL superado, reconectando...")
+                return
+    finally:
+        st.connected = False
+        await _flush(client, pending, st)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+
+async def listen_to_rbn(label, host, port, username, ttl):
+    st = _stats.setdefault(label, IngestStats(label))
+    client = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
     while True:
         try:
-            with telnetlib.Telnet(host, port, timeout=10) as tn:
-                logger.info(f"🔌 [{label}] Conectado a {host}:{port} como {username}")
-                time.sleep(2)
-                tn.write(username.encode("ascii") + b"\n")
-                last_activity = time.time()
-
-                while True:
-                    line = tn.read_until(b"\n").decode("utf-8", errors="ignore").strip()
-                    if line:
-                        logger.info(f"📡 [{label}] {line}")
-                        last_activity = time.time()
-
-                        spot = parse_rbn_line(line)
-                        if spot:
-                            freq = spot["frequency"]
-                            if freq > 30.0:
-                                logger.debug(f"⏭️ Frecuencia ignorada: {freq} MHz")
-                                continue
-
-                            now_utc = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-                            payload = {
-                                "user": "rbn",
-                                "spotter": spot["spotter"],
-                                "dx": spot["dx"],
-                                "freq": freq,
-                                "mode": spot["mode"],
-                                "ts": now_utc,
-                                "source": "rbn",
-                                "modulation": "DIGITAL"
-                            }
-                            message = "|".join(str(payload[k]) for k in ["user", "spotter", "dx", "freq", "mode", "ts"])
-                            redis_client.publish("predict-hf", message)
-                            logger.info(f"📤 Spot RBN publicado: {message}")
-
-                    if time.time() - last_activity > ttl:
-                        logger.warning(f"⚠️ [{label}] TTL superado, reconectando...")
-                        break
+            await _session(label, host, port, username, ttl, client, st)
         except Exception as e:
             logger.error(f"❌ [{label}] Error Telnet: {e}")
-        time.sleep(5)
+        st.reconnects += 1
+        await asyncio.sleep(5)
 
-def start_telnet_sessions():
+
+async def _run_sessions(sessions, stop=None):
+    tasks = [asyncio.ensure_future(listen_to_rbn(*s)) for s in sessions]
+    if stop is None:
+        await asyncio.gather(*tasks)
+        return
+    # Lease perdido: se cierran las sesiones (volcando lo pendiente) para no duplicar spots
+    while not stop.is_set():
+        await asyncio.sleep(1)
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    logger.info("RBN: sesiones telnet cerradas (ya no es el líder de ingesta)")
+
+
+def _sessions():
     rbn_conf = CONFIG.get("rbn", {})
 
+    sessions = []
     if rbn_conf.get("cw", {}).get("enabled", False):
         cw = rbn_conf["cw"]
-        threading.Thread(
-            target=listen_to_rbn,
-            args=("CW", cw["host"], cw["port"], cw["username"], cw.get("ttl_minutes", 10) * 60),
-            daemon=True
-        ).start()
+        sessions.append(("CW", cw["host"], cw["port"], cw["username"], cw.get("ttl_minutes", 10) * 60))
 
     if rbn_conf.get("digi", {}).get("enabled", False):
         digi = rbn_conf["digi"]
-        threading.Thread(
-            target=listen_to_rbn,
-            args=("DIGI", digi["host"], digi["port"], digi["username"], digi.get("ttl_minutes", 10) * 60),
-            daemon=True
-        ).start()
+        sessions.append(("DIGI", digi["host"], digi["port"], digi["username"], digi.get("ttl_minutes", 10) * 60))
+    return sessions
+
+
+def run_telnet_sessions(stop):
+    """Sesiones telnet hasta que se active stop (tarea del líder de ingesta)."""
+    sessions = _sessions()
+    if sessions:
+        asyncio.run(_run_sessions(sessions, stop))
+
+
+def start_telnet_sessions():
+    """Sin elección de líder: sesiones en este proceso (un solo proceso con rol ingest)."""
+    sessions = _sessions()
+    if not sessions:
+        return
+    # Bucle propio en un hilo: el parseo de picos de concurso no compite con la API
+    threading.Thread(target=asyncio.run, args=(_run_sessions(sessions),), name="rbn-ingest", daemon=True).start()
@@ -0,0 +1,230 @@
+# app/warmer.py
+"""
+Precalentamiento de cache para los usuarios activos.
+
+Cuando llega un spot (RBN o el /predict del primer usuario), DXSpider aún
+va a pedir /predict para cada usuario conectado. El warmer calcula ya, a
+baja prioridad, la predicción de ese DX en esa banda para la ubicación de
+todos los usuarios activos (una ejecución de área si son bastantes), de modo
+que las peticiones siguientes son aciertos de cache.
+
+  users:active   ZSET  indicativo → epoch de última actividad
+
+Los usuarios se registran desde DXSpider (POST /users/active) o se aprenden
+de /predict. Los toques de /predict se acumulan en memoria y los escribe el
+hilo del warmer: el event loop nunca espera a Redis por esto.
+"""
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+import redis
+from fastapi import HTTPException
+
+from config import CONFIG
+from engine_pool import PRIORITY_LOW, gate as engine_gate, pool as engine_pool
+from hf_utils import lookup_coords
+from local_cache import LocalCache
+from prediction import (
+    COORD_DECIMALS, _area_min_receivers, _freq_bin_mhz, _time_bin, get_prediction_with_cache, missing_paths,
+    prefill_area, request_deadline, to_float_coords,
+)
+
+logger = logging.getLogger(__name__)
+
+REDIS_HOST = CONFIG["redis"]["host"]
+REDIS_PORT = CONFIG["redis"]["port"]
+r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+ACTIVE_KEY = "users:active"
+
+_cfg = CONFIG.get("warmer", {}) or {}
+ENABLED = bool(_cfg.get("enabled", True))
+WARM_RBN = bool(_cfg.get("rbn", True))
+ACTIVE_TTL_S = float(_cfg.get("active_ttl_minutes", 30)) * 60
+MAX_USERS = int(_cfg.get("max_users", 500))
+REFRESH_S = float(_cfg.get("refresh_s", 5))
+TOUCH_INTERVAL_S = float(_cfg.get("touch_interval_s", 60))
+QUEUE_SIZE = int(_cfg.get("queue_size", 200))
+DEADLINE_S = float(_cfg.get("deadline_s", 10))
+
+
+class ActiveUsers:
+    """Usuarios activos (Redis, compartido entre procesos) y sus ubicaciones."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._touched = {}        # indicativo → último toque enviado a Redis (epoch)
+        self._pending = {}        # indicativo → epoch, pendiente de escribir
+        self._locations = []      # [(lat, lon)] únicas a resolución de cache
+        self.users = 0
+
+    def touch(self, callsign: str, now: float = None):
+        """Marca actividad (barato: solo memoria; se escribe en el siguiente refresh)."""
+        now = time.time() if now is None else now
+        call = callsign.upper()
+        with self._lock:
+            if now - self._touched.get(call, 0.0) < TOUCH_INTERVAL_S:
+                return
+            self._touched[call] = now
+            self._pending[call] = now
+
+    def register(self, callsigns, replace: bool = False):
+        """Registro explícito desde DXSpider (lista de conectados)."""
+        now = time.time()
+        calls = {c.upper(): now for c in callsigns if c}
+        pipe = r.pipeline()
+        if replace:
+            pipe.delete(ACTIVE_KEY)
+        if calls:
+            pipe.zadd(ACTIVE_KEY, calls)
+        pipe.execute()
+        with self._lock:
+            self._touched.update(calls)
+        return len(calls)
+
+    def refresh(self):
+        """Escribe toques pendientes, caduca inactivos y recalcula ubicaciones."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        now = time.time()
+        pipe = r.pipeline()
+        if pending:
+            pipe.zadd(ACTIVE_KEY, pending)
+        pipe.zremrangebyscore(ACTIVE_KEY, "-inf", now - ACTIVE_TTL_S)
+        pipe.zrevrange(ACTIVE_KEY, 0, MAX_USERS - 1)
+        calls = pipe.execute()[-1]
+
+        locations = {}
+        for call in calls:
+            coords = lookup_coords(call)
+            if coords:
+                coords = to_float_coords(coords)
+                locations.setdefault((round(coords[0], COORD_DECIMALS), round(coords[1], COORD_DECIMALS)), coords)
+        self._locations = list(locations.values())
+        self.users = len(calls)
+        with self._lock:
+            stale = now - 2 * TOUCH_INTERVAL_S
+            self._touched = {c: t for c, t in self._touched.items() if t >= stale}
+
+    def locations(self) -> list:
+        return self._locations
+
+
+class CacheWarmer:
+    def __init__(self, users: ActiveUsers):
+        self.users = users
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        # Un spot (DX, banda, modo, franja) se precalienta una sola vez por franja
+        self._seen = LocalCache(max_entries=20000, ttl_s=float(_cfg.get("dedupe_s", 900)))
+        self.scheduled = 0
+        self.deduped = 0
+        self.dropped = 0
+        self.skipped_busy = 0
+        self.jobs = 0
+        self.area_paths = 0
+        self.path_runs = 0
+        self.failed = 0
+
+    def schedule(self, dx_coords, freq_mhz: float, modulation: str, dt: datetime):
+        """
+        No bloqueante: encola el precalentamiento del spot si no se ha hecho ya.
+        modulation ya normalizada (ANALOG | DIGITAL): es la que usan tanto la
+        clave de cache como el perfil de ITURHFProp.
+        """
+        if not ENABLED or not dx_coords:
+            return
+        dx = to_float_coords(dx_coords)
+        key = (round(dx[0], 1), round(dx[1], 1), _freq_bin_mhz(freq_mhz), modulation, _time_bin(dt))
+        if self._seen.get(key) is not None:
+            self.deduped += 1
+            return
+        try:
+            self._queue.put_nowait((dx, freq_mhz, modulation, dt))
+        except queue.Full:
+            # Sin marcar como visto: el siguiente spot del mismo DX lo vuelve a intentar
+            self.dropped += 1
+            return
+        self._seen.set(key, True)
+        self.scheduled += 1
+
+    @staticmethod
+    def _busy() -> bool:
+        # Baja prioridad: si hay peticiones esperando motor, no se añade carga
+        return engine_pool.stats()["queued"] > 0 or engine_gate.stats()["queued"] > 0
+
+    def _warm(self, dx, freq_mhz: float, mode: str, dt: datetime):
+        # mode llega normalizado desde schedule: misma clave de cache y mismo perfil de motor
+        missing = missing_paths(dx, self.users.locations(), dt, freq_mhz, mode)
+        if not missing:
+            return
+        deadline = request_deadline(DEADLINE_S)
+        if len(missing) >= _area_min_receivers():
+            filled = prefill_area(dx, [c for _, c in missing], dt, freq_mhz, mode, deadline=deadline,
+                                  priority=PRIORITY_LOW)
+            if filled:
+                self.area_paths += filled
+                return
+        # Pocos caminos sin cache (o área fallida): camino a camino con singleflight
+        for _, src in missing:
+            if self._busy() or time.monotonic() >= deadline:
+                self.skipped_busy += 1
+                return
+            try:
+                _, cached = get_prediction_with_cache(src, dx, dt, freq_mhz, mode,
+                                                      deadline=deadline, priority=PRIORITY_LOW)
+                self.path_runs += int(not cached)
+            except HTTPException:
+                self.skipped_busy += 1
+                return
+
+    def run_forever(self):
+        last_refresh = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_refresh >= REFRESH_S:
+                    last_refresh = time.monotonic()
+                    self.users.refresh()
+                try:
+                    job = self._queue.get(timeout=REFRESH_S)
+                except queue.Empty:
+                    continue
+                if self._busy():
+                    self.skipped_busy += 1
+                    continue
+                self.jobs += 1
+                self._warm(*job)
+            except Exception:
+                self.failed += 1
+                logger.exception("warmer: error precalentando")
+                time.sleep(1)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": ENABLED,
+            "active_users": self.users.users,
+            "locations": len(self.users.locations()),
+            "backlog": self._queue.qsize(),
+            "scheduled": self.scheduled,
+            "deduped": self.deduped,
+            "dropped": self.dropped,
+            "skipped_busy": self.skipped_busy,
+            "jobs": self.jobs,
+            "area_paths": self.area_paths,
+            "path_runs": self.path_runs,
+            "failed": self.failed,
+        }
+
+
+active_users = ActiveUsers()
+warmer = CacheWarmer(active_users)
+
+
+def start_cache_warmer():
+    """Arranca el hilo que precalienta la cache y mantiene los usuarios activos."""
+    if not ENABLED:
+        return
+    threading.Thread(target=warmer.run_forever, name="cache-warmer", daemon=True).start()
+    logger.info("🧵 Hilo de precalentamiento de cache arrancado.")
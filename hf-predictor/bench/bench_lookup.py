@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# bench/bench_lookup.py
+"""
+Micro-benchmark de lookup_coords: escaneo lineal (antiguo) vs PrefixIndex.
+
+Uso:
+    python bench/bench_lookup.py [--n 20000] [--prefixes app/callsign_prefixes.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, "..", "app")
+sys.path.insert(0, APP_DIR)
+
+from prefix_index import PrefixIndex  # noqa: E402
+
+
+def linear_lookup(prefix_map, callsign):
+    """Implementación original de hf_utils.lookup_coords (referencia)."""
+    cs = callsign.upper()
+    matched = [
+        (prefix, coords)
+        for prefix, coords in prefix_map.items()
+        if cs.startswith(prefix.upper())
+    ]
+    if not matched:
+        return None
+    return max(matched, key=lambda x: len(x[0]))[1]
+
+
+def sample_callsigns(prefix_map, n, seed=1):
+    """Indicativos sintéticos: prefijo real + sufijo, con repetición (tráfico real)."""
+    rnd = random.Random(seed)
+    prefixes = list(prefix_map)
+    pool = [
+        rnd.choice(prefixes).split("-")[0] + str(rnd.randint(0, 9)) + "".join(
+            rnd.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(rnd.randint(1, 3))
+        )
+        for _ in range(max(1, n // 20))
+    ]
+    return [rnd.choice(pool) for _ in range(n)]
+
+
+def bench(fn, calls):
+    t0 = time.perf_counter()
+    for cs in calls:
+        fn(cs)
+    dt = time.perf_counter() - t0
+    return len(calls) / dt if dt > 0 else float("inf")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--n", type=int, default=20000, help="número de lookups (index)")
+    ap.add_argument("--n-linear", type=int, default=500, help="número de lookups (lineal)")
+    ap.add_argument("--prefixes", default=os.path.join(APP_DIR, "callsign_prefixes.json"))
+    args = ap.parse_args()
+
+    with open(args.prefixes, "r") as f:
+        prefix_map = json.load(f)
+
+    calls = sample_callsigns(prefix_map, args.n)
+
+    # Comprobación de equivalencia antes de medir
+    idx = PrefixIndex(prefix_map, front_cache_size=0)
+    for cs in calls[: args.n_linear]:
+        old = linear_lookup(prefix_map, cs)
+        new = idx.lookup(cs)
+        assert (old is None and new is None) or tuple(old) == new, (cs, old, new)
+
+    linear = bench(lambda cs: linear_lookup(prefix_map, cs), calls[: args.n_linear])
+    indexed = bench(PrefixIndex(prefix_map, front_cache_size=0).lookup, calls)
+    cached_idx = PrefixIndex(prefix_map)
+    cached = bench(cached_idx.lookup, calls)
+
+    print(f"prefixes: {len(prefix_map)}")
+    print(f"linear scan      : {linear:12,.0f} lookups/s")
+    print(f"index (no cache) : {indexed:12,.0f} lookups/s  (x{indexed / linear:,.0f})")
+    print(f"index + LRU      : {cached:12,.0f} lookups/s  (x{cached / linear:,.0f})  {cached_idx.stats()}")
+
+
+if __name__ == "__main__":
+    main()
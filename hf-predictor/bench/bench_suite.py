@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# bench/bench_suite.py
+"""
+Micro-benchmarks del camino caliente de predicción, offline.
+
+ITURHFProp se sustituye por bench/fake_iturhfprop.py (informes CSV enlatados)
+o, con --engine canned, por un motor en proceso que parsea un informe fijo.
+Redis es fakeredis (o uno local con --redis real). Mide ops/s y latencia
+p50/p99 por etapa y para /predict completo a través de la app ASGI, y guarda
+el resultado en JSON para comparar ejecuciones.
+
+Uso:
+    pip install fakeredis httpx
+    python bench/bench_suite.py [--n 20000] [--out results.json] [--compare base.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(HERE, "..", "app"))
+FAKE_BINARY = os.path.join(HERE, "fake_iturhfprop.py")
+
+CALLSIGNS = ["EA3CV", "EA5WU", "DL1AB", "G3XYZ", "F5AA", "I2ABC", "W1AW", "K1TTT", "JA1ABC", "VK2AB",
+             "PY1AA", "ZS6AB", "LU1AA", "UA3ABC", "VE3XX", "OH2BH", "SM5AAA", "OK1AB", "SP9XX", "YB0AR"]
+RBN_LINES = [
+    "DX de EA5WU-#:     7012.0  EA3CV        CW    18 dB  22 WPM  CQ      1200Z",
+    "DX de DK9IP-2-#:  14080.0  JA1ABC/P     RTTY  12 dB  45 BPS  CQ      1200Z",
+    "DX de K1TTT-#:    14074.0  W1AW         FT8   -5 dB                    1200Z",
+    "DX de garbage line",
+]
+
+
+def _setup(redis_mode: str):
+    """Entorno offline: config y prefijos del repo, Redis falso, SSN fijo, sin logs por línea."""
+    os.environ.setdefault("CONFIG_FILE", os.path.join(APP_DIR, "config.yaml"))
+    os.environ.setdefault("PREFIXES_FILE", os.path.join(APP_DIR, "callsign_prefixes.json"))
+    sys.path.insert(0, APP_DIR)
+
+    if redis_mode == "fake":
+        import fakeredis
+        import fakeredis.aioredis
+        import redis
+        import redis.asyncio
+
+        server = fakeredis.FakeServer()
+        redis.Redis = lambda *a, **k: fakeredis.FakeRedis(server=server, decode_responses=True)
+        redis.asyncio.Redis = lambda *a, **k: fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    else:
+        os.environ.setdefault("REDIS_HOST", "localhost")
+
+    from config import CONFIG
+    CONFIG.setdefault("human_spot", {})["log_predictions"] = False
+    CONFIG.setdefault("prop_tables", {})["enabled"] = False
+    CONFIG.setdefault("logging", {})["level"] = "WARNING"   # setup_logging() al importar main
+    if redis_mode != "fake":
+        CONFIG["redis"]["host"] = os.environ["REDIS_HOST"]
+
+    import hf_utils
+    hf_utils.spacewx.publish({"ssn": 100}, "bench")   # SSN fijo, sin Redis ni NOAA
+    logging.getLogger().setLevel(logging.WARNING)
+    return hf_utils
+
+
+class CannedEngine:
+    """Motor en proceso: parsea un informe fijo (mide solo el coste Python)."""
+    name = "canned"
+
+    def __init__(self, report_path: str):
+        from iturhf_engine import read_report, report_values
+        self._read, self._values = read_report, report_values
+        self.report_path = report_path
+
+    def predict(self, path_type, tx, rx, dt, ssn, freq_mhz, profile):
+        idx, rows = self._read(self.report_path)
+        return self._values(idx, rows[-1])
+
+    async def predict_async(self, *args):
+        return self.predict(*args)
+
+    def predict_area(self, path_type, tx, area, dt, ssn, freq_mhz, profile):
+        from iturhf_engine import grid_axes
+        values = self.predict(path_type, tx, None, dt, ssn, freq_mhz, profile)
+        lats, lngs = grid_axes(area)
+        return [(lat, lng, values) for lat in lats for lng in lngs]
+
+    def predict_vector(self, path_type, tx, rx, dt, ssn, freqs, hours, profile):
+        values = self.predict(path_type, tx, rx, dt, ssn, None, profile)
+        return [(h, f, values) for h in hours for f in freqs]
+
+
+# ------------------ medición ------------------
+
+def _summary(name: str, lat_ns: list, wall_s: float) -> dict:
+    lat_ns = sorted(lat_ns)
+    n = len(lat_ns)
+    pct = lambda p: lat_ns[min(n - 1, int(p * n))] / 1000.0
+    return {
+        "stage": name,
+        "n": n,
+        "ops_s": round(n / wall_s, 1) if wall_s > 0 else None,
+        "p50_us": round(pct(0.50), 2),
+        "p99_us": round(pct(0.99), 2),
+        "mean_us": round(statistics.fmean(lat_ns) / 1000.0, 2),
+    }
+
+
+def bench_sync(name: str, fn, args_list: list) -> dict:
+    lat = []
+    clock = time.perf_counter_ns
+    t0 = time.perf_counter()
+    for args in args_list:
+        s = clock()
+        fn(*args)
+        lat.append(clock() - s)
+    return _summary(name, lat, time.perf_counter() - t0)
+
+
+async def bench_async(name: str, fn, args_list: list) -> dict:
+    lat = []
+    clock = time.perf_counter_ns
+    t0 = time.perf_counter()
+    for args in args_list:
+        s = clock()
+        await fn(*args)
+        lat.append(clock() - s)
+    return _summary(name, lat, time.perf_counter() - t0)
+
+
+# ------------------ etapas ------------------
+
+def run_stages(args, hf_utils) -> list:
+    import main
+    import prediction
+    from iturhf_engine import SubprocessEngine, build_input_deck, radio_profile, read_report, report_values
+    from telnet_rbn import parse_rbn_line
+
+    rnd = random.Random(1)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    profile = radio_profile("SSB")
+    results = []
+
+    calls = [(rnd.choice(CALLSIGNS) + rnd.choice(["", "/P", "/QRP"]),) for _ in range(args.n)]
+    results.append(bench_sync("lookup_coords", hf_utils.lookup_coords, calls))
+
+    coords = [hf_utils.lookup_coords(c) for c in CALLSIGNS]
+    key_args = [(*rnd.choice(coords), *rnd.choice(coords), rnd.uniform(1.8, 29.7), rnd.choice(["SSB", "FT8"]), now)
+                for _ in range(args.n)]
+    results.append(bench_sync("cache_key", prediction.cache_key, key_args))
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        deck_args = [("SHORTPATH", rnd.choice(coords), rnd.choice(coords), now, 100, 14.0, profile,
+                      "/opt/iturhf/data/", tmp + "/") for _ in range(args.n)]
+        results.append(bench_sync("build_input_deck", build_input_deck, deck_args))
+
+        deck = os.path.join(tmp, "path.in")
+        report = os.path.join(tmp, "path.out")
+        with open(deck, "w") as f:
+            f.write(build_input_deck(*deck_args[0]))
+        subprocess.run([sys.executable, FAKE_BINARY, "-s", "-c", "-t", deck, report], check=True)
+
+        def parse(path):
+            idx, rows = read_report(path)
+            return report_values(idx, rows[-1])
+        results.append(bench_sync("read_report+values", parse, [(report,)] * args.n))
+
+        rels = [(rnd.randint(0, 99), rnd.randint(0, 99), rnd.choice(["", "tnx QSO", "up 2"])) for _ in range(args.n)]
+        results.append(bench_sync("format_dxspider_compact", main.format_dxspider_compact, rels))
+
+        lines = [(rnd.choice(RBN_LINES),) for _ in range(args.n)]
+        results.append(bench_sync("parse_rbn_line", parse_rbn_line, lines))
+
+        # Motor: subprocess real contra el binario falso (coste de fork/exec + E/S)
+        sub = SubprocessEngine(binary=FAKE_BINARY, slots=hf_utils.engine_slots)
+        eng_args = [("SHORTPATH", rnd.choice(coords), rnd.choice(coords), now, 100, 14.0, profile)
+                    for _ in range(args.n_engine)]
+        results.append(bench_sync("engine.predict[subprocess]", sub.predict, eng_args))
+
+        hf_utils.engine = CannedEngine(report) if args.engine == "canned" else sub
+        results += asyncio.run(run_http(args, main, now))
+    return results
+
+
+async def run_http(args, main, now) -> list:
+    import httpx
+
+    transport = httpx.ASGITransport(app=main.app)
+    rnd = random.Random(2)
+    ts = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def body(user, dx, freq):
+        return {"callsign_user": user, "callsign_spotter": "EA1A", "callsign_dx": dx, "frequency": freq,
+                "mode": "SSB", "timestamp": ts, "comment": "bench"}
+
+    # Frío: pares/bandas distintos → miss de cache y ejecución del motor
+    cold = []
+    for i in range(args.n_http):
+        user, dx = rnd.sample(CALLSIGNS, 2)
+        cold.append(body(user, dx, 1800.0 + 1000.0 * (i % 28)))
+    warm = cold[: max(1, args.n_http // 10)] * 10
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def post(b):
+            resp = await client.post("/predict", json=b)
+            if resp.status_code != 200:
+                post.errors += 1
+        out = []
+        for name, bodies in ((f"/predict cold[{args.engine}]", cold), ("/predict warm (cache)", warm)):
+            post.errors = 0
+            out.append(await bench_async(name, post, [(b,) for b in bodies]))
+            out[-1]["errors"] = post.errors   # 503 por deadline/pool incluidos
+    return out
+
+
+# ------------------ salida ------------------
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True).stdout.strip()
+    except Exception:
+        return ""
+
+
+def print_table(results: list, base: dict = None):
+    base = {r["stage"]: r for r in (base or {}).get("results", [])}
+    print(f"{'stage':32} {'n':>7} {'ops/s':>12} {'p50 µs':>10} {'p99 µs':>10}  {'vs base':>8}")
+    for r in results:
+        ref = base.get(r["stage"])
+        delta = f"x{r['ops_s'] / ref['ops_s']:.2f}" if ref and ref.get("ops_s") else ""
+        print(f"{r['stage']:32} {r['n']:>7} {r['ops_s']:>12,.1f} {r['p50_us']:>10,.1f} {r['p99_us']:>10,.1f}  {delta:>8}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--n", type=int, default=20000, help="iteraciones por micro-etapa")
+    ap.add_argument("--n-engine", type=int, default=200, help="ejecuciones del binario falso")
+    ap.add_argument("--n-http", type=int, default=200, help="peticiones /predict (frías)")
+    ap.add_argument("--engine", choices=["subprocess", "canned"], default="subprocess",
+                    help="motor detrás de /predict")
+    ap.add_argument("--redis", choices=["fake", "real"], default="fake",
+                    help="fakeredis o Redis local (REDIS_HOST, por defecto localhost)")
+    ap.add_argument("--out", help="guarda los resultados en JSON")
+    ap.add_argument("--compare", help="JSON de una ejecución anterior para comparar")
+    args = ap.parse_args()
+
+    hf_utils = _setup(args.redis)
+    results = run_stages(args, hf_utils)
+
+    base = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            base = json.load(f)
+    print_table(results, base)
+
+    if args.out:
+        doc = {
+            "created_utc": datetime.now(timezone.utc).isoformat(),
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+            "results": results,
+        }
+        with open(args.out, "w") as f:
+            json.dump(doc, f, indent=2)
+        print(f"→ {args.out}")
+
+
+if __name__ == "__main__":
+    main()
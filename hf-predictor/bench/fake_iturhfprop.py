@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# bench/fake_iturhfprop.py
+"""
+Sustituto de ITURHFProp para benchmarks offline.
+
+Misma línea de comandos que el binario real (ITURHFProp -s -c -t <in> <out>):
+lee el deck, y escribe un informe CSV enlatado con una fila por hora ×
+frecuencia × celda RX (una sola en punto a punto, la rejilla completa en modo
+área, horas × frecuencias en modo vector).
+"""
+import re
+import sys
+
+
+def _num(deck: str, key: str) -> float:
+    return float(re.search(r"^%s (\S+)" % re.escape(key), deck, re.M).group(1))
+
+
+def _list(deck: str, key: str) -> list:
+    return [float(v) for v in re.search(r"^%s (.+)$" % re.escape(key), deck, re.M).group(1).split(",")]
+
+
+def main():
+    in_path, out_path = sys.argv[-2], sys.argv[-1]
+    with open(in_path, "r") as f:
+        deck = f.read()
+
+    lat0, lat1 = _num(deck, "LL.lat"), _num(deck, "UL.lat")
+    lng0, lng1 = _num(deck, "LL.lng"), _num(deck, "LR.lng")
+    dlat, dlng = _num(deck, "latinc"), _num(deck, "lnginc")
+    nlat = int(round((lat1 - lat0) / dlat)) + 1
+    nlng = int(round((lng1 - lng0) / dlng)) + 1
+
+    month = int(_num(deck, "Path.month"))
+    hours = [int(h) for h in _list(deck, "Path.hour")]
+    freqs = _list(deck, "Path.frequency")
+
+    with open(out_path, "w") as f:
+        f.write("Month,Hour,Freq,SNRXXp,BCR,OCR,SIRXXp\n")
+        for h in hours:
+            for fq in freqs:
+                # Varía con la hora y la banda para poder comprobar el orden de filas
+                dh = h % 6 - int(abs(fq - 14.0)) // 4
+                for i in range(nlat):
+                    for j in range(nlng):
+                        f.write(f"{month},{h},{fq},{18 + i % 10 + dh},{55 + j % 40},48.0,17.0\n")
+
+
+if __name__ == "__main__":
+    main()
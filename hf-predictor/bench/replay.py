@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# bench/replay.py
+"""
+Reproduce tráfico real (spots DXSpider / hf_predictions.log y líneas RBN) contra
+/predict y el stream RBN a 1×, 10× o 100×, con N usuarios conectados simulados.
+
+Entradas (se pueden mezclar, se detecta el formato por línea):
+  --spots   hf_predictions.log   "EA3XX> DX de EA1A:  14.025  JA1ABC  [SP:..] [LP:..] tnx  2026-10-18T12:00:00Z"
+            o líneas de DXSpider "DX de EA1A:     14025.0  JA1ABC       tnx            1200Z"
+  --rbn     captura telnet RBN   "DX de EA5WU-#:  7012.0  EA3CV  CW  18 dB  22 WPM  CQ  1200Z"
+            (opcionalmente con un epoch delante: "1697000000.25 DX de ...")
+
+Cada spot humano se reparte a --users usuarios (los del log y, si faltan,
+sintéticos), como hace DXSpider: una petición /predict por usuario
+(--fanout user) o una /predict/batch por spot (--fanout batch). Las líneas
+RBN se parsean y se escriben al stream igual que telnet_rbn.
+
+Contra un servidor real:   python bench/replay.py --url http://localhost:8000 --redis-url redis://localhost:6379 ...
+Todo en proceso (offline): python bench/replay.py --inprocess [--engine canned] ...
+
+Informe: throughput, latencias p50/p95/p99/max, ratio de aciertos de cache y
+fracción de peticiones que habrían superado el timeout de 0.5 s de DXSpider.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import bench_suite  # noqa: E402
+
+DXSPIDER_TIMEOUT_S = 0.5
+
+_SPOT_RE = re.compile(
+    r"^(?:(?P<user>[\w/\-]+)> )?DX de (?P<spotter>[\w/\-#]+?)-?#?:\s+(?P<freq>\d+(?:\.\d+)?)\s+(?P<dx>[\w/]+)"
+    r"\s*(?P<comment>.*?)\s+(?P<ts>\d{4}-\d{2}-\d{2}T[\d:]+(?:\.\d+)?(?:Z|[+-]\d{2}:\d{2})?|\d{4}Z)\s*$"
+)
+_PRED_RE = re.compile(r"^\[SP:[^\]]*\] \[LP:[^\]]*\]\s*")
+_EPOCH_RE = re.compile(r"^(\d{9,}(?:\.\d+)?)\s+(.*)$")
+
+
+# ------------------ carga de capturas ------------------
+
+def _minute_of(hhmm: str, base: datetime) -> datetime:
+    return base.replace(hour=int(hhmm[:2]), minute=int(hhmm[2:4]), second=0, microsecond=0)
+
+
+def _spread(events: list):
+    """Reparte uniformemente dentro de su minuto los eventos con resolución de minuto."""
+    by_minute = {}
+    for ev in events:
+        if ev.get("minute_res"):
+            by_minute.setdefault(ev["t"], []).append(ev)
+    for t, evs in by_minute.items():
+        for i, ev in enumerate(evs):
+            ev["t"] = t + 60.0 * i / len(evs)
+
+
+def _unwrap_midnight(events: list):
+    """Las marcas HHMMZ no llevan fecha: si el tiempo retrocede >12 h, suma un día."""
+    offset, last = 0.0, None
+    for ev in events:
+        if not ev.get("minute_res"):
+            continue
+        t = ev["t"] + offset
+        if last is not None and t < last - 12 * 3600:
+            offset += 86400.0
+            t += 86400.0
+        ev["t"] = last = t
+
+
+def load_spots(path: str, base: datetime):
+    """Devuelve (eventos, usuarios vistos). Las líneas por usuario del log se agrupan en un spot."""
+    events, users, seen = [], set(), {}
+    with open(path, "r", errors="ignore") as f:
+        for line in f:
+            m = _SPOT_RE.match(line.strip())
+            if not m:
+                continue
+            freq = float(m["freq"])
+            ts = m["ts"]
+            if ts.endswith("Z") and len(ts) == 5:
+                t, minute_res = _minute_of(ts, base).timestamp(), True
+            else:
+                t, minute_res = datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp(), False
+            if m["user"]:
+                users.add(m["user"])
+            key = (m["spotter"], m["dx"], freq, ts)
+            if key in seen:
+                continue
+            seen[key] = ev = {
+                "kind": "spot", "t": t, "minute_res": minute_res,
+                "spotter": m["spotter"].rstrip("-#"), "dx": m["dx"],
+                "frequency": freq if freq > 1000 else freq * 1000.0,   # kHz como DXSpider
+                "comment": _PRED_RE.sub("", m["comment"]).strip(),
+            }
+            events.append(ev)
+    _unwrap_midnight(events)
+    return events, users
+
+
+def load_rbn(path: str, base: datetime) -> list:
+    from telnet_rbn import parse_rbn_line
+
+    events = []
+    with open(path, "r", errors="ignore") as f:
+        for line in f:
+            line = line.strip()
+            epoch = None
+            m = _EPOCH_RE.match(line)
+            if m:
+                epoch, line = float(m.group(1)), m.group(2)
+            spot = parse_rbn_line(line)
+            if not spot or spot["frequency"] > 30.0:
+                continue
+            if epoch is not None:
+                t, minute_res = epoch, False
+            else:
+                hhmm = re.search(r"(\d{4})Z\s*$", line)
+                if not hhmm:
+                    continue
+                t, minute_res = _minute_of(hhmm.group(1), base).timestamp(), True
+            events.append({"kind": "rbn", "t": t, "minute_res": minute_res, "spot": spot})
+    _unwrap_midnight(events)
+    return events
+
+
+# ------------------ destino ------------------
+
+def make_inprocess(args):
+    """App ASGI + fakeredis + consumidores RBN en hilos, con motor falso."""
+    hf_utils = bench_suite._setup("fake")
+    import httpx
+    import main
+    import predict_from_spots
+    from iturhf_engine import SubprocessEngine
+
+    if args.engine == "canned":
+        import tempfile
+        import subprocess
+        from iturhf_engine import build_input_deck, radio_profile
+        tmp = tempfile.mkdtemp(prefix="replay-")
+        deck, report = os.path.join(tmp, "path.in"), os.path.join(tmp, "path.out")
+        with open(deck, "w") as f:
+            f.write(build_input_deck("SHORTPATH", (40.0, 0.0), (35.0, 139.0), datetime.utcnow(), 100, 14.0,
+                                     radio_profile("SSB"), "/opt/iturhf/data/", tmp + "/"))
+        subprocess.run([sys.executable, bench_suite.FAKE_BINARY, "-s", "-c", "-t", deck, report], check=True)
+        hf_utils.engine = bench_suite.CannedEngine(report)
+    else:
+        hf_utils.engine = SubprocessEngine(binary=bench_suite.FAKE_BINARY)
+
+    predict_from_spots.start_spot_predictor()
+    if args.warmer:
+        import warmer
+        warmer.start_cache_warmer()
+    transport = httpx.ASGITransport(app=main.app)
+    return transport, "http://replay", predict_from_spots.r
+
+
+def make_remote(args):
+    import redis
+    r = redis.Redis.from_url(args.redis_url, decode_responses=True) if args.redis_url else None
+    return None, args.url.rstrip("/"), r
+
+
+# ------------------ reproducción ------------------
+
+class Stats:
+    def __init__(self):
+        self.lat = []
+        self.status = {}
+        self.requests = 0
+        self.cached = 0
+        self.paths = 0
+        self.late_starts = 0
+        self.rbn_sent = 0
+
+    def record(self, dt: float, status: int, cached: int = 0, paths: int = 1):
+        self.requests += 1
+        self.lat.append(dt)
+        self.status[status] = self.status.get(status, 0) + 1
+        self.cached += cached
+        self.paths += paths
+
+    def report(self, elapsed: float) -> dict:
+        lat = sorted(self.lat)
+        n = len(lat)
+        pct = lambda p: round(lat[min(n - 1, int(p * n))] * 1000.0, 1) if n else None
+        missed = sum(1 for x in lat if x > DXSPIDER_TIMEOUT_S) + sum(
+            c for s, c in self.status.items() if s != 200)
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "requests": self.requests,
+            "throughput_rps": round(self.requests / elapsed, 1) if elapsed > 0 else None,
+            "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99),
+            "max_ms": round(lat[-1] * 1000.0, 1) if n else None,
+            "status": {str(k): v for k, v in sorted(self.status.items())},
+            "cache_hit_ratio": round(self.cached / self.paths, 3) if self.paths else None,
+            "missed_dxspider_timeout": round(min(missed, n) / n, 4) if n else None,
+            "late_starts": self.late_starts,
+            "rbn_entries": self.rbn_sent,
+        }
+
+
+async def replay(args, events: list, user_pool: list):
+    import httpx
+
+    transport, base_url, rds = make_inprocess(args) if args.inprocess else make_remote(args)
+    stats = Stats()
+    rnd = random.Random(args.seed)
+    tasks = set()
+    rbn_pending = []
+
+    if rds is not None:
+        from predict_from_spots import STREAM_KEY
+        from telnet_rbn import STREAM_MAXLEN, _stream_entry
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits,
+                                 timeout=args.http_timeout) as client:
+        if args.warmer:
+            # Como DXSpider: registra los conectados para el precalentamiento
+            resp = await client.post("/users/active", json={"users": user_pool, "replace": True})
+            resp.raise_for_status()
+            await asyncio.sleep(1.0)   # primer refresh del warmer
+
+        async def post(path: str, body: dict, paths: int):
+            t0 = time.perf_counter()
+            try:
+                resp = await client.post(path, json=body)
+                status = resp.status_code
+                data = resp.json() if status == 200 else {}
+            except httpx.TimeoutException:
+                status, data = 599, {}
+            dt = time.perf_counter() - t0
+            if path == "/predict/batch":
+                stats.record(dt, status, data.get("cached_paths", 0), max(1, data.get("paths", paths)))
+            else:
+                stats.record(dt, status, int(bool(data.get("cached"))))
+
+        def fire(ev):
+            ts = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+            users = rnd.sample(user_pool, min(args.users, len(user_pool)))
+            base = {"callsign_spotter": ev["spotter"], "callsign_dx": ev["dx"], "frequency": ev["frequency"],
+                    "mode": args.mode, "timestamp": ts, "comment": ev["comment"]}
+            if args.fanout == "batch":
+                coros = [post("/predict/batch", {**base, "users": users}, len(users))]
+            else:
+                coros = [post("/predict", {**base, "callsign_user": u}, 1) for u in users]
+            for c in coros:
+                task = asyncio.ensure_future(c)
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+        def flush_rbn():
+            if not rbn_pending or rds is None:
+                rbn_pending.clear()
+                return
+            pipe = rds.pipeline(transaction=False)
+            for spot in rbn_pending:
+                pipe.xadd(STREAM_KEY, _stream_entry(spot), maxlen=STREAM_MAXLEN, approximate=True)
+            pipe.execute()
+            stats.rbn_sent += len(rbn_pending)
+            rbn_pending.clear()
+
+        t_first = events[0]["t"]
+        start = time.perf_counter()
+        last_flush = start
+        for ev in events:
+            due = start + (ev["t"] - t_first) / args.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -0.1:
+                stats.late_starts += 1     # el generador no da abasto a esta velocidad
+            if ev["kind"] == "spot":
+                fire(ev)
+            else:
+                rbn_pending.append(ev["spot"])
+            if time.perf_counter() - last_flush >= 0.2:
+                flush_rbn()
+                last_flush = time.perf_counter()
+        flush_rbn()
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    out = stats.report(elapsed)
+    if rds is not None:
+        try:
+            groups = rds.xinfo_groups(STREAM_KEY)
+            out["rbn_stream"] = [{k: g.get(k) for k in ("name", "pending", "lag", "consumers")} for g in groups]
+        except Exception as e:
+            out["rbn_stream"] = f"n/a ({e})"
+    if args.inprocess:
+        import predict_from_spots
+        out["rbn_predictor"] = predict_from_spots.predictor_stats()
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay de spots DXSpider/RBN contra /predict y el stream RBN")
+    ap.add_argument("--spots", help="hf_predictions.log o líneas DX de DXSpider")
+    ap.add_argument("--rbn", help="captura de líneas telnet RBN")
+    ap.add_argument("--speed", type=float, default=1.0, help="1, 10, 100… (× tiempo real)")
+    ap.add_argument("--users", type=int, default=50, help="usuarios conectados simulados por spot")
+    ap.add_argument("--fanout", choices=["user", "batch"], default="user")
+    ap.add_argument("--mode", default="SSB", help="modo enviado a /predict")
+    ap.add_argument("--limit", type=int, help="máximo de eventos a reproducir")
+    ap.add_argument("--date", help="fecha (YYYY-MM-DD) de las marcas HHMMZ; por defecto, ayer")
+    ap.add_argument("--url", default="http://localhost:8000")
+    ap.add_argument("--redis-url", help="Redis del despliegue (para inyectar RBN en el stream)")
+    ap.add_argument("--inprocess", action="store_true", help="app, Redis y motor falsos en este proceso")
+    ap.add_argument("--engine", choices=["subprocess", "canned"], default="subprocess", help="solo --inprocess")
+    ap.add_argument("--concurrency", type=int, default=200, help="conexiones HTTP simultáneas")
+    ap.add_argument("--http-timeout", type=float, default=10.0)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--no-warmer", dest="warmer", action="store_false",
+                    help="no registra usuarios activos (sin precalentamiento de cache)")
+    ap.add_argument("--out", help="guarda el informe en JSON")
+    args = ap.parse_args()
+
+    if not args.spots and not args.rbn:
+        ap.error("indica --spots y/o --rbn")
+    # La app se importa desde app/ con su config.yaml (parseo RBN, clave del stream)
+    os.environ.setdefault("CONFIG_FILE", os.path.join(bench_suite.APP_DIR, "config.yaml"))
+    sys.path.insert(0, bench_suite.APP_DIR)
+
+    if args.date:
+        base = datetime.strptime(args.date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    else:
+        base = datetime.now(timezone.utc) - timedelta(days=1)
+    events, users = [], set()
+    if args.spots:
+        spot_events, users = load_spots(args.spots, base)
+        events += spot_events
+    if args.rbn:
+        events += load_rbn(args.rbn, base)
+    _spread(events)
+    events.sort(key=lambda ev: ev["t"])
+    if args.limit:
+        events = events[: args.limit]
+    if not events:
+        sys.exit("sin eventos reconocibles en las capturas")
+
+    pool = sorted(users)
+    rnd = random.Random(args.seed)
+    while len(pool) < args.users:
+        pool.append(rnd.choice(bench_suite.CALLSIGNS) + str(len(pool)))
+
+    span = events[-1]["t"] - events[0]["t"]
+    n_spots = sum(1 for ev in events if ev["kind"] == "spot")
+    print(f"eventos: {len(events)} ({n_spots} spots, {len(events) - n_spots} RBN) en {span / 60:.1f} min "
+          f"→ {span / args.speed:.1f} s a {args.speed:g}×, {args.users} usuarios/spot ({args.fanout})")
+
+    result = asyncio.run(replay(args, events, pool))
+    result["args"] = vars(args)
+    print(json.dumps({k: v for k, v in result.items() if k != "args"}, indent=2, default=str))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,6 @@
 use strict;
 use warnings;
 use Redis;
-use JSON::PP;
 use Getopt::Long;
 
 # -----------------------------
@@ -36,8 +35,6 @@ eval {
   die "No puedo conectar a Redis en $REDIS_HOST:$REDIS_PORT -> $err\n";
 };
 
-my $json = JSON::PP->new->utf8->canonical(1);
-
 # -----------------------------
 # Anchuras exactas (monospace)
 # -----------------------------
@@ -125,55 +122,35 @@ sub line_fixed {
 }
 
 # -----------------------------
-# Cargar registros (human + rbn)
+# Cargar registros (human + rbn) desde el almacén compacto
+#   HASH spots:rec  id => "timestamp|source|spotter|dx|frequency|mode|sp_rel|sp_snr|lp_rel|lp_snr"
+#   ZSET spots:exp  id => epoch de caducidad
 # -----------------------------
 my @records;
 
-for my $pattern ("spot:human:*", "spot:rbn:*") {
-    my @keys = $redis->keys($pattern);
-    for my $key (@keys) {
-        my $val = $redis->get($key);
-        next unless defined $val && length $val;
-
-        my $obj;
-        next unless eval { $obj = $json->decode($val); 1; };
-        next unless ref($obj) eq 'HASH';
-
-        my $ts   = $obj->{timestamp} // $obj->{ts} // "";
-        my $src  = $obj->{source}    // "";
-        my $spot = $obj->{spotter}   // "";
-        my $dx   = $obj->{dx}        // "";
-
-        my $freq_in = $obj->{frequency} // $obj->{freq};
-        my $freq = fmt_freq($freq_in);
-
-        my $mode = mode_label($obj->{mode});
-
-        my ($sp_rel,$sp_snr,$lp_rel,$lp_snr) = ("","","","");
-        if (ref($obj->{prediction}) eq 'HASH') {
-            if (ref($obj->{prediction}{short_path}) eq 'HASH') {
-                $sp_rel = num_or_blank($obj->{prediction}{short_path}{reliability});
-                $sp_snr = num_or_blank($obj->{prediction}{short_path}{snr});
-            }
-            if (ref($obj->{prediction}{long_path}) eq 'HASH') {
-                $lp_rel = num_or_blank($obj->{prediction}{long_path}{reliability});
-                $lp_snr = num_or_blank($obj->{prediction}{long_path}{snr});
-            }
-        }
-
-        push @records, {
-            timestamp => $ts,
-            source    => $src,
-            spotter   => $spot,
-            dx        => $dx,
-            freq      => $freq,
-            mode      => $mode,
-            sp_rel    => $sp_rel,
-            sp_snr    => $sp_snr,
-            lp_rel    => $lp_rel,
-            lp_snr    => $lp_snr,
-        };
-    }
+my %rec = $redis->hgetall("spots:rec");
+my $now = time();
+# Caducados pendientes de recorte: una sola consulta, no un ZSCORE por registro
+my %expired = map { $_ => 1 } $redis->zrangebyscore("spots:exp", "-inf", "($now");
+for my $id (keys %rec) {
+    my $val = $rec{$id};
+    next unless defined $val && length $val;
+    next if $expired{$id};
+
+    my ($ts, $src, $spot, $dx, $freq_in, $mode_in, $sp_rel, $sp_snr, $lp_rel, $lp_snr) = split /\|/, $val, -1;
+
+    push @records, {
+        timestamp => $ts // "",
+        source    => $src // "",
+        spotter   => $spot // "",
+        dx        => $dx // "",
+        freq      => fmt_freq($freq_in),
+        mode      => mode_label($mode_in),
+        sp_rel    => num_or_blank($sp_rel),
+        sp_snr    => num_or_blank($sp_snr),
+        lp_rel    => num_or_blank($lp_rel),
+        lp_snr    => num_or_blank($lp_snr),
+    };
 }
 
 # -----------------------------